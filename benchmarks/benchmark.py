@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import tempfile
+import time
+import platform
+import tracemalloc
+import numpy as np
+import numpy.typing as npt
+import click
+
+from datetime import datetime, timezone
+
+from src.Die import Die
+from src.MarkovDecisionProcess import MarkovDecisionProcess
+from src.BatchMarkovDecisionProcess import BatchMarkovDecisionProcess
+from src.SparseMarkovDecisionProcess import SparseMarkovDecisionProcess
+from src.BoardGraph import BoardGraph
+from src.Simulation import Simulation
+
+from utils.layouts import get_layout, get_layout_names
+from utils.dice import get_die
+from utils.common import DICE, StrategyType, TrapType
+from utils.instrumentation import INSTRUMENTATION, JsonLinesSink
+
+# the solutions of the standard dice computed by the solver before the dice were generalized (moves of any size, weighted faces)
+REFERENCE_SOLUTIONS = os.path.join(os.path.dirname(__file__), "reference_solutions.jsonl")
+
+# the metrics compared to the baseline and whether a higher value is better
+COMPARED_METRICS = {
+	"wall_time": False,
+	"peak_memory": False,
+	"games_per_second": True
+}
+
+def measure(function, repeat: int = 3, min_run_time: float = 0.05) -> dict:
+	"""run a function several times and measure it.
+	like timeit, a timed run calls the function enough times to last at least min_run_time, 
+	and the wall time is the best of the runs divided by the number of calls.
+	the peak memory is measured in an extra call (tracemalloc slows down the allocations, so it is never enabled while timing).
+
+	Args:
+		function (Callable): the function to measure, it returns a dict of extra metrics (e.g. the number of iterations)
+		repeat (int): number of timed runs
+		min_run_time (float): minimum duration of a timed run (seconds)
+
+	Returns:
+		dict: wall_time (seconds per call), peak_memory (bytes) and the extra metrics of the last call
+	"""
+	# warm up (first allocations, caches)
+	function()
+
+	number_of_calls = 1
+	while True:
+		start = time.perf_counter()
+		for _ in range(0, number_of_calls):
+			metrics = function()
+		run_time = time.perf_counter() - start
+		if run_time >= min_run_time:
+			break
+		number_of_calls *= 2
+
+	wall_times = [run_time / number_of_calls]
+	for _ in range(1, repeat):
+		start = time.perf_counter()
+		for _ in range(0, number_of_calls):
+			function()
+		wall_times.append((time.perf_counter() - start) / number_of_calls)
+
+	tracemalloc.start()
+	function()
+	_, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {"wall_time": min(wall_times), "peak_memory": peak_memory, **metrics}
+
+def get_layouts(random_layouts: int, seed: int) -> dict[str, npt.NDArray]:
+	"""the custom layouts and some random layouts (generated from the seed so that they are the same in every run)."""
+	rng = np.random.default_rng(seed)
+	layouts = {name: get_layout(name, rng=rng) for name in get_layout_names() if name != "RANDOM"}
+
+	for idx in range(0, random_layouts):
+		layouts[f"RANDOM_{idx}"] = get_layout("RANDOM", rng=rng)
+	return layouts
+
+def benchmark_layout(layout: npt.NDArray, circle: bool, simulations: list[int], repeat: int, seed: int) -> dict[str, dict]:
+	"""benchmark the compilation of the MDP, both solvers and the simulation of a layout.
+
+	Returns:
+		dict[str, dict]: the metrics of each benchmark
+	"""
+	results = {}
+
+	def compile_mdp():
+		mdp = MarkovDecisionProcess(layout=layout, dice=DICE, circle=circle)
+		mdp.compute_adjacent_matrices()
+		return mdp
+
+	results["compute_adjacent_matrices"] = measure(lambda: compile_mdp() and {}, repeat=repeat)
+
+	mdp = compile_mdp()
+
+	def value_iteration():
+		mdp.launch_iteration_value()
+		return {"iterations": mdp.convergence_report.iterations}
+
+	def policy_iteration():
+		mdp.launch_policy_iteration()
+		return {"iterations": mdp.iterations}
+
+	results["launch_iteration_value"] = measure(value_iteration, repeat=repeat)
+	results["launch_policy_iteration"] = measure(policy_iteration, repeat=repeat)
+
+	_, best_dice = mdp.launch_policy_iteration()
+	simulation = Simulation(layout=layout, dice=DICE, circle=circle)
+
+	for number_of_simulations in simulations:
+		def simulate():
+			simulation.simulate(
+				best_dice=best_dice,
+				strategy=StrategyType.OPTIMAL,
+				number_of_simulations=number_of_simulations,
+				rng=np.random.default_rng(seed)
+			)
+			return {}
+
+		metrics = measure(simulate, repeat=repeat)
+		metrics["games_per_second"] = number_of_simulations * (len(layout) - 1) / metrics["wall_time"]
+		results[f"simulate[{number_of_simulations}]"] = metrics
+
+	return results
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list[str]:
+	"""compare two benchmark reports.
+
+	Args:
+		baseline (dict): the reference report
+		current (dict): the new report
+		threshold (float): relative change above which a metric is flagged (e.g. 0.2 for 20%)
+
+	Returns:
+		list[str]: the description of each regression
+	"""
+	regressions = []
+
+	for (key, metrics) in current["results"].items():
+		if key not in baseline["results"]:
+			print(f"{key}: not in the baseline")
+			continue
+		reference = baseline["results"][key]
+
+		for (metric, higher_is_better) in COMPARED_METRICS.items():
+			if metric not in metrics or metric not in reference or reference[metric] == 0:
+				continue
+
+			change = metrics[metric] / reference[metric] - 1
+			is_regression = (-change if higher_is_better else change) > threshold
+			flag = "REGRESSION" if is_regression else ""
+			print(f"{key:<70} {metric:<18} {reference[metric]:>14.6g} -> {metrics[metric]:>14.6g} ({change:+.1%}) {flag}")
+
+			if is_regression:
+				regressions.append(f"{key} {metric} {change:+.1%}")
+
+		# the number of iterations only changes with the algorithm (or the layout)
+		if "iterations" in metrics and metrics["iterations"] != reference.get("iterations") and metrics["layout"] == reference["layout"]:
+			print(f"{key:<70} iterations {reference.get('iterations')} -> {metrics['iterations']}")
+			regressions.append(f"{key} iterations {reference.get('iterations')} -> {metrics['iterations']}")
+
+	return regressions
+
+def get_random_dice(rng: np.random.Generator, number_of_dice: int = 3, max_move: int = 6) -> list[Die]:
+	"""random dice with weighted faces of up to max_move cells and a trap triggering probability for each type of trap."""
+	dice = []
+	for idx in range(0, number_of_dice):
+		number_of_faces = int(rng.integers(2, 7))
+		dice.append(get_die(config={
+			"name": f"random_{idx}",
+			"moves": rng.integers(0, max_move + 1, size=number_of_faces).tolist(),
+			"weights": rng.uniform(0.1, 1.0, size=number_of_faces).tolist(),
+			"trap_triggering_probability": float(rng.uniform()),
+			"trap_triggering_probabilities": {trap_type.name: float(rng.uniform()) for trap_type in TrapType if trap_type != TrapType.NONE}
+		}))
+	return dice
+
+def check_solvers(layouts: npt.NDArray, circles: npt.NDArray, dice: list[Die], tolerance: float, reference: list[dict] | None = None) -> list[str]:
+	"""solve some layouts with the dense, the batch and the sparse models (policy iteration) and compare their costs,
+	and the costs of their dice (the optimal dice are not unique when several dice have the same cost).
+
+	Args:
+		layouts (npt.NDArray): the layouts, shape (B, 15)
+		circles (npt.NDArray): the circle flag of each layout
+		dice (list[Die]): the dice of the game
+		tolerance (float): maximum absolute difference between two costs
+		reference (list[dict] | None): the expected solution (Expec) of each layout
+
+	Returns:
+		list[str]: the description of each mismatch
+	"""
+	batch = BatchMarkovDecisionProcess(layouts=layouts, dice=dice, circles=circles)
+	batch.compute_adjacent_matrices()
+	(batch_costs, batch_dice) = batch.launch_policy_iteration()
+
+	mismatches = []
+	for (idx, (layout, circle)) in enumerate(zip(layouts, circles)):
+		dense = MarkovDecisionProcess(layout=layout, dice=dice, circle=bool(circle))
+		dense.compute_adjacent_matrices()
+		sparse = SparseMarkovDecisionProcess(board=BoardGraph.standard(layout=layout, circle=bool(circle)), dice=dice)
+		sparse.compute_adjacent_matrices()
+
+		solutions = {
+			"dense": dense.launch_policy_iteration(),
+			"batch": [batch_costs[idx], batch_dice[idx]],
+			"sparse": sparse.launch_policy_iteration()
+		}
+		expected_costs = solutions["dense"][0] if reference is None else np.asarray(reference[idx]["Expec"])
+
+		for (solver, (costs, best_dice)) in solutions.items():
+			# the exact cost of the dice of the solver on the dense model
+			dice_costs = dense.evaluate_deterministic_policy(policy=np.append(best_dice, 0))[:-1]
+			difference = max(np.max(np.abs(costs - expected_costs)), np.max(np.abs(dice_costs - expected_costs)))
+			if not difference <= tolerance:
+				mismatches.append(f"{solver} layout={layout.tolist()} circle={bool(circle)}: max difference {difference:.3g}")
+
+	return mismatches
+
+def count_trace_events(layout: npt.NDArray, workers: int, seed: int) -> dict[str, int]:
+	"""solve a layout and simulate it with a number of workers while the events are written to a JSON lines file.
+
+	Returns:
+		dict[str, int]: the number of events of each type emitted by the main process (the workers do not emit their shards)
+	"""
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "trace.jsonl")
+		INSTRUMENTATION.enable(JsonLinesSink(path))
+		try:
+			mdp = MarkovDecisionProcess(layout=layout, dice=DICE)
+			mdp.compute_adjacent_matrices()
+			_, best_dice = mdp.launch_iteration_value()
+			Simulation(layout=layout, dice=DICE).simulate(best_dice=best_dice, strategy=StrategyType.OPTIMAL, number_of_simulations=1000, workers=workers, seed=seed)
+		finally:
+			INSTRUMENTATION.disable()
+
+		counts = {}
+		with open(path) as file:
+			for line in file:
+				event = json.loads(line)["event"]
+				if event not in ["simulate_shard", "simulate_games"]:
+					counts[event] = counts.get(event, 0) + 1
+	return counts
+
+@click.group()
+def cli():
+	"""benchmarks of the solvers and the simulator."""
+	pass
+
+@cli.command()
+@click.option(
+	"--output", "-o",
+	type=click.Path(dir_okay=False),
+	default=None,
+	help="JSON file where the results are stored (printed if not given)."
+)
+@click.option(
+	"--simulations", "-s",
+	type=click.INT,
+	multiple=True,
+	default=[1000, 10000],
+	show_default=True,
+	help="Number of simulations of each simulation benchmark (can be repeated)."
+)
+@click.option(
+	"--random_layouts", "-r",
+	type=click.INT,
+	default=4,
+	show_default=True,
+	help="Number of random layouts benchmarked along with the custom layouts."
+)
+@click.option(
+	"--repeat",
+	type=click.INT,
+	default=5,
+	show_default=True,
+	help="Number of timed runs of each benchmark (the best one is kept)."
+)
+@click.option(
+	"--seed",
+	type=click.INT,
+	default=0,
+	show_default=True,
+	help="Seed of the random layouts and of the simulations."
+)
+def run(output, simulations, random_layouts, repeat, seed):
+	"""run the benchmarks."""
+	results = {}
+
+	for (name, layout) in get_layouts(random_layouts=random_layouts, seed=seed).items():
+		for circle in [False, True]:
+			for (benchmark, metrics) in benchmark_layout(layout=layout, circle=circle, simulations=list(simulations), repeat=repeat, seed=seed).items():
+				key = f"{benchmark}/{name}/circle={circle}"
+				results[key] = {"layout": layout.tolist(), **metrics}
+				print(f"{key:<70} {metrics['wall_time'] * 1000:>10.3f} ms {metrics['peak_memory'] / 1024:>10.1f} KiB")
+
+	report = {
+		"metadata": {
+			"date": datetime.now(timezone.utc).isoformat(),
+			"python": platform.python_version(),
+			"numpy": np.__version__,
+			"platform": platform.platform(),
+			"processor": platform.processor(),
+			"simulations": list(simulations),
+			"repeat": repeat,
+			"seed": seed
+		},
+		"results": results
+	}
+
+	if output is None:
+		print(json.dumps(report, indent=2))
+	else:
+		with open(output, "w") as file:
+			json.dump(report, file, indent=2)
+
+@cli.command()
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+	"--threshold", "-t",
+	type=click.FLOAT,
+	default=0.2,
+	show_default=True,
+	help="Relative change above which a metric is flagged as a regression."
+)
+def compare(baseline, current, threshold):
+	"""compare the results of two runs, exit with status 1 if a metric regressed."""
+	with open(baseline) as file:
+		baseline_report = json.load(file)
+	with open(current) as file:
+		current_report = json.load(file)
+
+	regressions = compare_results(baseline=baseline_report, current=current_report, threshold=threshold)
+
+	if len(regressions) > 0:
+		print(f"{len(regressions)} regression(s) above {threshold:.0%}:")
+		for regression in regressions:
+			print(f"  {regression}")
+		sys.exit(1)
+
+	print("no regression")
+
+@cli.command()
+@click.option(
+	"--reference",
+	type=click.Path(exists=True, dir_okay=False),
+	default=REFERENCE_SOLUTIONS,
+	show_default=True,
+	help="JSON lines file with the layouts and the expected solutions of the standard dice."
+)
+@click.option(
+	"--random_dice",
+	type=click.INT,
+	default=20,
+	show_default=True,
+	help="Number of sets of random dice (weighted faces of up to 6 cells) on which the solvers are compared with each other."
+)
+@click.option(
+	"--tolerance", "-t",
+	type=click.FLOAT,
+	default=1e-9,
+	show_default=True,
+	help="Maximum absolute difference between two costs."
+)
+@click.option(
+	"--seed",
+	type=click.INT,
+	default=0,
+	show_default=True,
+	help="Seed of the random dice."
+)
+def check(reference, random_dice, tolerance, seed):
+	"""check that the dense, batch and sparse models give the same solutions, and the reference solutions with the standard dice
+	(with and without a die that can not move), and that the trace is the same with 1 and 2 workers, exit with status 1 otherwise."""
+	with open(reference) as file:
+		records = [json.loads(line) for line in file if line.strip() != ""]
+	layouts = np.array([record["layout"] for record in records])
+	circles = np.array([record["circle"] for record in records])
+
+	mismatches = check_solvers(layouts=layouts, circles=circles, dice=DICE, tolerance=tolerance, reference=records)
+	print(f"standard dice: {len(records)} layouts, {len(mismatches)} mismatch(es)")
+
+	rng = np.random.default_rng(seed)
+	for _ in range(0, random_dice):
+		mismatches += check_solvers(layouts=layouts, circles=circles, dice=get_random_dice(rng=rng), tolerance=tolerance)
+	print(f"random dice: {random_dice} sets of dice on {len(records)} layouts, {len(mismatches)} mismatch(es) in total")
+
+	# the cheapest die never moves: policy iteration must not start from it, the solutions are the ones of the standard dice
+	wait_die = get_die(config={"type": "WAIT", "moves": [0]})
+	mismatches += check_solvers(layouts=layouts, circles=circles, dice=[wait_die, *DICE], tolerance=tolerance, reference=records)
+	print(f"die that can not move: {len(records)} layouts, {len(mismatches)} mismatch(es) in total")
+
+	# the worker processes must not write the events of the main process again
+	trace_counts = [count_trace_events(layout=layouts[1], workers=workers, seed=seed) for workers in [1, 2]]
+	if trace_counts[0] != trace_counts[1]:
+		mismatches.append(f"trace events with 1 worker {trace_counts[0]} and with 2 workers {trace_counts[1]}")
+	print(f"trace: {trace_counts[0]} events with 1 and 2 workers" if trace_counts[0] == trace_counts[1] else "trace: the events differ with 1 and 2 workers")
+
+	if len(mismatches) > 0:
+		for mismatch in mismatches:
+			print(f"  {mismatch}")
+		sys.exit(1)
+
+	print("the solvers agree")
+
+if __name__ == "__main__":
+	cli()
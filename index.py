@@ -1,54 +1,222 @@
+import sys
+import time
+import cProfile
 import numpy as np
 import numpy.typing as npt
 import click
 
 from click.decorators import option
 from click.types import Choice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+from src.Die import Die
 from src.MarkovDecisionProcess import MarkovDecisionProcess
+from src.BatchMarkovDecisionProcess import BatchMarkovDecisionProcess
+from src.SolutionCache import SolutionCache
+from src.SolutionStore import SolutionStore, write_solution_store
 from src.Simulation import Simulation
+from src.Environment import Environment
+from src.QLearningAgent import QLearningAgent
 
-from utils.plots import compare_costs_plot, compare_strategies_plot
-from utils.layouts import generate_layout, CUSTOM_LAYOUTS
-from utils.common import DICE, StrategyType
+from utils.layouts import get_layout, get_layout_names
+from utils.dice import load_dice
+from utils.common import DICE, StrategyType, SolverType
+from utils.instrumentation import INSTRUMENTATION, JsonLinesSink, detach_worker
+from utils.batch import INPUT_FORMATS, OUTPUT_FORMATS, get_format, read_layouts, write_results, get_csv_header
+from utils.constants import BATCH_CHUNK_SIZE, SERVICE_BATCH_DELAY, SERVICE_BATCH_SIZE
 
-def markovDecision(layout: npt.NDArray, circle: bool = False) -> list[npt.NDArray]:
+def markovDecision(layout: npt.NDArray, circle: bool = False, method: str = SolverType.VALUE_ITERATION.value, cache: SolutionCache | None = None, dice: list[Die] = DICE) -> list[npt.NDArray]:
 	"""launch the markov decision algorithm process to determine optimal strategy regarding 
-	the choice of the dice in the snake and ladder games using the "value iteration" method.
+	the choice of the dice in the snake and ladder games using the "value iteration" method 
+	(or the "policy iteration" method).
 	notation: state = a cell ([0..14]) ; action = a die ([SECURITY, NORMAL, RISKY])
 
 	Args:
 		layout (npt.NDArray): represents the layout of the game, each index represents a cell (i.e. a state) and each value represents a trap type
 		circle (bool): indicate if the player must land exactly on the final square (circle = true) or still win 
 			by overstepping the final square (circle = false)
+		method (str): the solver to use, either "value_iteration" or "policy_iteration"
+		cache (SolutionCache | None): look for the solution in this cache before solving the MDP (and store it afterward)
+		dice (list[Die]): the dice of the game (see utils.dice.load_dice)
 
 	Returns:
 		list[npt.NDArray]: a list containing two vectors as numpy arrays: Expec and Dice
 	"""
+	if cache is not None:
+		key = cache.get_key(layout=layout, circle=circle, dice=dice, method=method)
+		results = cache.get(key=key)
+		if results is not None:
+			return results
+
 	mdp = MarkovDecisionProcess(
 		layout=layout, 
-		dice=DICE, 
+		dice=dice, 
 		circle=circle
 	)
 
 	mdp.compute_adjacent_matrices()
-	results = mdp.launch_iteration_value()
+
+	if SolverType(method) == SolverType.POLICY_ITERATION:
+		results = mdp.launch_policy_iteration()
+	else:
+		results = mdp.launch_iteration_value()
+
+	if cache is not None:
+		cache.put(key=key, result=results)
 	return results
 
-def compare_costs(layout_name: str, layout: npt.NDArray, best_dice, expected_costs, simulations: int, circle: bool):
+def markovDecisionUpdate(mdp: MarkovDecisionProcess, previous_results: list[npt.NDArray], changes: dict[int, int], method: str = SolverType.POLICY_ITERATION.value) -> list[npt.NDArray]:
+	"""solve again a MDP after a few cells of its layout changed: only the affected transitions are recomputed
+	and the solver is warm started from the previous solution.
+	policy iteration is used by default: the previous policy is usually still optimal (or close to it),
+	so a single exact evaluation and improvement step are often enough, while value iteration still needs many sweeps
+	whenever the policy changes.
+
+	Args:
+		mdp (MarkovDecisionProcess): the MDP (with its adjacent matrices computed) that gave the previous solution, it is updated in place
+		previous_results (list[npt.NDArray]): the previous solution: Expec and Dice
+		changes (dict[int, int]): the new trap type of each changed cell
+		method (str): the solver to use, either "policy_iteration" or "value_iteration"
+
+	Returns:
+		list[npt.NDArray]: a list containing two vectors as numpy arrays: Expec and Dice
+	"""
+	mdp.update_layout(changes=changes)
+
+	if SolverType(method) == SolverType.POLICY_ITERATION:
+		return mdp.launch_policy_iteration(initial_policy=previous_results[1])
+
+	# the exact values of the previous policy on the new layout are much closer to the new optimal values than the previous ones:
+	# value iteration stops after a single sweep if the previous policy is still optimal
+	initial_values = mdp.evaluate_deterministic_policy(policy=np.append(previous_results[1], 0))
+	if not np.all(np.isfinite(initial_values)):
+		# the previous policy never reaches the final cell on the new layout
+		initial_values = previous_results[0]
+	return mdp.launch_iteration_value(initial_values=initial_values)
+
+def markovDecisionBatch(layouts: npt.NDArray, circle: npt.NDArray | bool = False, method: str = SolverType.VALUE_ITERATION.value, return_iterations: bool = False, dice: list[Die] = DICE) -> list[npt.NDArray]:
+	"""launch the markov decision algorithm process on a batch of layouts at once.
+
+	Args:
+		layouts (npt.NDArray): stacked layouts of shape (B, 15)
+		circle (npt.NDArray | bool): circle flag of each layout (or a single flag for every layout)
+		method (str): the solver to use, either "value_iteration" or "policy_iteration"
+		return_iterations (bool): also return the number of iterations of the solver for each layout
+		dice (list[Die]): the dice of the game (see utils.dice.load_dice)
+
+	Returns:
+		list[npt.NDArray]: a list containing two arrays of shape (B, 14): Expec and Dice (and the iterations of shape (B,))
+	"""
+	mdp = BatchMarkovDecisionProcess(
+		layouts=layouts,
+		dice=dice,
+		circles=circle
+	)
+
+	mdp.compute_adjacent_matrices()
+
+	if SolverType(method) == SolverType.POLICY_ITERATION:
+		results = mdp.launch_policy_iteration()
+	else:
+		results = mdp.launch_iteration_value()
+
+	if return_iterations:
+		results.append(mdp.iterations)
+	return results
+
+def solve_chunks(chunks, method: str = SolverType.VALUE_ITERATION.value, workers: int = 1, dice: list[Die] = DICE):
+	"""solve chunks of layouts (see utils.batch.read_layouts) with markovDecisionBatch, in a pool of processes.
+	the solutions are yielded in the order of the chunks as soon as they are available,
+	and only a few chunks are in flight at once so that the memory usage does not depend on the number of layouts.
+
+	Args:
+		chunks (Iterator[tuple[npt.NDArray, npt.NDArray, list]]): the layouts, the circle flags and the ids of each chunk
+		method (str): the solver to use, either "value_iteration" or "policy_iteration"
+		workers (int): number of processes
+		dice (list[Die]): the dice of the game
+
+	Returns:
+		Iterator[tuple[tuple, list[npt.NDArray]]]: each chunk with its Expec, Dice and iterations
+	"""
+	if workers <= 1:
+		for chunk in chunks:
+			(layouts, circles, _) = chunk
+			yield chunk, markovDecisionBatch(layouts=layouts, circle=circles, method=method, return_iterations=True, dice=dice)
+		return
+
+	in_flight = deque()
+	# the workers inherit the sinks: their buffered events must not be copied into the workers
+	INSTRUMENTATION.flush()
+	with ProcessPoolExecutor(max_workers=workers, initializer=detach_worker) as executor:
+		for chunk in chunks:
+			(layouts, circles, _) = chunk
+			in_flight.append((chunk, executor.submit(markovDecisionBatch, layouts, circles, method, True, dice)))
+
+			if len(in_flight) >= 2 * workers:
+				(chunk, future) = in_flight.popleft()
+				yield chunk, future.result()
+
+		while len(in_flight) > 0:
+			(chunk, future) = in_flight.popleft()
+			yield chunk, future.result()
+
+def compare_q_learning(layout: npt.NDArray, circle: bool, games: int, steps: int, epsilon: float, seed: int | None = None, dice: list[Die] = DICE) -> None:
+	"""train a Q-learning agent on the vectorized environment and compare its Q-values with the ones of value iteration.
+
+	Args:
+		layout (npt.NDArray): the layout of the game
+		circle (bool): make the board circle
+		games (int): the number of parallel games of the environment
+		steps (int): the number of steps of every game
+		epsilon (float): the exploration rate of the agent
+		seed (int | None): seed of the environment and of the agent
+		dice (list[Die]): the dice of the game
+	"""
+	mdp = MarkovDecisionProcess(layout=layout, dice=dice, circle=circle)
+	mdp.compute_adjacent_matrices()
+	expected_costs, best_dice = mdp.launch_iteration_value()
+	# Q*(a, s) = c(a|s) + \sum_{s'} P(s'|s,a) V*(s')
+	optimal_Q = mdp.compute_bellman_values(prev=np.append(expected_costs, 0.0))[:, :-1]
+
+	(environment_rng, agent_rng) = [np.random.default_rng(seed_sequence) for seed_sequence in np.random.SeedSequence(seed).spawn(2)]
+	simulation = Simulation(layout=layout, dice=dice, circle=circle)
+	environment = Environment(simulation=simulation, rng=environment_rng, exploring_starts=True)
+	agent = QLearningAgent(number_of_states=len(layout), number_of_actions=len(dice), epsilon=epsilon, rng=agent_rng)
+
+	transitions_per_second = agent.train(environment=environment, number_of_games=games, number_of_steps=steps)
+	learned_Q = agent.Q[:, :-1]
+	learned_dice = np.argmin(learned_Q, axis=0)
+
+	print("Q-learning on the vectorized environment")
+	print("========================================")
+	print(f"Transitions: {games * steps} ({transitions_per_second:.0f} per second)")
+	print(f"Max |Q - Q*|: {np.max(np.abs(learned_Q - optimal_Q)):.4f}")
+	print(f"Learned die for each cell: {learned_dice}")
+	print(f"Best die for each cell: {best_dice}")
+	# a different die is fine when both dice have (almost) the same optimal cost
+	print(f"Regret of the learned dice: {optimal_Q[learned_dice, np.arange(len(learned_dice))] - expected_costs}")
+
+def compare_costs(layout_name: str, layout: npt.NDArray, best_dice, expected_costs, simulations: int, circle: bool, workers: int = 1, seed: int | None = None, variance_reduction: bool = False, dice: list[Die] = DICE):
 	# empirical simulation
 	simulation = Simulation(
 		layout=layout, 
-		dice=DICE,
+		dice=dice,
 		circle=circle
 	)
 	empirical_costs = simulation.simulate(
 		best_dice=best_dice, 
 		strategy=StrategyType.OPTIMAL, 
-		number_of_simulations=simulations
+		number_of_simulations=simulations,
+		workers=workers,
+		seed=seed,
+		# no control variate here: it is built from the expected costs that this simulation checks
+		antithetic=variance_reduction
 		)
 	print(f"Empirical cost for each cell: {empirical_costs}")
 
+	# matplotlib is slow to import, it is only loaded when a plot is shown
+	from utils.plots import compare_costs_plot
 	compare_costs_plot(
 		layout=layout,
 		theoretical_costs=expected_costs,
@@ -57,55 +225,62 @@ def compare_costs(layout_name: str, layout: npt.NDArray, best_dice, expected_cos
 		subtitle=f"Layout: {layout_name}"
 	)
 
-def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expected_costs, simulations: int, circle: bool):
+def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expected_costs, simulations: int, circle: bool, workers: int = 1, seed: int | None = None, exact: bool = False, variance_reduction: bool = False, dice: list[Die] = DICE):
 	# empirical simulation
 	simulation = Simulation(
 		layout=layout, 
-		dice=DICE,
+		dice=dice,
 		circle=circle
 	)
 
-	security_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.SECURITY, 
-		number_of_simulations=simulations
-		)
-	
-	normal_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.NORMAL, 
-		number_of_simulations=simulations
-		)
-	
-	risky_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.RISKY, 
-		number_of_simulations=simulations
-		)
+	# exact evaluation of the (stochastic) policy of each strategy
+	mdp = MarkovDecisionProcess(
+		layout=layout,
+		dice=dice,
+		circle=circle
+	)
+	if exact:
+		mdp.compute_adjacent_matrices()
 
-	security_normal_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.SECURITY_NORMAL, 
-		number_of_simulations=simulations
-		)
-	
-	security_risky_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.SECURITY_RISKY, 
-		number_of_simulations=simulations
-		)
-	
-	normal_risky_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.NORMAL_RISKY, 
-		number_of_simulations=simulations
-		)
-	
-	random_costs = simulation.simulate(
-		best_dice=best_dice, 
-		strategy=StrategyType.RANDOM, 
-		number_of_simulations=simulations
-		)
+	strategies = [
+		StrategyType.SECURITY,
+		StrategyType.NORMAL,
+		StrategyType.RISKY,
+		StrategyType.SECURITY_NORMAL,
+		StrategyType.SECURITY_RISKY,
+		StrategyType.NORMAL_RISKY,
+		StrategyType.RANDOM
+	]
+
+	# common random numbers: every strategy is simulated with the same seed
+	if variance_reduction and seed is None:
+		seed = int(np.random.SeedSequence().generate_state(1)[0])
+
+	# the strategies with the same policy (e.g. RISKY and NORMAL_RISKY when the risky die is optimal in every cell) are only evaluated once
+	policies = [simulation.get_strategy_policy(strategy=strategy, best_dice=best_dice) for strategy in strategies]
+	(_, first_strategies, strategy_policies) = np.unique(np.array(policies), axis=0, return_index=True, return_inverse=True)
+
+	def strategy_costs(strategy: StrategyType) -> npt.NDArray:
+		if exact:
+			return mdp.evaluate_policy(
+				policy_matrix=mdp.get_strategy_policy(strategy=strategy, best_dice=best_dice)
+			)
+
+		return simulation.simulate(
+			best_dice=best_dice, 
+			strategy=strategy, 
+			number_of_simulations=simulations,
+			workers=workers,
+			seed=seed,
+			antithetic=variance_reduction,
+			common_random_numbers=variance_reduction,
+			control_variate_costs=expected_costs if variance_reduction else None
+			)
+
+	policies_costs = [strategy_costs(strategies[idx]) for idx in first_strategies]
+	strategies_costs = [policies_costs[idx] for idx in strategy_policies.reshape(-1)]
+
+	security_costs, normal_costs, risky_costs, security_normal_costs, security_risky_costs, normal_risky_costs, random_costs = strategies_costs
 
 	# check: https://matplotlib.org/stable/gallery/color/named_colors.html#sphx-glr-gallery-color-named-colors-py for a list of colors
 	suboptimal_costs = {
@@ -146,6 +321,7 @@ def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expecte
 		}
 	}
 	
+	from utils.plots import compare_strategies_plot
 	compare_strategies_plot(
 		layout=layout,
 		optimal_costs=expected_costs,
@@ -154,10 +330,10 @@ def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expecte
 		subtitle=f"Layout: {layout_name}"
 	)
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option(
 	"--layout", "-l",
-	type=click.Choice(["RANDOM", "NO_TRAPS", "JAILS_ON_FAST_LANE", "GAMBLE_EVERYWHERE", "NO_TRAPS_SLOW_LANE"]),
+	type=click.Choice(get_layout_names()),
 	default="NO_TRAPS",
 	show_default=True,
 	help="Type of game board"
@@ -169,11 +345,48 @@ def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expecte
 	show_default=True,
 	help="Number of simulations to run"
 )
+@click.option(
+	"--workers", "-w",
+	type=click.INT,
+	default=1,
+	show_default=True,
+	help="Number of processes running the simulations"
+)
+@click.option(
+	"--seed",
+	type=click.INT,
+	default=None,
+	help="Seed of the simulations (same results for any number of workers)"
+)
 @click.option(
 	"--circle", "-c",
 	is_flag=True,
 	help="Make the board circle"
 )
+@click.option(
+	"--method", "-m",
+	type=click.Choice([solver.value for solver in SolverType]),
+	default=SolverType.VALUE_ITERATION.value,
+	show_default=True,
+	help="Algorithm used to solve the MDP"
+)
+@click.option(
+	"--dice",
+	type=click.Path(exists=True, dir_okay=False),
+	default=None,
+	help="JSON file with the dice of the game (weighted faces, trap triggering probability of each trap type), also used by the commands."
+)
+@click.option(
+	"--cache_dir",
+	type=click.Path(file_okay=False),
+	default=None,
+	help="Directory where the solutions of the MDP are cached."
+)
+@click.option(
+	"--distribution", "-d",
+	is_flag=True,
+	help="Show the standard deviation and the percentiles of the optimal cost."
+)
 @click.option(
 	"--mdp_relevance_plot", "-mdp",
 	is_flag=True,
@@ -184,14 +397,56 @@ def compare_strategies(layout_name: str, layout: npt.NDArray, best_dice, expecte
 	is_flag=True,
 	help="Compare the optimal strategy with suboptimal ones."
 )
-def main(layout, simulations, circle, mdp_relevance_plot, strategies_plot):
-	if layout == "RANDOM":
-		custom_layout = generate_layout()
-	else:
-		custom_layout = CUSTOM_LAYOUTS[layout]
+@click.option(
+	"--exact", "-e",
+	is_flag=True,
+	help="Compute the costs of the suboptimal strategies exactly instead of simulating them."
+)
+@click.option(
+	"--variance_reduction", "-vr",
+	is_flag=True,
+	help="Reduce the variance of the simulations (antithetic games, common random numbers and MDP control variate)."
+)
+@click.option(
+	"--trace",
+	type=click.Path(dir_okay=False),
+	default=None,
+	help="JSON lines file where the timings and the counters of the solver and the simulations are written."
+)
+@click.option(
+	"--profile",
+	type=click.Path(dir_okay=False),
+	default=None,
+	help="File where a cProfile dump of the run is written (see python -m pstats)."
+)
+@click.pass_context
+def main(ctx, layout, simulations, workers, seed, circle, method, dice, cache_dir, distribution, mdp_relevance_plot, strategies_plot, exact, variance_reduction, trace, profile):
+	# the trace and the profile also cover the subcommands
+	if profile is not None:
+		profiler = cProfile.Profile()
+		profiler.enable()
+
+		def write_profile():
+			profiler.disable()
+			profiler.dump_stats(profile)
+			click.echo(f"Profile written to {profile}", err=True)
+		ctx.call_on_close(write_profile)
+
+	if trace is not None:
+		INSTRUMENTATION.enable(JsonLinesSink(path=trace))
+		ctx.call_on_close(INSTRUMENTATION.disable)
+
+	dice = load_dice(path=dice) if dice is not None else DICE
+	ctx.obj = {"dice": dice}
+
+	if ctx.invoked_subcommand is not None:
+		return
+
+	custom_layout = get_layout(layout)
 	
 	# optimal strategy
-	result = markovDecision(layout=custom_layout, circle=circle)
+	cache = SolutionCache(directory=cache_dir) if cache_dir is not None else None
+	result = markovDecision(layout=custom_layout, circle=circle, method=method, cache=cache, dice=dice)
 	expected_costs = result[0]
 	best_dice = result[1]
 
@@ -202,6 +457,16 @@ def main(layout, simulations, circle, mdp_relevance_plot, strategies_plot):
 	print(f"Expected cost for each cell: {expected_costs}")
 	print(f"Best die for each cell: {best_dice}")
 
+	if distribution:
+		mdp = MarkovDecisionProcess(layout=custom_layout, dice=dice, circle=circle)
+		mdp.compute_adjacent_matrices()
+		cost_distribution = mdp.compute_cost_distribution(
+			policy_matrix=mdp.get_strategy_policy(strategy=StrategyType.OPTIMAL, best_dice=best_dice)
+		)
+		print(f"Standard deviation of the cost for each cell: {cost_distribution.std}")
+		print(f"95th percentile of the cost for each cell: {cost_distribution.percentile(0.95)}")
+		print(f"99th percentile of the cost for each cell: {cost_distribution.percentile(0.99)}")
+
 	if mdp_relevance_plot:
 		compare_costs(
 			layout_name=layout,
@@ -209,7 +474,11 @@ def main(layout, simulations, circle, mdp_relevance_plot, strategies_plot):
 			best_dice=best_dice,
 			expected_costs=expected_costs,
 			simulations=simulations,
-			circle=circle
+			circle=circle,
+			workers=workers,
+			seed=seed,
+			variance_reduction=variance_reduction,
+			dice=dice
 		)
 	
 	elif strategies_plot:
@@ -219,11 +488,239 @@ def main(layout, simulations, circle, mdp_relevance_plot, strategies_plot):
 			best_dice=best_dice,
 			expected_costs=expected_costs,
 			simulations=simulations,
-			circle=circle
+			circle=circle,
+			workers=workers,
+			seed=seed,
+			exact=exact,
+			variance_reduction=variance_reduction,
+			dice=dice
 		)
 
-if __name__ == "__main__":
-	main()
+@main.command()
+@click.argument(
+	"input_path",
+	type=click.Path(dir_okay=False, allow_dash=True),
+	default="-"
+)
+@click.option(
+	"--output", "-o",
+	type=click.Path(dir_okay=False, allow_dash=True),
+	default="-",
+	show_default=True,
+	help="File where the solutions are written (- for stdout)."
+)
+@click.option(
+	"--input_format",
+	type=click.Choice(INPUT_FORMATS),
+	default=None,
+	help="Format of the layouts (guessed from the extension, jsonl for stdin)."
+)
+@click.option(
+	"--output_format",
+	type=click.Choice(OUTPUT_FORMATS),
+	default=None,
+	help="Format of the solutions (guessed from the extension, jsonl for stdout), store for a binary store of the dice and the costs."
+)
+@click.option(
+	"--circle", "-c",
+	is_flag=True,
+	help="Make the boards circle (unless a JSONL record has its own circle flag)."
+)
+@click.option(
+	"--method", "-m",
+	type=click.Choice([solver.value for solver in SolverType]),
+	default=SolverType.VALUE_ITERATION.value,
+	show_default=True,
+	help="Algorithm used to solve the MDP"
+)
+@click.option(
+	"--chunk_size",
+	type=click.INT,
+	default=BATCH_CHUNK_SIZE,
+	show_default=True,
+	help="Number of layouts solved at once by a process."
+)
+@click.option(
+	"--workers", "-w",
+	type=click.INT,
+	default=1,
+	show_default=True,
+	help="Number of processes solving the layouts"
+)
+@click.pass_context
+def batch(ctx, input_path, output, input_format, output_format, circle, method, chunk_size, workers):
+	"""Solve the layouts of a .npy, CSV or JSONL file (or stdin) and stream their solutions (Expec, Dice and iterations), or write them into a store."""
+	input_format = get_format(path=input_path, input_format=input_format, formats=INPUT_FORMATS, default="jsonl")
+	output_format = get_format(path=output, input_format=output_format, formats=OUTPUT_FORMATS, default="jsonl")
+
+	chunks = read_layouts(path=input_path, input_format=input_format, chunk_size=chunk_size, circle=circle)
+	start_time = time.perf_counter()
 
+	if output_format == "store":
+		if output == "-":
+			print("the store must be written to a file (--output)")
+			raise ValueError()
+		if input_path != "-":
+			# the store is only written once every layout is solved: the whole input is checked before solving it
+			for _ in read_layouts(path=input_path, input_format=input_format, chunk_size=chunk_size, circle=circle):
+				pass
+		results = (
+			(layouts, circles, Expec, Dice)
+			for ((layouts, circles, _), (Expec, Dice, _)) in solve_chunks(chunks=chunks, method=method, workers=workers, dice=ctx.obj["dice"])
+		)
+		number_of_layouts = write_solution_store(path=output, results=results, dice=ctx.obj["dice"])
+		click.echo(f"Stored {number_of_layouts} layouts in {time.perf_counter() - start_time:.2f}s", err=True)
+		return
+
+	file = sys.stdout if output == "-" else open(output, "w")
+	if output_format == "csv":
+		file.write(get_csv_header() + "\n")
+
+	number_of_layouts = 0
+	try:
+		for ((layouts, circles, ids), (Expec, Dice, iterations)) in solve_chunks(chunks=chunks, method=method, workers=workers, dice=ctx.obj["dice"]):
+			write_results(
+				file=file,
+				output_format=output_format,
+				start=number_of_layouts,
+				layouts=layouts,
+				circles=circles,
+				ids=ids,
+				Expec=Expec,
+				Dice=Dice,
+				iterations=iterations
+			)
+			number_of_layouts += len(layouts)
+	finally:
+		if file is not sys.stdout:
+			file.close()
 
+	click.echo(f"Solved {number_of_layouts} layouts in {time.perf_counter() - start_time:.2f}s", err=True)
 
+
+@main.command()
+@click.option(
+	"--layout", "-l",
+	type=click.Choice(get_layout_names()),
+	default="NO_TRAPS",
+	show_default=True,
+	help="Type of game board"
+)
+@click.option(
+	"--circle", "-c",
+	is_flag=True,
+	help="Make the board circle"
+)
+@click.option(
+	"--games", "-n",
+	type=click.INT,
+	default=4096,
+	show_default=True,
+	help="Number of parallel games of the environment."
+)
+@click.option(
+	"--steps",
+	type=click.INT,
+	default=2000,
+	show_default=True,
+	help="Number of steps of every game."
+)
+@click.option(
+	"--epsilon",
+	type=click.FLOAT,
+	default=0.3,
+	show_default=True,
+	help="Probability to throw a random die while learning."
+)
+@click.option(
+	"--seed",
+	type=click.INT,
+	default=None,
+	help="Seed of the environment and of the agent."
+)
+@click.pass_context
+def learn(ctx, layout, circle, games, steps, epsilon, seed):
+	"""Train a Q-learning agent on the vectorized environment and compare it with value iteration."""
+	compare_q_learning(layout=get_layout(layout, rng=np.random.default_rng(seed)), circle=circle, games=games, steps=steps, epsilon=epsilon, seed=seed, dice=ctx.obj["dice"])
+
+@main.command()
+@click.option(
+	"--host",
+	type=click.STRING,
+	default="127.0.0.1",
+	show_default=True,
+	help="Address the service listens on."
+)
+@click.option(
+	"--port", "-p",
+	type=click.INT,
+	default=8765,
+	show_default=True,
+	help="TCP port the service listens on."
+)
+@click.option(
+	"--socket",
+	type=click.Path(dir_okay=False),
+	default=None,
+	help="Listen on this Unix socket instead of a TCP port."
+)
+@click.option(
+	"--method", "-m",
+	type=click.Choice([solver.value for solver in SolverType]),
+	default=SolverType.VALUE_ITERATION.value,
+	show_default=True,
+	help="Algorithm used to solve the MDP"
+)
+@click.option(
+	"--workers", "-w",
+	type=click.INT,
+	default=1,
+	show_default=True,
+	help="Number of processes solving the layouts"
+)
+@click.option(
+	"--batch_size",
+	type=click.INT,
+	default=SERVICE_BATCH_SIZE,
+	show_default=True,
+	help="Maximum number of distinct layouts solved at once."
+)
+@click.option(
+	"--batch_delay",
+	type=click.FLOAT,
+	default=SERVICE_BATCH_DELAY * 1000,
+	show_default=True,
+	help="Milliseconds waited for other layouts before solving a batch."
+)
+@click.option(
+	"--store",
+	type=click.Path(exists=True, dir_okay=False),
+	default=None,
+	help="Store of precomputed solutions (see batch) looked up before solving a layout."
+)
+@click.pass_context
+def serve(ctx, host, port, socket, method, workers, batch_size, batch_delay, store):
+	"""Answer layout queries (JSON lines over TCP or a Unix socket) with their costs and dice, solving the concurrent queries together."""
+	# asyncio is only loaded by the service
+	import asyncio
+	from src.PolicyService import PolicyService
+
+	service = PolicyService(
+		dice=ctx.obj["dice"],
+		method=method,
+		workers=workers,
+		max_batch_size=batch_size,
+		batch_delay=batch_delay / 1000,
+		store=SolutionStore(path=store) if store is not None else None
+	)
+	click.echo(f"Listening on {socket if socket is not None else f'{host}:{port}'}", err=True)
+	try:
+		asyncio.run(service.serve(host=host, port=port, path=socket))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		service.close()
+		click.echo(f"Statistics: {service.statistics}", err=True)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,293 @@
+import time
+import numpy as np
+import numpy.typing as npt
+
+from .Die import Die, get_move_probabilities, get_trap_triggering_matrix
+from .MarkovDecisionProcess import MarkovDecisionProcess
+
+from utils.common import TrapType
+from utils.instrumentation import INSTRUMENTATION
+from utils.constants import INITIAL_DELTA, EPSILON, MAX_ITER, STARTING_CELL
+
+class BatchMarkovDecisionProcess:
+	def __init__(self, layouts: npt.NDArray, dice: list[Die], circles: npt.NDArray | bool = False) -> None:
+		"""solve a batch of B layouts at once.
+
+		Args:
+			layouts (npt.NDArray): stacked layouts of shape (B, 15), each row is a layout of the game
+			dice (list[Die]): the dice (i.e. the actions) available in every layout
+			circles (npt.NDArray | bool): circle flag of each layout, a single flag is applied to every layout
+		"""
+		self.layouts = np.atleast_2d(np.asarray(layouts)).astype(int)
+		self.batch_size, self.layout_size = self.layouts.shape
+		self.final_cell = self.layout_size - 1
+		self.dice = dice
+		self.circles = np.broadcast_to(np.asarray(circles, dtype=bool), (self.batch_size,))
+
+	def compute_adjacent_matrices(self):
+		"""compile every layout into a transition tensor P[b, a, s, s'] and an expected immediate cost matrix C[b, a, s].
+
+		The moves of a die do not depend on the layout, only the traps do.
+		So P[b, a] = M[a] @ K[b, a] where M[a, s, d] is the probability to land on d from s
+		and K[b, a, d, s'] is the probability that the trap of d (if any) sends the player to s'.
+		"""
+		with INSTRUMENTATION.timer("compute_adjacent_matrices", batch_size=self.batch_size):
+			number_of_dice = len(self.dice)
+			# probability of each die to trigger each type of trap (the security die never triggers them)
+			trap_triggering_matrix = get_trap_triggering_matrix(dice=self.dice)
+
+			# M[b, a, s, d]: moves of each die before taking the traps into account
+			move_matrices = self.compute_move_matrices()[self.circles.astype(int)]
+
+			# T[b, d, s']: where the trap on cell d sends the player when it is triggered
+			trap_matrices = self.compute_trap_matrices()[self.layouts, np.arange(self.layout_size)]
+
+			# probability to trigger the trap of each destination cell with each die: (B, A, 1, S)
+			triggered = np.transpose(trap_triggering_matrix[:, self.layouts], (1, 0, 2))[:, :, None, :]
+
+			# the gamble is not fanned out to every cell: it is kept as a uniform jump of mass J[b, a, s]
+			is_gamble = (self.layouts == TrapType.GAMBLE.value)[:, None, None, :]
+			self.jump_matrices = np.sum(move_matrices * triggered * is_gamble, axis=-1)
+			self.local_transition_matrices = move_matrices * (1 - triggered) + (move_matrices * triggered * ~is_gamble) @ trap_matrices[:, None]
+
+			# each move costs 1, plus an extra turn when triggering the prison
+			is_prison = (self.layouts == TrapType.PRISON.value)[:, None, None, :]
+			self.cost_matrix = 1 + np.sum(move_matrices * triggered * is_prison, axis=-1)
+
+			assert self.local_transition_matrices.shape == (self.batch_size, number_of_dice, self.layout_size, self.layout_size)
+
+	@property
+	def transition_matrices(self) -> npt.NDArray:
+		"""the dense transition tensor P[b, a, s, s'] (gamble included)."""
+		return self.local_transition_matrices + self.jump_matrices[..., None] / self.layout_size
+
+	def compute_move_matrices(self) -> npt.NDArray:
+		"""compute the probability M[circle, a, s, d] to land on d from s with die a, for both kinds of boards.
+		the moves of each amount of cells are computed once per kind of board and combined for every die at once.
+
+		Returns:
+			npt.NDArray: the move matrices of shape (2, A, S, S), the first one is for circle = False
+		"""
+		move_probabilities = get_move_probabilities(dice=self.dice)
+		move_matrices = np.zeros((2, len(self.dice), self.layout_size, self.layout_size))
+
+		for circle in [False, True]:
+			# reuse the rules of a single board
+			board = MarkovDecisionProcess(layout=np.zeros(self.layout_size, dtype=int), dice=self.dice, circle=circle)
+			move_tensor = board.compute_move_tensor(max_move=move_probabilities.shape[1] - 1)
+			move_matrices[int(circle)] = np.einsum("am,msd->asd", move_probabilities, move_tensor)
+
+		return move_matrices
+
+	def compute_trap_matrices(self) -> npt.NDArray:
+		"""compute the probability T[t, d, s'] that a triggered trap of type t on cell d sends the player to s'.
+
+		Returns:
+			npt.NDArray: the trap matrices of shape (number of trap types, S, S)
+		"""
+		board = MarkovDecisionProcess(layout=np.zeros(self.layout_size, dtype=int), dice=self.dice)
+		cells = np.arange(self.layout_size)
+
+		trap_matrices = np.zeros((len(TrapType), self.layout_size, self.layout_size))
+		# no trap and prison: stay on the cell
+		trap_matrices[TrapType.NONE.value, cells, cells] = 1.0
+		trap_matrices[TrapType.PRISON.value, cells, cells] = 1.0
+		# teleport back to 1st square (restart)
+		trap_matrices[TrapType.RESTART.value, :, STARTING_CELL] = 1.0
+		# teleport 3 steps backward (penalty)
+		penalty_cells = [board.teleport_3_step_backward(destination_cell=cell) for cell in cells]
+		trap_matrices[TrapType.PENALTY.value, cells, penalty_cells] = 1.0
+		# randomly teleport anywhere on the board (with uniform probability)
+		trap_matrices[TrapType.GAMBLE.value] = 1 / self.layout_size
+
+		return trap_matrices
+
+	def compute_bellman_values(self, prev: npt.NDArray, batch: npt.NDArray) -> npt.NDArray:
+		"""compute the expected cost of every action in every state for a subset of the layouts.
+
+		Args:
+			prev (npt.NDArray): the values V(s') of the previous sweep, shape (len(batch), S)
+			batch (npt.NDArray): the indices of the layouts to update
+
+		Returns:
+			npt.NDArray: a tensor Q of shape (len(batch), A, S)
+		"""
+		# the gamble only needs the mean of V (computed once per layout)
+		return (
+			self.cost_matrix[batch]
+			+ (self.local_transition_matrices[batch] @ prev[:, None, :, None])[..., 0]
+			+ self.jump_matrices[batch] * np.mean(prev, axis=1)[:, None, None]
+		)
+
+	def launch_iteration_value(self) -> list[npt.NDArray]:
+		"""Launch the iteration value algorithm on every layout at once.
+		A layout stops being updated as soon as it converged.
+
+		Returns:
+			list[npt.NDArray]: a list containing two arrays of shape (B, 14): Expec and Dice
+		"""
+		Expec = np.ones((self.batch_size, self.layout_size))
+		Expec[:, self.final_cell] = 0.0 # V(d) = 0
+		Dice = np.ones((self.batch_size, self.layout_size), dtype=int)
+
+		self.iterations = np.ones(self.batch_size, dtype=int)
+		delta = np.full(self.batch_size, INITIAL_DELTA)
+
+		for _ in range(0, MAX_ITER):
+			# layouts that did not converge yet
+			active = np.flatnonzero(delta > EPSILON)
+			if len(active) == 0:
+				break
+
+			if INSTRUMENTATION.enabled:
+				sweep_start = time.perf_counter()
+
+			V_prev = Expec[active]
+			Q = self.compute_bellman_values(prev=V_prev, batch=active)
+
+			best_dice = np.argmin(Q, axis=1)
+			V = np.take_along_axis(Q, best_dice[:, None, :], axis=1)[:, 0, :]
+			V[:, self.final_cell] = 0.0
+
+			Dice[active] = best_dice
+			Expec[active] = V
+
+			delta[active] = np.max(np.abs(V - V_prev), axis=1)
+			self.iterations[active] += 1
+
+			if INSTRUMENTATION.enabled:
+				INSTRUMENTATION.emit("sweep", solver="batch_value_iteration", active_layouts=len(active), residual=float(np.max(delta[active])), duration=time.perf_counter() - sweep_start)
+
+		return [Expec[:, :-1], Dice[:, :-1]]
+
+	def launch_policy_iteration(self) -> list[npt.NDArray]:
+		"""Launch the policy iteration algorithm on every layout at once.
+		A layout stops being updated as soon as its policy is stable.
+
+		Returns:
+			list[npt.NDArray]: a list containing two arrays of shape (B, 14): Expec and Dice
+		"""
+		layouts = np.arange(self.batch_size)
+
+		# start with the greedy policy regarding the immediate cost
+		Dice = np.argmin(self.cost_matrix, axis=1)
+		Expec = self.evaluate_deterministic_policies(policies=Dice, batch=layouts)
+
+		# the cheapest die may never move (or always trigger a trap sending the player back)
+		improper = np.flatnonzero(~np.all(np.isfinite(Expec), axis=1))
+		if len(improper) > 0:
+			(Expec[improper], Dice[improper]) = self.get_proper_policies(batch=improper)
+
+		self.iterations = np.zeros(self.batch_size, dtype=int)
+		# the final cell can not be reached from every cell of these layouts, whatever the policy
+		is_stable = ~np.all(np.isfinite(Expec), axis=1)
+
+		for _ in range(0, MAX_ITER):
+			active = np.flatnonzero(~is_stable)
+			if len(active) == 0:
+				break
+
+			if INSTRUMENTATION.enabled:
+				sweep_start = time.perf_counter()
+
+			# policy improvement: greedy policy regarding V
+			Q = self.compute_bellman_values(prev=Expec[active], batch=active)
+			improved_dice = np.argmin(Q, axis=1)
+
+			# keep the current die in case of ties so that the algorithm can not cycle
+			current_costs = np.take_along_axis(Q, Dice[active][:, None, :], axis=1)[:, 0, :]
+			improved_costs = np.take_along_axis(Q, improved_dice[:, None, :], axis=1)[:, 0, :]
+			improved_dice = np.where(current_costs <= improved_costs + EPSILON, Dice[active], improved_dice)
+
+			is_stable[active] = np.all(improved_dice == Dice[active], axis=1)
+			Dice[active] = improved_dice
+			self.iterations[active] += 1
+
+			# policy evaluation of the layouts whose policy changed: V = C_pi + P_pi @ V
+			changed = active[~is_stable[active]]
+			Expec[changed] = self.evaluate_deterministic_policies(policies=Dice[changed], batch=changed)
+
+			if INSTRUMENTATION.enabled:
+				INSTRUMENTATION.emit("sweep", solver="batch_policy_iteration", active_layouts=len(active), duration=time.perf_counter() - sweep_start)
+
+		return [Expec[:, :-1], Dice[:, :-1]]
+
+	def get_proper_policies(self, batch: npt.NDArray) -> list[npt.NDArray]:
+		"""find a policy reaching the final cell with probability 1 from every cell of a subset of the layouts
+		(see MarkovDecisionProcess.get_proper_policy).
+
+		Args:
+			batch (npt.NDArray): the indices of the layouts
+
+		Returns:
+			list[npt.NDArray]: the exact expected cost of each cell under the policies and the policies, shape (len(batch), S)
+		"""
+		V = np.ones((len(batch), self.layout_size))
+		V[:, self.final_cell] = 0.0
+		Expec = np.full((len(batch), self.layout_size), np.inf)
+		Dice = np.zeros((len(batch), self.layout_size), dtype=int)
+
+		# layouts whose greedy policy is not proper yet
+		remaining = np.arange(len(batch))
+		for _ in range(0, MAX_ITER):
+			Q = self.compute_bellman_values(prev=V[remaining], batch=batch[remaining])
+			Dice[remaining] = np.argmin(Q, axis=1)
+			Expec[remaining] = self.evaluate_deterministic_policies(policies=Dice[remaining], batch=batch[remaining])
+
+			values = np.take_along_axis(Q, Dice[remaining][:, None, :], axis=1)[:, 0, :]
+			values[:, self.final_cell] = 0.0
+			V[remaining] = values
+
+			remaining = remaining[~np.all(np.isfinite(Expec[remaining]), axis=1)]
+			if len(remaining) == 0:
+				break
+
+		return [Expec, Dice]
+
+	def evaluate_deterministic_policies(self, policies: npt.NDArray, batch: npt.NDArray) -> npt.NDArray:
+		"""compute the exact expected cost of each cell when following a given policy, for a subset of the layouts.
+
+		Args:
+			policies (npt.NDArray): the index of the die thrown in each cell, shape (len(batch), S)
+			batch (npt.NDArray): the indices of the layouts to evaluate
+
+		Returns:
+			npt.NDArray: the expected cost of each cell, shape (len(batch), S)
+		"""
+		states = np.arange(self.layout_size)
+		transient = states[:-1]
+
+		P_pi = (
+			self.local_transition_matrices[batch[:, None], policies, states[None, :]]
+			+ self.jump_matrices[batch[:, None], policies, states[None, :]][..., None] / self.layout_size
+		)
+		C_pi = self.cost_matrix[batch[:, None], policies, states[None, :]][:, :-1]
+
+		# the improper cells only lead to improper cells: their equations are replaced by V = 0 to keep the system regular
+		is_proper = self.get_proper_states(P_pi=P_pi)[:, :-1]
+		A = np.where(is_proper[..., None], np.eye(len(transient)) - P_pi[:, :-1, :-1], np.eye(len(transient)))
+		b = np.where(is_proper, C_pi, 0.0)
+
+		Expec = np.zeros((len(batch), self.layout_size))
+		# (I - P_pi) V = C_pi
+		Expec[:, transient] = np.where(is_proper, np.linalg.solve(A, b[..., None])[..., 0], np.inf)
+		return Expec
+
+	def get_proper_states(self, P_pi: npt.NDArray) -> npt.NDArray:
+		"""find the cells from which the final cell is reached with probability 1 in the Markov chain of each layout
+		(see MarkovDecisionProcess.get_proper_states).
+
+		Args:
+			P_pi (npt.NDArray): the transition matrices of the chains, shape (B, S, S)
+
+		Returns:
+			npt.NDArray: a boolean mask of the proper cells, shape (B, S)
+		"""
+		reachable = ((P_pi > 0) | np.eye(self.layout_size, dtype=bool)).astype(float)
+		for _ in range(0, int(np.ceil(np.log2(self.layout_size)))):
+			reachable = ((reachable @ reachable) > 0).astype(float)
+
+		reaches_goal = reachable[:, :, self.final_cell] > 0
+		is_trapped = np.any((reachable > 0) & ~reaches_goal[:, None, :], axis=2)
+
+		return ~is_trapped
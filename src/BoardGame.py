@@ -1,10 +1,10 @@
 import numpy as np
 import numpy.typing as npt
 
-from .Die import Die
+from .Die import Die, DieType
 from enum import Enum
 
-from utils.common import CellType, TrapType
+from utils.common import CellType, TrapType, StrategyType
 from utils.constants import STARTING_CELL, SLOW_LANE_FIRST_CELL, SLOW_LANE_LAST_CELL, FAST_LANE_FIRST_CELL, FAST_LANE_LAST_CELL
 
 class BoardGame:
@@ -13,4 +13,63 @@ class BoardGame:
 		self.layout_size = len(layout)
 		self.final_cell = self.layout_size - 1
 		self.dice = dice
-		self.circle = circle
\ No newline at end of file
+		self.circle = circle
+
+	def get_strategy_policy(self, strategy: StrategyType, best_dice: npt.NDArray) -> npt.NDArray:
+		"""compute the probability to throw each die in each cell according to a strategy.
+
+		Args:
+			strategy (StrategyType): the strategy
+			best_dice (npt.NDArray): the optimal die for each cell (excluding the final cell)
+
+		Returns:
+			npt.NDArray: a matrix of shape (S, A) whose rows sum to 1
+		"""
+		policy = np.zeros((self.layout_size, len(self.dice)))
+		optimal_dice = np.append(np.asarray(best_dice, dtype=int), 0)
+		cells = np.arange(self.layout_size)
+
+		if strategy == StrategyType.OPTIMAL:
+			policy[cells, optimal_dice] = 1.0
+
+		elif strategy == StrategyType.SECURITY:
+			policy[:, self.get_die_index(die_type=DieType.SECURITY)] = 1.0
+		elif strategy == StrategyType.NORMAL:
+			policy[:, self.get_die_index(die_type=DieType.NORMAL)] = 1.0
+		elif strategy == StrategyType.RISKY:
+			policy[:, self.get_die_index(die_type=DieType.RISKY)] = 1.0
+
+		elif strategy == StrategyType.RANDOM:
+			policy[:, :] = 1 / len(self.dice)
+
+		elif strategy == StrategyType.SECURITY_NORMAL:
+			policy[:, [self.get_die_index(die_type=DieType.SECURITY), self.get_die_index(die_type=DieType.NORMAL)]] = 0.5
+		elif strategy == StrategyType.SECURITY_RISKY:
+			policy[:, [self.get_die_index(die_type=DieType.SECURITY), self.get_die_index(die_type=DieType.RISKY)]] = 0.5
+		elif strategy == StrategyType.NORMAL_RISKY:
+			policy[:, [self.get_die_index(die_type=DieType.NORMAL), self.get_die_index(die_type=DieType.RISKY)]] = 0.5
+		elif strategy in [StrategyType.SECURITY_OPTIMAL, StrategyType.NORMAL_OPTIMAL, StrategyType.RISKY_OPTIMAL]:
+			die_type = [DieType.SECURITY, DieType.NORMAL, DieType.RISKY][[StrategyType.SECURITY_OPTIMAL, StrategyType.NORMAL_OPTIMAL, StrategyType.RISKY_OPTIMAL].index(strategy)]
+			policy[:, self.get_die_index(die_type=die_type)] += 0.5
+			policy[cells, optimal_dice] += 0.5
+		else:
+			print("unimplemented strategy...")
+			raise ValueError()
+
+		return policy
+
+	def get_die_index(self, die_type: DieType) -> int:
+		"""find the index of the (first) die of a given type among the dice of the game.
+
+		Args:
+			die_type (DieType): the type of the die
+
+		Returns:
+			int: the index of the die (i.e. the action)
+		"""
+		for (idx, die) in enumerate(self.dice):
+			if die.type == die_type.name:
+				return idx
+
+		print(f"there is no {die_type.name} die among the dice of the game")
+		raise ValueError()
@@ -0,0 +1,173 @@
+import json
+import numpy as np
+import numpy.typing as npt
+
+from utils.common import TrapType
+from utils.constants import STARTING_CELL, SLOW_LANE_FIRST_CELL, FAST_LANE_FIRST_CELL, FAST_LANE_LAST_CELL, PENALTY_STEPS
+
+class BoardGraph:
+	def __init__(self, traps: npt.NDArray, successors: list[list[int]], predecessors: npt.NDArray | None = None, start: int = STARTING_CELL, circle: bool = False) -> None:
+		"""a board described as a graph of cells (any number of cells, lanes and junctions).
+
+		- a move of k cells follows the first successor of each cell, except for its first step:
+		  on a junction (a cell with several successors) the player goes to one of them with the same probability.
+		- the final cell is the last one and has no successor: a move that goes beyond it brings the player
+		  back to the start (circle) or stops on the final cell. a player on a cell without successor does not move.
+		- the penalty trap sends the player PENALTY_STEPS cells back along the predecessors.
+
+		Args:
+			traps (npt.NDArray): the trap type of each cell, shape (S,)
+			successors (list[list[int]]): the next cells of each cell (empty for the final cell)
+			predecessors (npt.NDArray | None): the previous cell of each cell (-1 if none),
+				the first cell leading to each cell if not given
+			start (int): the cell where the games start and where the restart trap sends the player
+			circle (bool): go back to the start when a move goes beyond the final cell
+		"""
+		self.traps = np.asarray(traps, dtype=int)
+		self.size = len(self.traps)
+		self.final_cell = self.size - 1
+		self.successors = [[int(cell) for cell in cells] for cells in successors]
+		self.start = int(start)
+		self.circle = bool(circle)
+
+		if predecessors is None:
+			predecessors = np.full(self.size, -1, dtype=int)
+			for cell in reversed(range(0, self.size)):
+				for next_cell in self.successors[cell] if cell < len(self.successors) else []:
+					predecessors[next_cell] = cell
+		self.predecessors = np.asarray(predecessors, dtype=int)
+
+		self.check()
+
+	@classmethod
+	def from_lanes(cls, traps: npt.NDArray, trunk_length: int, lane_lengths: list[int], circle: bool = False) -> "BoardGraph":
+		"""build a board made of a trunk whose last cell is a junction to several lanes that all lead to the final cell.
+		the cells are numbered along the trunk, then along each lane, and the final cell is the last one.
+
+		Args:
+			traps (npt.NDArray): the trap type of each cell, shape (trunk_length + sum(lane_lengths) + 1,)
+			trunk_length (int): the number of cells before the lanes (the last one is the junction)
+			lane_lengths (list[int]): the number of cells of each lane
+			circle (bool): go back to the start when a move goes beyond the final cell
+		"""
+		size = trunk_length + sum(lane_lengths) + 1
+		final_cell = size - 1
+		successors = [[cell + 1] for cell in range(0, size - 1)] + [[]]
+		predecessors = np.arange(-1, size - 1)
+
+		lane_first_cells = trunk_length + np.cumsum([0] + list(lane_lengths[:-1]))
+		successors[trunk_length - 1] = [int(cell) for cell in lane_first_cells]
+		for (first_cell, length) in zip(lane_first_cells, lane_lengths):
+			successors[first_cell + length - 1] = [final_cell]
+			predecessors[first_cell] = trunk_length - 1
+		predecessors[final_cell] = final_cell - 1
+
+		return cls(traps=traps, successors=successors, predecessors=predecessors, circle=circle)
+
+	@classmethod
+	def standard(cls, layout: npt.NDArray, circle: bool = False) -> "BoardGraph":
+		"""the board of the game: cell 2 is the junction between the slow lane (3 to 9) and the fast lane (10 to 13)."""
+		return cls.from_lanes(
+			traps=layout,
+			trunk_length=SLOW_LANE_FIRST_CELL,
+			lane_lengths=[FAST_LANE_FIRST_CELL - SLOW_LANE_FIRST_CELL, FAST_LANE_LAST_CELL - FAST_LANE_FIRST_CELL + 1],
+			circle=circle
+		)
+
+	@classmethod
+	def from_dict(cls, board: dict) -> "BoardGraph":
+		"""build a board from a dict {"traps": [...], "successors": [[...], ...], "predecessors": [...], "start": 0, "circle": false}
+		(predecessors, start and circle are optional)."""
+		return cls(
+			traps=board["traps"],
+			successors=board["successors"],
+			predecessors=board.get("predecessors"),
+			start=board.get("start", STARTING_CELL),
+			circle=board.get("circle", False)
+		)
+
+	@classmethod
+	def from_json(cls, path: str) -> "BoardGraph":
+		with open(path) as file:
+			return cls.from_dict(json.load(file))
+
+	def to_dict(self) -> dict:
+		return {
+			"traps": self.traps.tolist(),
+			"successors": self.successors,
+			"predecessors": self.predecessors.tolist(),
+			"start": self.start,
+			"circle": self.circle
+		}
+
+	def check(self) -> None:
+		if len(self.successors) != self.size or len(self.predecessors) != self.size:
+			print("the board must give the successors and the predecessor of every cell")
+			raise ValueError()
+
+		if np.any((self.traps < 0) | (self.traps >= len(TrapType))):
+			print(f"the trap types must be between 0 and {len(TrapType) - 1}")
+			raise ValueError()
+
+		if len(self.successors[self.final_cell]) > 0:
+			print("the final cell (the last one) can not have successors")
+			raise ValueError()
+
+		cells = [cell for cells in self.successors for cell in cells] + self.predecessors.tolist() + [self.start]
+		if any(cell < -1 or cell >= self.size for cell in cells) or self.start < 0:
+			print(f"the cells of the board must be between 0 and {self.size - 1}")
+			raise ValueError()
+
+	@property
+	def first_successors(self) -> npt.NDArray:
+		"""the cell followed by a move that goes through each cell (-1 if none)."""
+		return np.array([cells[0] if len(cells) > 0 else -1 for cells in self.successors], dtype=int)
+
+	def get_moves(self, amount: int) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+		"""compute every move of a given amount of cells (before taking the traps into account).
+
+		Args:
+			amount (int): the number of cells of the move
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray, npt.NDArray]: the initial cell, the destination cell and the probability of each move
+				(a cell has one move per successor when it is a junction)
+		"""
+		number_of_successors = np.array([len(cells) for cells in self.successors])
+		initial_cells = np.repeat(np.arange(self.size), np.maximum(number_of_successors, 1))
+		probabilities = 1 / np.maximum(number_of_successors, 1)[initial_cells]
+
+		if amount == 0:
+			return initial_cells, initial_cells.copy(), probabilities
+
+		# first step: every successor of the junctions (a cell without successor does not move)
+		destination_cells = np.array([cell for (idx, cells) in enumerate(self.successors) for cell in (cells if len(cells) > 0 else [idx])], dtype=int)
+		is_moving = number_of_successors[initial_cells] > 0
+		is_beyond = np.zeros(len(initial_cells), dtype=bool)
+
+		# next steps: follow the first successor
+		first_successors = self.first_successors
+		for _ in range(1, amount):
+			next_cells = first_successors[destination_cells]
+			is_beyond |= is_moving & (next_cells < 0)
+			destination_cells = np.where(next_cells < 0, destination_cells, next_cells)
+
+		if self.circle:
+			destination_cells[is_beyond] = self.start
+		return initial_cells, destination_cells, probabilities
+
+	def get_penalty_cells(self, steps: int = PENALTY_STEPS) -> npt.NDArray:
+		"""the cell where the penalty trap of each cell sends the player (steps cells back along the predecessors)."""
+		cells = np.arange(self.size)
+		for _ in range(0, steps):
+			cells = np.where(self.predecessors[cells] < 0, cells, self.predecessors[cells])
+		return cells
+
+	def get_trap_destinations(self) -> npt.NDArray:
+		"""the cell where the trap of each cell sends the player when it is triggered (the gamble is a jump, see SparseMarkovDecisionProcess)."""
+		destinations = np.arange(self.size)
+		is_restart = (self.traps == TrapType.RESTART.value)
+		destinations[is_restart] = self.start
+		is_penalty = (self.traps == TrapType.PENALTY.value)
+		destinations[is_penalty] = self.get_penalty_cells()[is_penalty]
+		return destinations
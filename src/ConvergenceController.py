@@ -0,0 +1,120 @@
+import numpy as np
+import numpy.typing as npt
+
+from dataclasses import dataclass, field
+
+from utils.constants import EPSILON, MAX_ITER
+
+@dataclass
+class ConvergenceReport:
+	"""diagnostics of a run of value iteration.
+
+	Attributes:
+		iterations (int): number of sweeps
+		converged (bool): False if the run stopped because of the maximum number of iterations
+		reason (str): the criterion that stopped the run ("residual", "bound", "policy" or "max_iterations")
+		residuals (list[float]): max |V_n+1 - V_n| after each sweep
+		spans (list[float]): span seminorm max(V_n+1 - V_n) - min(V_n+1 - V_n) after each sweep
+		bound (float): width of the final error bars (max of upper - lower), inf if the greedy policy is improper
+		lower (npt.NDArray): guaranteed lower bound of the optimal cost of each cell
+		upper (npt.NDArray): guaranteed upper bound of the optimal cost of each cell (exact cost of the greedy policy)
+	"""
+	iterations: int = 0
+	converged: bool = False
+	reason: str = ""
+	residuals: list[float] = field(default_factory=list)
+	spans: list[float] = field(default_factory=list)
+	bound: float = np.inf
+	lower: npt.NDArray | None = None
+	upper: npt.NDArray | None = None
+
+class ConvergenceController:
+	def __init__(self, tolerance: float = EPSILON, max_iterations: int = MAX_ITER, bound_tolerance: float | None = None, policy_stability: int | None = None) -> None:
+		"""decide when value iteration stops and keep track of its convergence.
+
+		Args:
+			tolerance (float): stop when max |V_n+1 - V_n| <= tolerance
+			max_iterations (int): maximum number of sweeps
+			bound_tolerance (float | None): stop when the guaranteed error bars are narrower than this value
+				(the bounds are computed at each sweep, which costs a linear solve)
+			policy_stability (int | None): stop when the greedy policy did not change for this number of sweeps
+				(heuristic: the values are then those of the stable policy and report.bound tells how far from optimal it can be)
+		"""
+		self.tolerance = tolerance
+		self.max_iterations = max_iterations
+		self.bound_tolerance = bound_tolerance
+		self.policy_stability = policy_stability
+
+	def start(self) -> None:
+		self.report = ConvergenceReport()
+		self.previous_policy = None
+		self.stable_sweeps = 0
+
+	def update(self, mdp, V_prev: npt.NDArray, V: npt.NDArray, policy: npt.NDArray) -> bool:
+		"""record a sweep V = T V_prev of the given MDP and tell if value iteration must stop.
+
+		Args:
+			mdp (MarkovDecisionProcess): the MDP being solved
+			V_prev (npt.NDArray): the values before the sweep
+			V (npt.NDArray): the values after the sweep
+			policy (npt.NDArray): the greedy policy of the sweep
+
+		Returns:
+			bool: True if value iteration must stop
+		"""
+		difference = V - V_prev
+		self.report.iterations += 1
+		self.report.residuals.append(float(np.max(np.abs(difference))))
+		self.report.spans.append(float(np.max(difference) - np.min(difference)))
+
+		if self.previous_policy is not None and np.array_equal(policy, self.previous_policy):
+			self.stable_sweeps += 1
+		else:
+			self.stable_sweeps = 0
+		self.previous_policy = policy.copy()
+
+		if self.report.residuals[-1] <= self.tolerance:
+			return self.stop(reason="residual", converged=True)
+
+		if self.bound_tolerance is not None:
+			self.compute_bounds(mdp=mdp, V_prev=V_prev, V=V, policy=policy)
+			if self.report.bound <= self.bound_tolerance:
+				return self.stop(reason="bound", converged=True)
+
+		if self.policy_stability is not None and self.stable_sweeps >= self.policy_stability:
+			return self.stop(reason="policy", converged=True)
+
+		if self.report.iterations >= self.max_iterations:
+			return self.stop(reason="max_iterations", converged=False)
+
+		return False
+
+	def stop(self, reason: str, converged: bool) -> bool:
+		self.report.reason = reason
+		self.report.converged = converged
+		return True
+
+	def compute_bounds(self, mdp, V_prev: npt.NDArray, V: npt.NDArray, policy: npt.NDArray) -> None:
+		"""compute error bars of the optimal values V* from a sweep V = T V_prev (span-based bounds
+		adapted to the stochastic shortest path, where the number of remaining moves plays the role of 1 / (1 - discount)).
+
+		- upper: the greedy policy mu is at least as costly as the optimal one, so V* <= V_mu (exact policy evaluation).
+		- lower: V* - V_prev >= N* d where d = V - V_prev and N* is the fundamental matrix of the optimal policy,
+		  so V* >= V_prev + max(d, 0) - (expected number of moves) * max(-d, 0), and the expected number
+		  of moves is at most V_mu / (minimum cost of a move).
+
+		Args:
+			mdp (MarkovDecisionProcess): the MDP being solved
+			V_prev (npt.NDArray): the values before the sweep
+			V (npt.NDArray): the values after the sweep
+			policy (npt.NDArray): the greedy policy of the sweep
+		"""
+		difference = V - V_prev
+		upper = mdp.evaluate_deterministic_policy(policy=policy)
+		remaining_moves = upper / np.min(mdp.cost_matrix)
+		with np.errstate(invalid="ignore"):
+			lower = V_prev + np.maximum(difference, 0.0) - remaining_moves * np.max(np.maximum(-difference, 0.0))
+
+		lower[-1] = upper[-1] = 0.0
+		self.report.lower, self.report.upper = lower, upper
+		self.report.bound = float(np.max(upper - lower))
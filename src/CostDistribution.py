@@ -0,0 +1,57 @@
+import numpy as np
+import numpy.typing as npt
+
+from dataclasses import dataclass
+
+@dataclass
+class CostDistribution:
+	"""distribution of the total cost of a game for each starting cell (excluding the final cell).
+
+	Attributes:
+		pmf (npt.NDArray): pmf[s, k] is the probability that a game starting from cell s costs exactly k,
+			truncated once the remaining probability mass is negligible
+		mean (npt.NDArray): the expected cost of each starting cell
+		variance (npt.NDArray): the variance of the cost of each starting cell
+		truncated_mass (npt.NDArray): the probability mass of each starting cell beyond the last cost of the pmf
+	"""
+	pmf: npt.NDArray
+	mean: npt.NDArray
+	variance: npt.NDArray
+	truncated_mass: npt.NDArray
+
+	@property
+	def std(self) -> npt.NDArray:
+		return np.sqrt(self.variance)
+
+	@property
+	def cdf(self) -> npt.NDArray:
+		return np.cumsum(self.pmf, axis=1)
+
+	def survival(self, cost: int) -> npt.NDArray:
+		"""compute P(cost > k) for each starting cell.
+
+		Args:
+			cost (int): the cost k
+
+		Returns:
+			npt.NDArray: the probability that a game costs more than k, for each starting cell
+		"""
+		if cost < 0:
+			return np.ones(len(self.pmf))
+		if cost >= self.pmf.shape[1]:
+			return self.truncated_mass.copy()
+		return 1.0 - self.cdf[:, cost]
+
+	def percentile(self, q: float) -> npt.NDArray:
+		"""compute the smallest cost k such that P(cost <= k) >= q for each starting cell.
+
+		Args:
+			q (float): the quantile, in [0, 1] (e.g. 0.95 for the 95th percentile)
+
+		Returns:
+			npt.NDArray: the percentile of each starting cell (inf if it lies beyond the truncation)
+		"""
+		is_reached = self.cdf >= q
+		percentiles = np.argmax(is_reached, axis=1).astype(float)
+		percentiles[~np.any(is_reached, axis=1)] = np.inf
+		return percentiles
@@ -1,4 +1,5 @@
 import numpy as np
+import numpy.typing as npt
 
 from enum import Enum
 
@@ -8,10 +9,48 @@ class DieType(Enum):
 	RISKY = 3
 
 class Die:
-	def __init__(self, type: DieType, moves: list[int], trap_triggering_probability: float) -> None:
-		self.type = type.name
+	def __init__(self, type: DieType | str, moves: list[int], trap_triggering_probability: float, weights: list[float] | None = None, trap_triggering_probabilities: dict[str, float] | None = None) -> None:
+		"""a die: the number of cells of each face and the probability to trigger the traps.
+
+		Args:
+			type (DieType | str): the type (or the name) of the die, the security die never triggers the traps
+			moves (list[int]): the number of cells of each face
+			trap_triggering_probability (float): the probability to trigger a trap
+			weights (list[float] | None): the weight of each face (uniform if not given)
+			trap_triggering_probabilities (dict[str, float] | None): the probability to trigger each type of trap
+				(by name, e.g. {"PRISON": 0.2}), trap_triggering_probability for the types that are not given
+		"""
+		self.type = type.name if isinstance(type, Enum) else str(type)
 		self.moves = moves
 		self.trap_triggering_probability = trap_triggering_probability
+		self.weights = weights
+		self.trap_triggering_probabilities = trap_triggering_probabilities
+
+		if weights is not None and (len(weights) != len(moves) or np.any(np.asarray(weights) < 0) or np.sum(weights) <= 0):
+			print(f"the die {self.type} must have a non negative weight for each of its {len(moves)} faces")
+			raise ValueError()
+
+	@property
+	def face_probabilities(self) -> npt.NDArray:
+		"""the probability of each face."""
+		if self.weights is None:
+			return np.full(len(self.moves), 1 / len(self.moves))
+		weights = np.asarray(self.weights, dtype=float)
+		return weights / np.sum(weights)
+
+	def get_trap_triggering_probabilities(self) -> npt.NDArray:
+		"""the probability to trigger each type of trap, indexed by TrapType value (0 for TrapType.NONE and for the security die)."""
+		# utils.common imports this module
+		from utils.common import TrapType
+
+		probabilities = np.full(len(TrapType), float(self.trap_triggering_probability))
+		for (trap_type, probability) in (self.trap_triggering_probabilities or {}).items():
+			probabilities[TrapType[trap_type].value] = probability
+
+		probabilities[TrapType.NONE.value] = 0.0
+		if self.type == DieType.SECURITY.name:
+			probabilities[:] = 0.0
+		return probabilities
 
 	def roll(self) -> int:
 		"""Roll the die.
@@ -19,12 +58,38 @@ class Die:
 		Returns:
 			int: the number returned by the die.
 		"""
-		return np.random.choice(self.moves)
-	
-	def is_triggering_trap(self) -> bool:
+		if self.weights is None:
+			return np.random.choice(self.moves)
+		return np.random.choice(self.moves, p=self.face_probabilities)
+
+	def is_triggering_trap(self, trap_type: int | None = None) -> bool:
 		"""check if we trigger the trap (if any) based on the probability of the die to trigger a trap.
 
+		Args:
+			trap_type (int | None): the type of the trap (the probability of the die for every trap if not given)
+
 		Returns:
 			bool: True or False depending if we trigger the trap or not.
 		"""
-		return np.random.choice([True, False], p=[self.trap_triggering_probability, 1 - self.trap_triggering_probability])
\ No newline at end of file
+		probability = self.trap_triggering_probability if trap_type is None else self.get_trap_triggering_probabilities()[trap_type]
+		return np.random.choice([True, False], p=[probability, 1 - probability])
+
+def get_move_probabilities(dice: list[Die]) -> npt.NDArray:
+	"""the probability F[a, m] that die a moves by m cells, for every die at once.
+
+	Returns:
+		npt.NDArray: a matrix of shape (A, largest move + 1)
+	"""
+	max_move = max([max(die.moves) for die in dice])
+	move_probabilities = np.zeros((len(dice), max_move + 1))
+	for (idx, die) in enumerate(dice):
+		np.add.at(move_probabilities[idx], np.asarray(die.moves, dtype=int), die.face_probabilities)
+	return move_probabilities
+
+def get_trap_triggering_matrix(dice: list[Die]) -> npt.NDArray:
+	"""the probability T[a, t] that die a triggers a trap of type t, for every die at once.
+
+	Returns:
+		npt.NDArray: a matrix of shape (A, number of trap types)
+	"""
+	return np.array([die.get_trap_triggering_probabilities() for die in dice])
@@ -0,0 +1,84 @@
+import numpy as np
+import numpy.typing as npt
+
+from .Simulation import Simulation
+from .MarkovDecisionProcess import MarkovDecisionProcess
+
+from utils.constants import STARTING_CELL
+
+class Environment:
+	def __init__(self, simulation: Simulation, rng: np.random.Generator | None = None, model: MarkovDecisionProcess | None = None, autoreset: bool = True, exploring_starts: bool = False) -> None:
+		"""a vectorized environment of N parallel games for model-free agents: the state is the cell of each game,
+		an action is the index of the die thrown and a move costs 1 (2 with an extra turn in prison).
+		the moves follow the rules of the simulation (or the compiled tables of a model), see Simulation.step_games.
+
+		Args:
+			simulation (Simulation): the game (layout, dice and circle)
+			rng (np.random.Generator | None): the random generator (a fresh one if not given)
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+			autoreset (bool): a game that reaches the final cell starts again on the next step
+			exploring_starts (bool): the games start on a random cell (except the final one) instead of the starting cell,
+				so that an agent visits every cell
+		"""
+		self.simulation = simulation
+		self.rng = rng if rng is not None else np.random.default_rng()
+		self.step_games = simulation.get_step_function(model=model)
+		self.autoreset = autoreset
+		self.exploring_starts = exploring_starts
+
+		self.number_of_actions = len(simulation.dice)
+		self.number_of_states = simulation.layout_size
+		self.final_cell = simulation.final_cell
+
+		self.cells = np.zeros(0, dtype=int)
+
+	def get_starting_cells(self, number_of_games: int) -> npt.NDArray:
+		if self.exploring_starts:
+			return self.rng.integers(0, self.final_cell, number_of_games)
+		return np.full(number_of_games, STARTING_CELL)
+
+	def reset(self, number_of_games: int, starting_cells: npt.NDArray | None = None) -> npt.NDArray:
+		"""start N new games.
+
+		Args:
+			number_of_games (int): the number of parallel games N
+			starting_cells (npt.NDArray | None): the starting cell of each game (see exploring_starts if not given)
+
+		Returns:
+			npt.NDArray: the cell of each game
+		"""
+		if starting_cells is None:
+			starting_cells = self.get_starting_cells(number_of_games=number_of_games)
+		self.cells = np.asarray(starting_cells, dtype=int).copy()
+		return self.cells.copy()
+
+	def step(self, actions: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+		"""throw a die in every game.
+		with autoreset, the games that reached the final cell are started again: their new cell is in self.cells
+		(the next cell returned is still the final cell, so that the agent can see the end of the game).
+		without autoreset, a finished game stays on the final cell at no cost.
+
+		Args:
+			actions (npt.NDArray): the index of the die thrown in each game, shape (N,)
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray, npt.NDArray]: the next cell, the cost of the move and whether the game is finished, for each game
+		"""
+		actions = np.asarray(actions, dtype=int)
+		uniforms = self.rng.random((5, len(self.cells)))
+
+		is_running = self.cells < self.final_cell
+		next_cells, costs = self.step_games(
+			cells=self.cells,
+			dice=actions,
+			uniforms=uniforms
+		)
+		next_cells = np.where(is_running, next_cells, self.cells)
+		costs = np.where(is_running, costs, 0.0)
+		dones = next_cells >= self.final_cell
+
+		self.cells = next_cells.copy()
+		if self.autoreset and np.any(dones):
+			self.cells[dones] = self.get_starting_cells(number_of_games=int(np.count_nonzero(dones)))
+
+		return next_cells, costs, dones
@@ -0,0 +1,204 @@
+import numpy as np
+import numpy.typing as npt
+
+from .Die import Die
+from .BatchMarkovDecisionProcess import BatchMarkovDecisionProcess
+
+from utils.common import TrapType
+
+class LayoutOptimizer:
+	def __init__(self, dice: list[Die], circle: bool = False, maximize: bool = True, layout_size: int = 15, trap_count: int | None = None, allowed_traps: dict[int, list[int]] | None = None) -> None:
+		"""search the layouts with the highest (or lowest) expected cost from the starting cell.
+
+		Args:
+			dice (list[Die]): the dice available to the player
+			circle (bool): indicate if the player must land exactly on the final square
+			maximize (bool): look for the worst layout (highest cost) or the best one (lowest cost)
+			layout_size (int): number of cells of the board
+			trap_count (int | None): exact number of cells with a trap (any number if not given)
+			allowed_traps (dict[int, list[int]] | None): the trap types allowed on some cells (e.g. no trap on the slow lane),
+				the other cells accept any trap type
+		"""
+		self.dice = dice
+		self.circle = circle
+		self.maximize = maximize
+		self.layout_size = layout_size
+		self.trap_count = trap_count
+
+		# the first and the final cells never have a trap
+		self.free_cells = np.arange(1, layout_size - 1)
+		self.allowed_traps = {cell: [trap.value for trap in TrapType] for cell in self.free_cells}
+		for (cell, trap_types) in (allowed_traps or {}).items():
+			self.allowed_traps[cell] = list(trap_types)
+
+		if trap_count is not None:
+			trappable_cells = [cell for cell in self.free_cells if any([trap != TrapType.NONE.value for trap in self.allowed_traps[cell]])]
+			if trap_count > len(trappable_cells) or trap_count < len([cell for cell in self.free_cells if TrapType.NONE.value not in self.allowed_traps[cell]]):
+				print("the number of traps is not compatible with the allowed traps")
+				raise ValueError()
+
+		# score of every layout evaluated so far
+		self.scores = {}
+
+	def search(self, iterations: int = 100, population_size: int = 256, strategy: str = "genetic", temperature: float = 1.0, cooling: float = 0.97, rng: np.random.Generator | None = None) -> tuple[npt.NDArray, float]:
+		"""run the search: each iteration creates a new generation from the current population
+		(mutations, and crossovers for the genetic strategy) and scores it in a single batch.
+
+		Args:
+			iterations (int): number of generations
+			population_size (int): number of layouts in the population
+			strategy (str): "genetic" (keep the best layouts of the population and its offspring)
+				or "annealing" (each layout accepts its mutation with the Metropolis criterion)
+			temperature (float): initial temperature of the annealing
+			cooling (float): the temperature is multiplied by this factor after each iteration
+			rng (np.random.Generator | None): the random generator
+
+		Returns:
+			tuple[npt.NDArray, float]: the best layout found and its expected cost from the starting cell
+		"""
+		if rng is None:
+			rng = np.random.default_rng()
+
+		population = np.array([self.generate_layout(rng=rng) for _ in range(0, population_size)])
+		fitness = self.evaluate(layouts=population)
+
+		for _ in range(0, iterations):
+			offspring = np.array([self.mutate(layout=layout, rng=rng) for layout in population])
+
+			if strategy == "genetic":
+				parents = rng.integers(0, population_size, (population_size, 2))
+				children = np.array([
+					self.mutate(layout=self.crossover(first=population[first], second=population[second], rng=rng), rng=rng)
+					for (first, second) in parents
+				])
+				candidates = np.concatenate([population, offspring, children])
+				candidates_fitness = np.concatenate([fitness, self.evaluate(layouts=np.concatenate([offspring, children]))])
+
+				# keep the best distinct layouts
+				_, unique = np.unique(self.encode(layouts=candidates), return_index=True)
+				best = unique[np.argsort(-candidates_fitness[unique])[:population_size]]
+				population, fitness = candidates[best], candidates_fitness[best]
+
+			elif strategy == "annealing":
+				offspring_fitness = self.evaluate(layouts=offspring)
+				acceptance = np.exp(np.minimum(offspring_fitness - fitness, 0.0) / max(temperature, 1e-12))
+				is_accepted = rng.random(population_size) < acceptance
+				population[is_accepted], fitness[is_accepted] = offspring[is_accepted], offspring_fitness[is_accepted]
+				temperature *= cooling
+
+			else:
+				print("unimplemented search strategy...")
+				raise ValueError()
+
+		return self.get_best_layout()
+
+	def evaluate(self, layouts: npt.NDArray) -> npt.NDArray:
+		"""compute the fitness of a batch of layouts (the expected cost from the starting cell, negated when minimizing),
+		only the layouts that were never evaluated are solved (in a single batch).
+
+		Args:
+			layouts (npt.NDArray): the layouts, shape (B, S)
+
+		Returns:
+			npt.NDArray: the fitness of each layout
+		"""
+		keys = self.encode(layouts=layouts)
+		unknown_keys, unknown = np.unique(keys, return_index=True)
+		is_new = np.array([int(key) not in self.scores for key in unknown_keys], dtype=bool)
+
+		if np.any(is_new):
+			new_layouts = layouts[unknown[is_new]]
+			mdp = BatchMarkovDecisionProcess(layouts=new_layouts, dice=self.dice, circles=self.circle)
+			mdp.compute_adjacent_matrices()
+			Expec, _ = mdp.launch_policy_iteration()
+			for (key, cost) in zip(unknown_keys[is_new], Expec[:, 0]):
+				self.scores[int(key)] = float(cost)
+
+		costs = np.array([self.scores[int(key)] for key in keys])
+		return costs if self.maximize else -costs
+
+	def get_best_layout(self) -> tuple[npt.NDArray, float]:
+		"""get the best layout among all the evaluated ones.
+
+		Returns:
+			tuple[npt.NDArray, float]: the best layout and its expected cost from the starting cell
+		"""
+		keys = list(self.scores.keys())
+		costs = np.array([self.scores[key] for key in keys])
+		best = int(np.argmax(costs) if self.maximize else np.argmin(costs))
+		return self.decode(key=keys[best]), costs[best]
+
+	def generate_layout(self, rng: np.random.Generator) -> npt.NDArray:
+		"""generate a random layout that satisfies the constraints."""
+		layout = np.zeros(self.layout_size, dtype=int)
+
+		if self.trap_count is None:
+			for cell in self.free_cells:
+				layout[cell] = rng.choice(self.allowed_traps[cell])
+			return layout
+
+		# cells that must have a trap, then random cells that can have one
+		mandatory_cells = [cell for cell in self.free_cells if TrapType.NONE.value not in self.allowed_traps[cell]]
+		optional_cells = [cell for cell in self.free_cells if cell not in mandatory_cells and self.get_traps(cell=cell)]
+		trapped_cells = mandatory_cells + list(rng.choice(optional_cells, self.trap_count - len(mandatory_cells), replace=False))
+		for cell in trapped_cells:
+			layout[cell] = rng.choice(self.get_traps(cell=cell))
+		return layout
+
+	def mutate(self, layout: npt.NDArray, rng: np.random.Generator) -> npt.NDArray:
+		"""change the trap of a random cell (or move a trap to another cell when the number of traps is fixed)."""
+		layout = layout.copy()
+		cell = rng.choice(self.free_cells)
+
+		if self.trap_count is None or (layout[cell] != TrapType.NONE.value and len(self.get_traps(cell=cell)) > 1 and rng.random() < 0.5):
+			# change the type of the trap
+			choices = [trap for trap in self.allowed_traps[cell] if trap != layout[cell]]
+			if self.trap_count is not None:
+				choices = [trap for trap in choices if trap != TrapType.NONE.value]
+			if len(choices) > 0:
+				layout[cell] = rng.choice(choices)
+			return layout
+
+		# move a trap from a cell to an empty one
+		removable_cells = [cell for cell in self.free_cells if layout[cell] != TrapType.NONE.value and TrapType.NONE.value in self.allowed_traps[cell]]
+		empty_cells = [cell for cell in self.free_cells if layout[cell] == TrapType.NONE.value and self.get_traps(cell=cell)]
+		if len(removable_cells) > 0 and len(empty_cells) > 0:
+			source, destination = rng.choice(removable_cells), rng.choice(empty_cells)
+			layout[source] = TrapType.NONE.value
+			layout[destination] = rng.choice(self.get_traps(cell=destination))
+		return layout
+
+	def crossover(self, first: npt.NDArray, second: npt.NDArray, rng: np.random.Generator) -> npt.NDArray:
+		"""mix two layouts cell by cell (the child is repaired to keep the number of traps)."""
+		child = np.where(rng.random(self.layout_size) < 0.5, first, second)
+		if self.trap_count is None:
+			return child
+
+		number_of_traps = np.count_nonzero(child[self.free_cells] != TrapType.NONE.value)
+		while number_of_traps != self.trap_count:
+			if number_of_traps > self.trap_count:
+				cells = [cell for cell in self.free_cells if child[cell] != TrapType.NONE.value and TrapType.NONE.value in self.allowed_traps[cell]]
+				child[rng.choice(cells)] = TrapType.NONE.value
+				number_of_traps -= 1
+			else:
+				cells = [cell for cell in self.free_cells if child[cell] == TrapType.NONE.value and self.get_traps(cell=cell)]
+				cell = rng.choice(cells)
+				child[cell] = rng.choice(self.get_traps(cell=cell))
+				number_of_traps += 1
+		return child
+
+	def get_traps(self, cell: int) -> list[int]:
+		"""the trap types (excluding no trap) allowed on a cell."""
+		return [trap for trap in self.allowed_traps[cell] if trap != TrapType.NONE.value]
+
+	def encode(self, layouts: npt.NDArray) -> npt.NDArray:
+		"""encode each layout as an integer (a number in base 5 whose digits are the traps of the free cells)."""
+		powers = len(TrapType) ** np.arange(len(self.free_cells), dtype=np.int64)
+		return np.asarray(layouts, dtype=np.int64)[:, self.free_cells] @ powers
+
+	def decode(self, key: int) -> npt.NDArray:
+		layout = np.zeros(self.layout_size, dtype=int)
+		for cell in self.free_cells:
+			layout[cell] = key % len(TrapType)
+			key //= len(TrapType)
+		return layout
@@ -1,121 +1,447 @@
+import time
 import numpy as np
 import numpy.typing as npt
 
-from .Die import Die, DieType
+from .Die import Die, get_move_probabilities, get_trap_triggering_matrix
 
 from utils.common import CellType, TrapType
-from utils.constants import INITIAL_DELTA, EPSILON, MAX_ITER, STARTING_CELL, SLOW_LANE_FIRST_CELL, SLOW_LANE_LAST_CELL, FAST_LANE_FIRST_CELL, FAST_LANE_LAST_CELL
+from utils.instrumentation import INSTRUMENTATION
+from utils.constants import EPSILON, MAX_ITER, STARTING_CELL, SLOW_LANE_LAST_CELL, FAST_LANE_FIRST_CELL, FAST_LANE_LAST_CELL
 
 from .BoardGame import BoardGame
+from .CostDistribution import CostDistribution
+from .ConvergenceController import ConvergenceController
 
 class MarkovDecisionProcess(BoardGame):
+	# the simulator samples the moves of a dense model from its transition tensor (see Simulation.compile_model)
+	is_sparse = False
+
 	def __init__(self, layout: npt.NDArray, dice: list[Die], circle: bool = False) -> None:
 		super().__init__(layout, dice, circle)
 
-	def launch_iteration_value(self) -> list[npt.NDArray]:
-		"""Launch the iteration value algorithm for Markov Decision Process
+	def launch_iteration_value(self, initial_values: npt.NDArray | None = None, controller: ConvergenceController | None = None) -> list[npt.NDArray]:
+		"""Launch the iteration value algorithm for Markov Decision Process.
+		the diagnostics of the run (iterations, residuals, error bars) are kept in self.convergence_report.
+
+		Args:
+			initial_values (npt.NDArray | None): warm start from these values (e.g. the Expec of a previous solution) instead of ones
+			controller (ConvergenceController | None): the stopping criteria (max |V_n+1 - V_n| <= EPSILON if not given)
 
 		Returns:
 			list[npt.NDArray]: a list containing two vectors as numpy arrays: Expec and Dice
 		"""
+		if controller is None:
+			controller = ConvergenceController()
+		controller.start()
+
 		# expected cost associated to the 14 squares of the game (excluding the goal square)
 		# we start from the final state, setting all the values to 0
 		# this is V(s)
 		Expec = np.ones(self.layout_size)
+		if initial_values is not None:
+			Expec[:len(initial_values)] = initial_values
 		Expec[self.layout_size - 1] = 0.0 # V(d) = 0
 		# choice of the best dice for each of the 14 squares (excluding the goal square)
 		Dice = np.ones(self.layout_size, dtype=int)
 
-		delta = INITIAL_DELTA
-		iterations = 1
+		is_converged = False
+
+		while not is_converged:
+			if INSTRUMENTATION.enabled:
+				sweep_start = time.perf_counter()
 
-		while delta > EPSILON:
 			# V(s') = V(s)
-			V_prev = Expec.copy()
-
-			# for each cell (i.e. each state)
-			# we compute the Bellman optimality conditions V(s)
-			for state in range(0, self.layout_size):
-
-				# for each die, we keep track of the expected cost 
-				# of to reach the final state from the current state
-				current_state_costs = np.zeros((len(self.dice)))
-
-				# we consider each die (i.e each action)
-				for (idx, action) in enumerate(self.dice):
-					V = self.compute_bellman_optimal_value(
-						possible_moves=self.get_adjacent_matrix(die=action)[state],
-						prev=V_prev
-					)
-					current_state_costs[idx] = V
-				
-				# get the index of the optimal conditions: V(s) (i.e. get the best die type for each cell)
-				die = np.argmin(current_state_costs)
-				# update the array of best dices
-				Dice[state] = die
-				# update the array of costs
-				Expec[state] = current_state_costs[die]
-			
+			V_prev = Expec
+
+			# Bellman optimality conditions for every state and every die (i.e. every action) at once
+			# Q(a, s) = c(a|s) + \sum_{all states s'} (P(s'|s,a) * V(s'))
+			Q = self.compute_bellman_values(prev=V_prev)
+
+			# get the index of the optimal conditions: V(s) (i.e. get the best die type for each cell)
+			Dice = np.argmin(Q, axis=0)
+			Expec = Q[Dice, np.arange(self.layout_size)]
 			Expec[self.layout_size - 1] = 0.0
 			
-			# check if we converged toward epsilon
-			#print(np.subtract(Expec, V_prev))
-			delta = np.max(np.abs(np.subtract(Expec, V_prev)))
-			iterations += 1
-		
+			# check if we converged
+			is_converged = controller.update(mdp=self, V_prev=V_prev, V=Expec, policy=Dice)
+
+			if INSTRUMENTATION.enabled:
+				INSTRUMENTATION.emit(
+					"sweep", 
+					solver="value_iteration", 
+					iteration=controller.report.iterations, 
+					residual=controller.report.residuals[-1], 
+					duration=time.perf_counter() - sweep_start
+				)
+
+		report = controller.report
+		if report.reason != "bound":
+			controller.compute_bounds(mdp=self, V_prev=V_prev, V=Expec, policy=Dice)
+
+		# the policy is stable but not its values: use the exact values of the policy
+		if report.reason == "policy" and np.all(np.isfinite(report.upper)):
+			Expec = report.upper.copy()
+
+		self.convergence_report = report
 		return [Expec[:-1], Dice[:-1]]
 
-	def compute_bellman_optimal_value(self, possible_moves: npt.NDArray, prev: npt.NDArray):
-		V = 0.0
+	def launch_policy_iteration(self, initial_policy: npt.NDArray | None = None) -> list[npt.NDArray]:
+		"""Launch the policy iteration algorithm for Markov Decision Process.
+		each policy is evaluated exactly by solving a linear system on the transient states 
+		(every cell but the final one) and then improved greedily until it is stable.
+		the number of evaluated policies is kept in self.iterations.
 
-		# V = c(a|s) + \sum_{all states s'} (P(s'|s,a) * V(s')) 
-		for (next_state, probability, cost) in possible_moves:
-			V += probability * (cost + prev[next_state])
+		Args:
+			initial_policy (npt.NDArray | None): warm start from this policy (e.g. the Dice of a previous solution)
+
+		Returns:
+			list[npt.NDArray]: a list containing two vectors as numpy arrays: Expec and Dice
+		"""
+		states = np.arange(self.layout_size)
+		self.iterations = 0
+
+		# start with the greedy policy regarding the immediate cost
+		Dice = np.argmin(self.cost_matrix, axis=0)
+		Expec = None
+		if initial_policy is not None:
+			warm_start_dice = Dice.copy()
+			warm_start_dice[:len(initial_policy)] = initial_policy
+			warm_start_values = self.evaluate_deterministic_policy(policy=warm_start_dice)
+			# a previous policy may never reach the final cell on the new layout
+			if np.all(np.isfinite(warm_start_values)):
+				(Dice, Expec) = (warm_start_dice, warm_start_values)
+
+		if Expec is None:
+			Expec = self.evaluate_deterministic_policy(policy=Dice)
+			# the cheapest die may never move (or always trigger a trap sending the player back)
+			if not np.all(np.isfinite(Expec)):
+				(Expec, Dice) = self.get_proper_policy()
+				if not np.all(np.isfinite(Expec)):
+					# the final cell can not be reached from every cell, whatever the policy
+					return [Expec[:-1], Dice[:-1]]
+
+		for _ in range(0, MAX_ITER):
+			if INSTRUMENTATION.enabled:
+				sweep_start = time.perf_counter()
+
+			# policy evaluation: V = C_pi + P_pi @ V (the values of the first policy are already known)
+			if Expec is None:
+				Expec = self.evaluate_deterministic_policy(policy=Dice)
+			self.iterations += 1
+
+			# policy improvement: greedy policy regarding V
+			Q = self.compute_bellman_values(prev=Expec)
+			improved_dice = np.argmin(Q, axis=0)
+
+			# keep the current die in case of ties so that the algorithm can not cycle
+			# between policies with the same expected cost
+			is_tied = Q[Dice, states] <= Q[improved_dice, states] + EPSILON
+			improved_dice = np.where(is_tied, Dice, improved_dice)
+
+			if INSTRUMENTATION.enabled:
+				INSTRUMENTATION.emit(
+					"sweep", 
+					solver="policy_iteration", 
+					iteration=self.iterations, 
+					changed_cells=int(np.count_nonzero(improved_dice != Dice)), 
+					duration=time.perf_counter() - sweep_start
+				)
+
+			if np.array_equal(improved_dice, Dice):
+				break
+
+			(Dice, Expec) = (improved_dice, None)
+
+		return [Expec[:-1], Dice[:-1]]
+
+	def get_proper_policy(self) -> list[npt.NDArray]:
+		"""find a policy reaching the final cell with probability 1 from every cell, to start the policy iteration from.
+		value iteration sweeps are run from V = 1 until their greedy policy is proper 
+		(the optimal policy is proper, so it happens before value iteration converges).
+
+		Returns:
+			list[npt.NDArray]: the exact expected cost of each cell under the policy (V(d) = 0 for the final cell) and the policy
+		"""
+		states = np.arange(self.layout_size)
+		V = np.ones(self.layout_size)
+		V[self.layout_size - 1] = 0.0
+
+		for _ in range(0, MAX_ITER):
+			Q = self.compute_bellman_values(prev=V)
+			Dice = np.argmin(Q, axis=0)
+			Expec = self.evaluate_deterministic_policy(policy=Dice)
+			if np.all(np.isfinite(Expec)):
+				break
+
+			V = Q[Dice, states]
+			V[self.layout_size - 1] = 0.0
+
+		return [Expec, Dice]
+
+	def evaluate_deterministic_policy(self, policy: npt.NDArray) -> npt.NDArray:
+		"""compute the exact expected cost to reach the final cell from each cell when following a given policy.
+
+		Args:
+			policy (npt.NDArray): the index of the die thrown in each cell.
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (V(d) = 0 for the final cell).
+		"""
+		states = np.arange(self.layout_size)
+		return self.solve_markov_chain(
+			P_pi=self.transition_matrices[policy, states],
+			C_pi=self.cost_matrix[policy, states]
+		)
+
+	def evaluate_policy(self, policy_matrix: npt.NDArray) -> npt.NDArray:
+		"""compute the exact expected cost of a stationary (possibly stochastic) policy 
+		by solving the Markov chain it induces, without any simulation.
+
+		Args:
+			policy_matrix (npt.NDArray): the probability to throw each die in each cell, shape (S, A) or (S - 1, A)
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (excluding the final cell)
+		"""
+		policy_matrix = np.asarray(policy_matrix, dtype=float)
+		if len(policy_matrix) == self.layout_size - 1:
+			# the die thrown on the final cell does not matter
+			policy_matrix = np.vstack([policy_matrix, np.eye(len(self.dice))[0]])
+
+		# P_pi(s'|s) = \sum_a pi(a|s) P(s'|s,a) and c_pi(s) = \sum_a pi(a|s) c(a|s)
+		P_pi = np.einsum("sa,ast->st", policy_matrix, self.transition_matrices)
+		C_pi = np.sum(policy_matrix * self.cost_matrix.T, axis=1)
+
+		Expec = self.solve_markov_chain(P_pi=P_pi, C_pi=C_pi)
+		return Expec[:-1]
+
+	def compute_cost_distribution(self, policy_matrix: npt.NDArray, truncation_mass: float = 1e-9) -> CostDistribution:
+		"""compute the full distribution of the cost of a game under a stationary policy by propagating 
+		the distribution of the states (and of the cost accumulated so far) through the absorbing Markov chain.
+		the extra turn of the prison makes a move cost 2, so the mass at cost k comes from cost k - 1 and k - 2.
+
+		Args:
+			policy_matrix (npt.NDArray): the probability to throw each die in each cell, shape (S, A) or (S - 1, A)
+			truncation_mass (float): stop once the probability not yet absorbed is below this mass for every cell
+
+		Returns:
+			CostDistribution: the pmf, mean and variance of the cost of each starting cell
+		"""
+		policy_matrix = np.asarray(policy_matrix, dtype=float)
+		if len(policy_matrix) == self.layout_size - 1:
+			policy_matrix = np.vstack([policy_matrix, np.eye(len(self.dice))[0]])
+
+		transient = np.arange(self.layout_size - 1)
+		final = self.layout_size - 1
+
+		# transitions costing 1 (Q1) and 2 (Q2) under the policy
+		Q2_pi = np.einsum("sa,ast->st", policy_matrix, self.extra_turn_matrices)
+		Q1_pi = np.einsum("sa,ast->st", policy_matrix, self.transition_matrices) - Q2_pi
+
+		Q1_transient, Q1_final = Q1_pi[np.ix_(transient, transient)], Q1_pi[transient, final]
+		Q2_transient, Q2_final = Q2_pi[np.ix_(transient, transient)], Q2_pi[transient, final]
+
+		# distribution[k][start, s]: probability to be on the transient cell s with a cost of k (from each start)
+		previous_distribution = np.zeros((len(transient), len(transient)))
+		distribution = np.eye(len(transient))
+		pmf = [np.zeros(len(transient))]
+
+		for _ in range(0, MAX_ITER):
+			pmf.append(distribution @ Q1_final + previous_distribution @ Q2_final)
+			previous_distribution, distribution = distribution, distribution @ Q1_transient + previous_distribution @ Q2_transient
+
+			remaining_mass = 1.0 - np.sum(pmf, axis=0)
+			if np.max(remaining_mass) < truncation_mass:
+				break
+
+		# moments from the fundamental matrix N = (I - Q)^-1
+		N = np.linalg.inv(np.eye(len(transient)) - Q1_transient - Q2_transient)
+		# E[c] and E[c^2] of a single move
+		expected_cost = np.sum(Q1_pi[transient], axis=1) + 2 * np.sum(Q2_pi[transient], axis=1)
+		expected_squared_cost = np.sum(Q1_pi[transient], axis=1) + 4 * np.sum(Q2_pi[transient], axis=1)
+
+		mean = N @ expected_cost
+		# E[T^2](s) = E[c^2] + 2 E[c T(s')] + E[T^2(s')]
+		second_moment = N @ (expected_squared_cost + 2 * (Q1_transient @ mean + 2 * Q2_transient @ mean))
+
+		return CostDistribution(
+			pmf=np.array(pmf).T,
+			mean=mean,
+			variance=second_moment - mean ** 2,
+			truncated_mass=np.maximum(remaining_mass, 0.0)
+		)
+
+	def solve_markov_chain(self, P_pi: npt.NDArray, C_pi: npt.NDArray) -> npt.NDArray:
+		"""solve (I - P_pi) V = C_pi on the transient states (every cell but the final one).
+		the cells from which the final cell is not reached with probability 1 have an infinite cost.
+
+		Args:
+			P_pi (npt.NDArray): the transition matrix of the chain, shape (S, S)
+			C_pi (npt.NDArray): the expected immediate cost of each state, shape (S,)
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (V(d) = 0 for the final cell).
+		"""
+		is_proper = self.get_proper_states(P_pi=P_pi)
+		transient = np.flatnonzero(is_proper[:-1])
+
+		Expec = np.full(self.layout_size, np.inf)
+		Expec[self.layout_size - 1] = 0.0
+		Expec[transient] = np.linalg.solve(np.eye(len(transient)) - P_pi[np.ix_(transient, transient)], C_pi[transient])
+		return Expec
+
+	def get_proper_states(self, P_pi: npt.NDArray) -> npt.NDArray:
+		"""find the cells from which the final cell is reached with probability 1 in a Markov chain.
 
-		return V
+		Args:
+			P_pi (npt.NDArray): the transition matrix of the chain, shape (S, S)
+
+		Returns:
+			npt.NDArray: a boolean mask of the proper cells
+		"""
+		# R[s, s'] > 0 if s' can be reached from s: the paths of length 2^k are obtained by squaring the adjacency matrix k times
+		reachable = ((P_pi > 0) | np.eye(self.layout_size, dtype=bool)).astype(float)
+		for _ in range(0, int(np.ceil(np.log2(self.layout_size)))):
+			reachable = ((reachable @ reachable) > 0).astype(float)
+
+		# cells from which the final cell can be reached
+		reaches_goal = reachable[:, self.layout_size - 1] > 0
+		# cells that can reach a cell from which the final cell can not be reached
+		is_trapped = np.any(reachable[:, ~reaches_goal] > 0, axis=1)
+
+		return ~is_trapped
+
+	def compute_bellman_values(self, prev: npt.NDArray) -> npt.NDArray:
+		"""compute the expected cost of every action in every state given the values of the previous sweep.
+
+		Args:
+			prev (npt.NDArray): the values V(s') of the previous sweep.
+
+		Returns:
+			npt.NDArray: a matrix Q of shape (number of dice, number of states).
+		"""
+		# V = c(a|s) + \sum_{all states s'} (P(s'|s,a) * V(s')) 
+		# the teleportations only need the mean of V under their distribution (computed once per sweep)
+		return self.cost_matrix + self.local_transition_matrices @ prev + self.jump_matrices @ (self.jump_distributions @ prev)
 	
 	def compute_adjacent_matrices(self):
-		self.adjacent_matrices = {}
-
-		for die in self.dice:
-			# adjacent matrix is more convenient than a transition matrix
-			# for each state, we compute the possible next states reachables
-			# in a list of tuples (next_state, probability, cost)
-			self.adjacent_matrices[die.type] = self.init_adjacent_matrix()
-			self.update_adjacent_matrix(die=die)
-
-	def init_adjacent_matrix(self):
-		adjacent_matrix = []
-		for _ in range(0, self.layout_size):
-			adjacent_matrix.append([])
-		return adjacent_matrix
-	
-	def update_adjacent_matrix(self, die: Die):
-		"""update the adjacent matrix for each possible moves allowed by a given die.
+		"""compile the game into a transition tensor P[a, s, s'] (probability to go from s to s' with die a) 
+		and an expected immediate cost matrix C[a, s] (expected cost of throwing die a in state s).
+
+		The teleportations to a distribution of cells (gamble) are not fanned out to every cell: 
+		P = L + J @ D where L[a, s, s'] holds the moves to a single cell, J[a, s, j] is the probability 
+		to be teleported according to the distribution D[j, s'] (e.g. uniform for the gamble).
+		The part of P that costs an extra turn (prison) is also kept in X[a, s, s'] so that the cost of a 
+		transition can be recovered (e.g. to sample games from the model).
+
+		Every die is compiled at once: the moves of each amount of cells are computed once for the board,
+		M[a] = \sum_m F[a, m] Move[m] where F[a, m] is the probability that die a moves by m cells,
+		and the traps are applied to every die with its probability to trigger each type of trap.
+		"""
+		number_of_dice = len(self.dice)
+		self.local_transition_matrices = np.zeros((number_of_dice, self.layout_size, self.layout_size))
+		self.local_extra_turn_matrices = np.zeros((number_of_dice, self.layout_size, self.layout_size))
+		self.cost_matrix = np.zeros((number_of_dice, self.layout_size))
+
+		# distributions of the teleportations (one per type of trap)
+		self.jump_types = [TrapType.GAMBLE.value]
+		self.jump_distributions = np.full((len(self.jump_types), self.layout_size), 1 / self.layout_size)
+		self.jump_matrices = np.zeros((number_of_dice, self.layout_size, len(self.jump_types)))
+		self.extra_turn_jump_matrices = np.zeros((number_of_dice, self.layout_size, len(self.jump_types)))
+
+		with INSTRUMENTATION.timer("compute_adjacent_matrices", circle=bool(self.circle)):
+			self.move_probabilities = get_move_probabilities(dice=self.dice)
+			self.trap_triggering_matrix = get_trap_triggering_matrix(dice=self.dice)
+			# Move[m, s, d]: probability to land on d from s with a move of m cells
+			self.move_tensor = self.compute_move_tensor(max_move=self.move_probabilities.shape[1] - 1)
+
+			# reachable_cells[s, d]: some die can land on d from s (before taking the traps into account)
+			used_moves = np.flatnonzero(np.any(self.move_probabilities > 0, axis=0))
+			self.reachable_cells = np.any(self.move_tensor[used_moves] > 0, axis=0)
+
+			self.compile_rows(cells=np.arange(self.layout_size))
+
+	def compute_move_tensor(self, max_move: int) -> npt.NDArray:
+		"""compute the probability Move[m, s, d] to land on cell d from cell s with a move of m cells (it does not depend on the dice).
 
 		Args:
-			die (Die): the given die.
+			max_move (int): the largest move of the dice
+
+		Returns:
+			npt.NDArray: the move tensor of shape (max_move + 1, S, S)
+		"""
+		move_tensor = np.zeros((max_move + 1, self.layout_size, self.layout_size))
+		for initial_cell in range(0, self.layout_size):
+			for move in range(0, max_move + 1):
+				for destination_cell, probability in self.make_move(initial_cell=initial_cell, amount=move):
+					move_tensor[move, initial_cell, destination_cell] += probability
+		return move_tensor
+
+	def compute_trap_destinations(self) -> npt.NDArray:
+		"""compute the cell where the trap of each cell sends the player when it is triggered (the gamble is a jump)."""
+		destinations = np.arange(self.layout_size)
+		for cell in range(0, self.layout_size):
+			trap_type = int(self.layout[cell])
+			if trap_type == TrapType.RESTART.value:
+				# teleport back to 1st square (restart)
+				destinations[cell] = STARTING_CELL
+			elif trap_type == TrapType.PENALTY.value:
+				# teleport 3 steps backward (penalty)
+				destinations[cell] = self.teleport_3_step_backward(destination_cell=cell)
+		return destinations
+
+	def compile_rows(self, cells: npt.NDArray) -> None:
+		"""compute the rows of the compiled model of some cells for every die at once.
+
+		Args:
+			cells (npt.NDArray): the cells whose transitions are computed
 		"""
-		# for each state (which corresponds to each possible cell)
-		for initial_cell in range(0, len(self.layout)):
-			# for each possible move
-			for move in die.moves:
-				# get the next state along with its probability to move into
-				for destination_cell, probability in self.make_move(
-					initial_cell=initial_cell,
-					amount=move,
-					probability=1/len(die.moves)
-				):
-					# compute the cost and probability to move into the next state
-					# (taking trap into account)
-					self.compute_probabilities(die=die, initial_cell=initial_cell, destination_cell=destination_cell, probability=probability)
+		layout = np.asarray(self.layout, dtype=int)
+		# M[a, s, d]: probability to land on d from s with die a (before taking the traps into account)
+		move_matrices = np.einsum("am,msd->asd", self.move_probabilities, self.move_tensor[:, cells])
+
+		# probability to trigger the trap of each destination cell with each die: (A, 1, S)
+		triggered = self.trap_triggering_matrix[:, layout][:, None, :]
+		is_gamble = (layout == TrapType.GAMBLE.value)
+		is_prison = (layout == TrapType.PRISON.value)
+
+		# the triggered traps send the player to their destination (the prison keeps him on the cell for an extra turn)
+		trap_matrix = np.zeros((self.layout_size, self.layout_size))
+		trap_matrix[np.arange(self.layout_size), self.compute_trap_destinations()] = 1.0
+		trap_matrix[is_gamble] = 0.0
+
+		self.local_transition_matrices[:, cells] = move_matrices * (1 - triggered) + (move_matrices * triggered) @ trap_matrix
+		self.local_extra_turn_matrices[:, cells] = move_matrices * triggered * is_prison
+		self.jump_matrices[:, cells, self.jump_types.index(TrapType.GAMBLE.value)] = np.sum(move_matrices * triggered * is_gamble, axis=-1)
+		# each move costs 1, plus an extra turn when triggering the prison
+		self.cost_matrix[:, cells] = 1 + np.sum(move_matrices * triggered * is_prison, axis=-1)
+
+	def update_layout(self, changes: dict[int, int]) -> npt.NDArray:
+		"""change the trap of a few cells and only recompute the rows of the compiled model that are affected,
+		i.e. the cells from which a die can land on a changed cell.
+
+		Args:
+			changes (dict[int, int]): the new trap type of each changed cell
+
+		Returns:
+			npt.NDArray: the cells whose transitions have been recomputed
+		"""
+		self.layout = np.array(self.layout, copy=True)
+		for (cell, trap_type) in changes.items():
+			self.layout[cell] = trap_type
+
+		changed_cells = np.array(list(changes.keys()), dtype=int)
+		affected_cells = np.flatnonzero(np.any(self.reachable_cells[:, changed_cells], axis=1))
+
+		self.compile_rows(cells=affected_cells)
+		return affected_cells
 
 	def make_move(self, initial_cell: int, amount: int, probability: float = 1.0) -> list[tuple[int, float]]:
 		"""compute the next cell the agent will move to along with the probability to jump to this cell. 
 
 		Args:
 			initial_cell (int): correspond to the array index(which is "cell number - 1") of the agent position and therefore a number in [0..14].
-			amount (int): amount by which the agent will move, that is, a number in [0...3] depending on the dice type (security, normal or risky).
+			amount (int): amount by which the agent will move, that is, a face of the die thrown.
 			probability (float): probability to move to the destination cell.
 
 		Returns:
@@ -128,23 +454,22 @@ class MarkovDecisionProcess(BoardGame):
 		# we arrived on switching cell, possibility to switch to a slow lane or a fast lane
 		if initial_cell == 2:
 			# go slow or fast lane with halved probability
-			return [(SLOW_LANE_FIRST_CELL + (amount - 1), probability / 2), (FAST_LANE_FIRST_CELL + (amount - 1), probability / 2)]
+			slow_lane_cell = self.manage_slow_lane_special_cases(initial_cell=initial_cell, amount=amount)
+			return self.move_toward_final_cell(destination_cell=slow_lane_cell, probability=probability / 2) + \
+				self.move_toward_final_cell(destination_cell=FAST_LANE_FIRST_CELL + (amount - 1), probability=probability / 2)
 		
-		elif initial_cell in [7, 8, 9]:
+		# a large move goes past the slow lane whatever the cell it starts from (passing by the switching cell leads to the slow lane)
+		elif initial_cell <= SLOW_LANE_LAST_CELL:
 			destination_cell = self.manage_slow_lane_special_cases(initial_cell=initial_cell, amount=amount)
 			return self.move_toward_final_cell(destination_cell=destination_cell, probability=probability)
-			
 		
-		elif initial_cell in [11, 12, 13]:
+		elif initial_cell < self.final_cell:
 			destination_cell = initial_cell + amount
 			return self.move_toward_final_cell(destination_cell=destination_cell, probability=probability)
 
 		# already on final cell, do not move agent
-		elif initial_cell == self.final_cell:
-			return [(initial_cell, probability)]
-		
 		else:
-			return [((initial_cell + amount), probability)]
+			return [(initial_cell, probability)]
 
 	def manage_slow_lane_special_cases(self, initial_cell: int, amount: int) -> int:
 		if initial_cell + amount > SLOW_LANE_LAST_CELL:
@@ -166,53 +491,6 @@ class MarkovDecisionProcess(BoardGame):
 			# ensure win if overtake the final cell
 			return [(min(self.final_cell, destination_cell), probability)]
 
-	def compute_probabilities(self, die: Die, initial_cell: int, destination_cell: int, probability: float) -> None:
-		"""compute the probability as well as the cost of every combination of transition from an initial cell to a destination cell and from a destination cell to any other cell (in case of triggering a trap).
-
-		Args:
-			die (Die): a given die
-			initial_cell (int): the starting cell
-			destination_cell (int): the destination cell after the move
-			probability (float): the probability of that transition to happen
-
-		Raises:
-			ValueError: if the destination cell is not in the board.
-		"""
-		if destination_cell < 0 or destination_cell > 14:
-			print("destination cell should be in the range [0..14]")
-			raise ValueError()
-
-		# check the trap (i.e. reward)
-		destination_trap_type = int(self.layout[destination_cell])
-
-		move_and_trap_triggered_prob = probability * die.trap_triggering_probability
-		move_and_trap_not_triggered_prob = probability * (1 - die.trap_triggering_probability)
-
-		# we did not move into a trap or we used the security dice
-		if destination_trap_type == TrapType.NONE.value or die.type == DieType.SECURITY.name:
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, probability, 1))
-		
-		elif destination_trap_type == TrapType.RESTART.value:
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, move_and_trap_not_triggered_prob, 1))
-			# teleport back to 1st square (restart)
-			self.adjacent_matrices[die.type][initial_cell].append((STARTING_CELL, move_and_trap_triggered_prob, 1))
-			
-		elif destination_trap_type == TrapType.PENALTY.value:
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, move_and_trap_not_triggered_prob, 1))
-			self.adjacent_matrices[die.type][initial_cell].append((self.teleport_3_step_backward(destination_cell=destination_cell), move_and_trap_triggered_prob, 1))
-			
-		elif destination_trap_type == TrapType.PRISON.value:
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, move_and_trap_not_triggered_prob, 1))
-
-			# wait one turn before playing again (prison) (= extra cost if triggering jail trap)
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, move_and_trap_triggered_prob, 2))
-
-		elif destination_trap_type == TrapType.GAMBLE.value:
-			self.adjacent_matrices[die.type][initial_cell].append((destination_cell, move_and_trap_not_triggered_prob, 1))
-			# randomly teleport anywhere on the board (with uniform probability)
-			for cell in range(0, self.layout_size):
-				self.adjacent_matrices[die.type][initial_cell].append((cell, (1 / self.layout_size) * move_and_trap_triggered_prob, 1))
-
 	def teleport_3_step_backward(self, destination_cell: int):
 		# teleport 3 steps backward (penalty)
 		# fast lane case
@@ -221,5 +499,15 @@ class MarkovDecisionProcess(BoardGame):
 		else:
 			return max(0, destination_cell - 3)
 
+	@property
+	def transition_matrices(self) -> npt.NDArray:
+		"""the dense transition tensor P[a, s, s'] (teleportations included)."""
+		return self.local_transition_matrices + self.jump_matrices @ self.jump_distributions
+
+	@property
+	def extra_turn_matrices(self) -> npt.NDArray:
+		"""the part X[a, s, s'] of the dense transition tensor that costs an extra turn."""
+		return self.local_extra_turn_matrices + self.extra_turn_jump_matrices @ self.jump_distributions
+
 	def get_adjacent_matrix(self, die: Die) -> npt.NDArray:
-		return self.adjacent_matrices[die.type]
\ No newline at end of file
+		return self.transition_matrices[self.dice.index(die)]
\ No newline at end of file
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import asyncio
+import numpy as np
+import numpy.typing as npt
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .Die import Die
+from .BatchMarkovDecisionProcess import BatchMarkovDecisionProcess
+from .SolutionCache import SolutionCache
+from .SolutionStore import SolutionStore
+
+from utils.common import SolverType
+from utils.batch import check_layouts
+from utils.constants import SERVICE_BATCH_DELAY, SERVICE_BATCH_SIZE, WORKER_NICENESS
+from utils.instrumentation import INSTRUMENTATION
+
+class PolicyService:
+	def __init__(self, dice: list[Die], method: str = SolverType.VALUE_ITERATION.value, workers: int = 1, max_batch_size: int = SERVICE_BATCH_SIZE, batch_delay: float = SERVICE_BATCH_DELAY, cache_size: int = 100000, store: SolutionStore | None = None) -> None:
+		"""a local service answering layout + circle queries with their costs and dice.
+		the identical queries in flight share a single solve, and the distinct layouts received within a few milliseconds
+		are solved together by a BatchMarkovDecisionProcess in a pool of processes, so that the event loop stays responsive.
+
+		the protocol is JSON lines: a request {"layout": [...], "circle": bool, "id": ...} (circle and id are optional)
+		gets the response {"id": ..., "Expec": [...], "Dice": [...]} or {"id": ..., "error": "..."},
+		the requests of a connection are answered as soon as they are solved (not in order).
+
+		Args:
+			dice (list[Die]): the dice of the game
+			method (str): the solver to use, either "value_iteration" or "policy_iteration"
+			workers (int): number of processes solving the batches
+			max_batch_size (int): a batch is solved as soon as it has this number of layouts
+			batch_delay (float): otherwise, a batch is solved this number of seconds after its first layout
+			cache_size (int): number of solutions kept in memory
+			store (SolutionStore | None): look for the solutions in this store (solved with the same dice) before solving them
+		"""
+		self.dice = dice
+		self.method = method
+		self.max_batch_size = max_batch_size
+		self.batch_delay = batch_delay
+		if store is not None and not store.is_compatible(dice=dice):
+			print("the solutions of the store were not computed with the dice of the service")
+			raise ValueError()
+		self.store = store
+
+		self.cache = SolutionCache(maxsize=cache_size)
+		self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker)
+
+		# the future of each layout being solved, and the layouts waiting for the next batch
+		self.in_flight = {}
+		self.pending = {}
+		self.flush_handle = None
+		self.batches = set()
+
+		self.statistics = {"requests": 0, "coalesced": 0, "cached": 0, "stored": 0, "batches": 0, "solved": 0}
+
+	async def query(self, layout: npt.NDArray, circle: bool = False) -> list[npt.NDArray]:
+		"""solve a layout (or wait for the solve of the same layout if it is already in flight).
+
+		Args:
+			layout (npt.NDArray): the layout of the game
+			circle (bool): the circle flag of the layout
+
+		Returns:
+			list[npt.NDArray]: Expec and Dice
+		"""
+		layout = check_layouts(layouts=[layout])[0]
+		if not isinstance(circle, (bool, np.bool_)):
+			print(f"the circle flag must be true or false, got {circle!r}")
+			raise ValueError()
+		circle = bool(circle)
+		self.statistics["requests"] += 1
+
+		# the dice and the method of the service never change, the layout and the circle flag are enough
+		key = f"{int(circle)}:{layout.astype(np.int8).tobytes().hex()}"
+		result = self.cache.get(key=key)
+		if result is not None:
+			self.statistics["cached"] += 1
+			return result
+
+		result = self.get_stored_solution(layout=layout, circle=circle)
+		if result is not None:
+			self.statistics["stored"] += 1
+			self.cache.put(key=key, result=result)
+			return result
+
+		future = self.in_flight.get(key)
+		if future is None:
+			future = asyncio.get_running_loop().create_future()
+			self.in_flight[key] = future
+			self.pending[key] = (layout, circle)
+			self.schedule_batch()
+		else:
+			self.statistics["coalesced"] += 1
+
+		# a cancelled request (e.g. a closed connection) must not cancel the solve shared with the other requests
+		return await asyncio.shield(future)
+
+	def get_stored_solution(self, layout: npt.NDArray, circle: bool) -> list[npt.NDArray] | None:
+		if self.store is None:
+			return None
+		result = self.store.get(layout=layout, circle=circle)
+		if result is None:
+			return None
+		return [result[0].astype(float), result[1]]
+
+	def schedule_batch(self) -> None:
+		if len(self.pending) >= self.max_batch_size:
+			self.flush()
+		elif self.flush_handle is None:
+			self.flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+
+	def flush(self) -> None:
+		"""send the pending layouts to the pool of processes as a single batch."""
+		if self.flush_handle is not None:
+			self.flush_handle.cancel()
+			self.flush_handle = None
+		if len(self.pending) == 0:
+			return
+
+		(batch, self.pending) = (self.pending, {})
+		task = asyncio.ensure_future(self.solve_batch(batch=batch))
+		# keep a reference to the task until it is done
+		self.batches.add(task)
+		task.add_done_callback(self.batches.discard)
+
+	async def solve_batch(self, batch: dict) -> None:
+		keys = list(batch.keys())
+		layouts = np.array([batch[key][0] for key in keys])
+		circles = np.array([batch[key][1] for key in keys])
+
+		start = time.perf_counter()
+		if INSTRUMENTATION.enabled:
+			# the workers are started by the first batch and inherit the sinks: their buffered events must not be copied into the workers
+			INSTRUMENTATION.flush()
+		try:
+			(Expec, Dice) = await asyncio.get_running_loop().run_in_executor(self.executor, solve_layouts, layouts, circles, self.method, self.dice)
+		except Exception as error:
+			for key in keys:
+				future = self.in_flight.pop(key)
+				if not future.done():
+					future.set_exception(error)
+			return
+
+		self.statistics["batches"] += 1
+		self.statistics["solved"] += len(keys)
+		if INSTRUMENTATION.enabled:
+			INSTRUMENTATION.emit("service_batch", layouts=len(keys), duration=time.perf_counter() - start)
+
+		for (idx, key) in enumerate(keys):
+			result = [Expec[idx], Dice[idx]]
+			# cached before the future is removed, so that a new request never solves the layout again
+			self.cache.put(key=key, result=result)
+			future = self.in_flight.pop(key)
+			if not future.done():
+				future.set_result(result)
+
+	async def handle_request(self, line: bytes) -> dict:
+		request_id = None
+		try:
+			request = json.loads(line)
+			if not isinstance(request, dict):
+				request = {"layout": request}
+			request_id = request.get("id")
+			(Expec, Dice) = await self.query(layout=request["layout"], circle=request.get("circle", False))
+		except (ValueError, KeyError, TypeError):
+			return {"id": request_id, "error": "invalid request, expected {\"layout\": [15 trap types], \"circle\": bool, \"id\": ...}"}
+		except Exception as error:
+			return {"id": request_id, "error": f"the layout could not be solved: {error!r}"}
+		return {"id": request_id, "Expec": Expec.tolist(), "Dice": Dice.tolist()}
+
+	async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		"""answer the requests of a connection (one JSON object per line) concurrently."""
+		lock = asyncio.Lock()
+		tasks = set()
+
+		async def answer(line: bytes) -> None:
+			response = await self.handle_request(line=line)
+			async with lock:
+				writer.write((json.dumps(response) + "\n").encode())
+				await writer.drain()
+
+		try:
+			while True:
+				line = await reader.readline()
+				if len(line) == 0:
+					break
+				if line.strip() == b"":
+					continue
+				task = asyncio.ensure_future(answer(line))
+				tasks.add(task)
+				task.add_done_callback(tasks.discard)
+
+			if len(tasks) > 0:
+				await asyncio.gather(*tasks)
+		except ConnectionError:
+			pass
+		finally:
+			for task in tasks:
+				task.cancel()
+			writer.close()
+
+	async def serve(self, host: str = "127.0.0.1", port: int = 8765, path: str | None = None) -> None:
+		"""listen on a TCP port (or on a Unix socket if a path is given) until the task is cancelled."""
+		if path is not None:
+			server = await asyncio.start_unix_server(self.handle_connection, path=path)
+		else:
+			server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+
+		try:
+			async with server:
+				await server.serve_forever()
+		finally:
+			if path is not None and os.path.exists(path):
+				os.remove(path)
+
+	def close(self) -> None:
+		self.executor.shutdown(wait=True, cancel_futures=True)
+
+def initialize_worker() -> None:
+	INSTRUMENTATION.detach()
+	# the event loop answers the cached queries first when the workers use every core
+	if hasattr(os, "nice"):
+		os.nice(WORKER_NICENESS)
+
+def solve_layouts(layouts: npt.NDArray, circles: npt.NDArray, method: str, dice: list[Die]) -> list[npt.NDArray]:
+	"""solve a batch of layouts in a worker process (see PolicyService.solve_batch).
+
+	Returns:
+		list[npt.NDArray]: Expec and Dice, shape (B, 14)
+	"""
+	mdp = BatchMarkovDecisionProcess(layouts=layouts, dice=dice, circles=circles)
+	mdp.compute_adjacent_matrices()
+
+	if SolverType(method) == SolverType.POLICY_ITERATION:
+		return mdp.launch_policy_iteration()
+	return mdp.launch_iteration_value()
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+import numpy.typing as npt
+
+from .Environment import Environment
+
+from utils.instrumentation import INSTRUMENTATION
+
+class QLearningAgent:
+	def __init__(self, number_of_states: int, number_of_actions: int, epsilon: float = 0.1, learning_rate_decay: float = 0.6, rng: np.random.Generator | None = None) -> None:
+		"""tabular Q-learning (cost minimization, no discount) trained on the N games of a vectorized environment at once.
+		the transitions of a step that update the same (action, state) are averaged into a single update
+		whose learning rate decreases with the number of visits: 1 / visits^learning_rate_decay.
+
+		Args:
+			number_of_states (int): the number of cells S
+			number_of_actions (int): the number of dice A
+			epsilon (float): probability to throw a random die instead of the greedy one
+			learning_rate_decay (float): exponent of the learning rate, in (0.5, 1]
+			rng (np.random.Generator | None): the random generator of the exploration
+		"""
+		self.Q = np.zeros((number_of_actions, number_of_states))
+		self.visits = np.zeros((number_of_actions, number_of_states))
+		self.epsilon = epsilon
+		self.learning_rate_decay = learning_rate_decay
+		self.rng = rng if rng is not None else np.random.default_rng()
+
+		self.number_of_states = number_of_states
+		self.number_of_actions = number_of_actions
+
+	def act(self, cells: npt.NDArray) -> npt.NDArray:
+		"""choose a die in each game (epsilon-greedy regarding Q)."""
+		actions = np.argmin(self.Q[:, cells], axis=0)
+		is_exploring = self.rng.random(len(cells)) < self.epsilon
+		actions[is_exploring] = self.rng.integers(0, self.number_of_actions, int(np.count_nonzero(is_exploring)))
+		return actions
+
+	def update(self, cells: npt.NDArray, actions: npt.NDArray, costs: npt.NDArray, next_cells: npt.NDArray, dones: npt.NDArray) -> None:
+		"""Q(a, s) <- Q(a, s) + alpha * (c + min_a' Q(a', s') - Q(a, s)) for the transitions of a step (Q(., final) = 0)."""
+		targets = costs + np.where(dones, 0.0, np.min(self.Q[:, next_cells], axis=0))
+		pairs = actions * self.number_of_states + cells
+
+		counts = np.bincount(pairs, minlength=self.Q.size).reshape(self.Q.shape)
+		errors = np.bincount(pairs, weights=targets - self.Q.ravel()[pairs], minlength=self.Q.size).reshape(self.Q.shape)
+
+		is_visited = counts > 0
+		self.visits += counts
+		learning_rates = np.zeros(self.Q.shape)
+		learning_rates[is_visited] = np.minimum(counts[is_visited] / self.visits[is_visited] ** self.learning_rate_decay, 1.0)
+		self.Q[is_visited] += learning_rates[is_visited] * errors[is_visited] / counts[is_visited]
+
+	def train(self, environment: Environment, number_of_games: int, number_of_steps: int) -> float:
+		"""play N games in parallel for a number of steps and learn from every transition.
+
+		Args:
+			environment (Environment): the environment (with autoreset, so that the games never run out)
+			number_of_games (int): the number of parallel games N
+			number_of_steps (int): the number of steps of every game
+
+		Returns:
+			float: the number of transitions per second
+		"""
+		start = time.perf_counter()
+		cells = environment.reset(number_of_games=number_of_games)
+
+		for _ in range(0, number_of_steps):
+			actions = self.act(cells=cells)
+			next_cells, costs, dones = environment.step(actions=actions)
+			self.update(cells=cells, actions=actions, costs=costs, next_cells=next_cells, dones=dones)
+			cells = environment.cells
+
+		duration = time.perf_counter() - start
+		if INSTRUMENTATION.enabled:
+			INSTRUMENTATION.emit("q_learning", transitions=number_of_games * number_of_steps, duration=duration)
+		return number_of_games * number_of_steps / duration
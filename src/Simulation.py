@@ -1,24 +1,99 @@
+import time
 import numpy as np
 import numpy.typing as npt
 
-from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from statistics import NormalDist
 
 from .BoardGame import BoardGame
-from .Die import Die, DieType
+from .Die import Die, get_trap_triggering_matrix
+from .MarkovDecisionProcess import MarkovDecisionProcess
 
 from utils.common import TrapType, StrategyType
-from utils.constants import FAST_LANE_FIRST_CELL, STARTING_CELL, SLOW_LANE_FIRST_CELL, SLOW_LANE_LAST_CELL
+from utils.instrumentation import INSTRUMENTATION, detach_worker
+from utils.constants import FAST_LANE_FIRST_CELL, STARTING_CELL, SLOW_LANE_LAST_CELL, SIMULATION_SHARD_SIZE
+
+@dataclass
+class SimulationEstimate:
+	"""empirical cost of each cell with its uncertainty.
+
+	Attributes:
+		mean (npt.NDArray): the empirical cost of each cell
+		standard_error (npt.NDArray): the standard error of the mean of each cell
+		games (npt.NDArray): the number of games played from each cell
+	"""
+	mean: npt.NDArray
+	standard_error: npt.NDArray
+	games: npt.NDArray
 
 class Simulation(BoardGame):
 	def __init__(self, layout: npt.NDArray, dice: list[Die], circle: bool = False) -> None:
 		super().__init__(layout, dice, circle)
 	
-	def simulate(self, best_dice: npt.NDArray, strategy: StrategyType, number_of_simulations: int, verbose=False):
+	def simulate(self, best_dice: npt.NDArray, strategy: StrategyType, number_of_simulations: int, verbose=False, vectorized=True, rng: np.random.Generator | None = None, model: MarkovDecisionProcess | None = None, workers: int = 1, seed: int | None = None, antithetic: bool = False, common_random_numbers: bool = False, control_variate_costs: npt.NDArray | None = None):
+		"""estimate the expected cost to reach the final cell from each cell by playing a large number of games.
+
+		Args:
+			best_dice (npt.NDArray): the optimal die for each cell (given by the MDP)
+			strategy (StrategyType): the strategy used to choose the die in each cell
+			number_of_simulations (int): the number of games played from each cell
+			verbose (bool): print each move (only available when playing the games one by one)
+			vectorized (bool): play all the games together as numpy arrays instead of one by one
+			rng (np.random.Generator | None): the random generator used by the vectorized engine
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP 
+				instead of the rules of the game (vectorized engine only)
+			workers (int): number of processes playing the games (vectorized engine only)
+			seed (int | None): seed of the simulation, the results only depend on it and not on the number of workers
+			antithetic (bool): play the games by pairs, the second game of a pair uses the antithetic draws (1 - u) of the first one
+			common_random_numbers (bool): the n-th game from a cell uses the same draws whatever the strategy 
+				(compare strategies with the same seed)
+			control_variate_costs (npt.NDArray | None): the expected cost of each cell given by the MDP (Expec), 
+				used to build a control variate (vectorized engine only)
+
+		Returns:
+			npt.NDArray: the empirical cost of each cell (excluding the final cell)
+		"""
+		variance_reduction = {
+			"antithetic": antithetic,
+			"common_random_numbers": common_random_numbers,
+			"control_variate_costs": control_variate_costs
+		}
+
+		if workers > 1 or seed is not None:
+			return self.simulate_in_parallel(
+				best_dice=best_dice,
+				strategy=strategy,
+				number_of_simulations=number_of_simulations,
+				model=model,
+				workers=workers,
+				seed=seed,
+				**variance_reduction
+			)
+
+		if (vectorized and not verbose) or model is not None or antithetic or common_random_numbers or control_variate_costs is not None:
+			return self.simulate_vectorized(
+				best_dice=best_dice,
+				strategy=strategy,
+				number_of_simulations=number_of_simulations,
+				rng=rng,
+				model=model,
+				**variance_reduction
+			)
+
 		layout_size = len(self.layout)
 		empirical_costs = np.zeros((layout_size - 1))
 
+		# the progress bar is only needed (and imported) by this loop
+		from tqdm import tqdm
+
+		policy = self.get_strategy_policy(strategy=strategy, best_dice=best_dice)
+
 		# for each state
 		for cell in tqdm(range(0, layout_size - 1)):
+			if INSTRUMENTATION.enabled:
+				cell_start = time.perf_counter()
+
 			total_cost = 0.0
 			# run a large number of simulations, 
 			# compute the cost to go from this state to the final state
@@ -31,7 +106,7 @@ class Simulation(BoardGame):
 					optimal_die = best_dice[current_cell]
 
 					# get the die according to the strategy
-					die = self.dice[self.get_die_index(strategy=strategy, optimal_die=optimal_die)]
+					die = self.dice[np.random.choice(len(self.dice), p=policy[current_cell])]
 					# launch the die
 					move = die.roll()
 
@@ -58,45 +133,641 @@ class Simulation(BoardGame):
 			
 			mean_cost = total_cost / number_of_simulations
 			empirical_costs[cell] = mean_cost
+
+			if INSTRUMENTATION.enabled:
+				INSTRUMENTATION.emit("simulate_cell", cell=cell, games=number_of_simulations, duration=time.perf_counter() - cell_start)
 		
 		return empirical_costs
-	
-	def get_die_index(self, strategy: StrategyType, optimal_die: int):
-		if strategy == StrategyType.OPTIMAL:
-			return optimal_die
-
-		elif strategy == StrategyType.SECURITY:
-			return 0
-		elif strategy == StrategyType.NORMAL:
-			return 1
-		elif strategy == StrategyType.RISKY:
-			return 2
-
-		elif strategy == StrategyType.RANDOM:
-			return np.random.randint(0, 3)
-			
-		elif strategy == StrategyType.SECURITY_NORMAL:
-			return np.random.choice([0, 1])
-		elif strategy == StrategyType.SECURITY_RISKY:
-			return np.random.choice([0, 2])
-		elif strategy == StrategyType.NORMAL_RISKY:
-			return np.random.choice([1, 2])
-		elif strategy == StrategyType.SECURITY_OPTIMAL:
-			return np.random.choice([0, optimal_die])
-		elif strategy == StrategyType.NORMAL_OPTIMAL:
-			return np.random.choice([1, optimal_die])
-		elif strategy == StrategyType.RISKY_OPTIMAL:
-			return np.random.choice([2, optimal_die])
+
+	def simulate_vectorized(self, best_dice: npt.NDArray, strategy: StrategyType, number_of_simulations: int, rng: np.random.Generator | None = None, model: MarkovDecisionProcess | None = None, chunk_size: int = 1000000, antithetic: bool = False, common_random_numbers: bool = False, control_variate_costs: npt.NDArray | None = None) -> npt.NDArray:
+		"""play the games of every starting cell in lockstep: each step advances all the unfinished games at once.
+
+		Args:
+			best_dice (npt.NDArray): the optimal die for each cell (given by the MDP)
+			strategy (StrategyType): the strategy used to choose the die in each cell
+			number_of_simulations (int): the number of games played from each cell
+			rng (np.random.Generator | None): the random generator (a fresh one if not given)
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+			chunk_size (int): maximum number of games played at once (bounds the memory usage)
+			antithetic (bool): play the games by pairs of antithetic draws
+			common_random_numbers (bool): the n-th game from a cell uses the same draws whatever the strategy
+			control_variate_costs (npt.NDArray | None): the expected cost of each cell given by the MDP, used as a control variate
+
+		Returns:
+			npt.NDArray: the empirical cost of each cell (excluding the final cell)
+		"""
+		if rng is None:
+			rng = np.random.default_rng()
+
+		policy = self.get_strategy_policy(strategy=strategy, best_dice=best_dice)
+		control_values = self.get_control_values(expected_costs=control_variate_costs)
+		starting_cells = np.repeat(np.arange(0, self.final_cell), number_of_simulations)
+
+		# keep chunks even so that the pairs of antithetic games are never split
+		chunk_size += chunk_size % 2
+
+		sums = np.zeros((4, self.final_cell))
+		for start in range(0, len(starting_cells), chunk_size):
+			chunk = starting_cells[start:start + chunk_size]
+			costs, controls = self.play_games_costs(
+				starting_cells=chunk,
+				policy=policy,
+				rng=rng,
+				model=model,
+				antithetic=antithetic,
+				common_random_numbers=common_random_numbers,
+				control_values=control_values
+			)
+			sums += self.summarize_games(starting_cells=chunk, costs=costs, controls=controls)
+
+		return self.estimate_costs(sums=sums, number_of_simulations=number_of_simulations, use_control_variate=control_values is not None)
+
+	def simulate_in_parallel(self, best_dice: npt.NDArray, strategy: StrategyType, number_of_simulations: int, model: MarkovDecisionProcess | None = None, workers: int = 1, seed: int | None = None, shard_size: int = SIMULATION_SHARD_SIZE, antithetic: bool = False, common_random_numbers: bool = False, control_variate_costs: npt.NDArray | None = None) -> npt.NDArray:
+		"""split the games into shards of (starting cell, batch of games) played by a pool of processes.
+		each shard has its own random generator spawned from the seed, and the shards are always 
+		the same and merged in the same order, so that the results do not depend on the number of workers.
+
+		Args:
+			best_dice (npt.NDArray): the optimal die for each cell (given by the MDP)
+			strategy (StrategyType): the strategy used to choose the die in each cell
+			number_of_simulations (int): the number of games played from each cell
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+			workers (int): number of processes
+			seed (int | None): seed of the simulation (fresh entropy if not given)
+			shard_size (int): number of games in each shard
+			antithetic (bool): play the games by pairs of antithetic draws
+			common_random_numbers (bool): the n-th game from a cell uses the same draws whatever the strategy
+			control_variate_costs (npt.NDArray | None): the expected cost of each cell given by the MDP, used as a control variate
+
+		Returns:
+			npt.NDArray: the empirical cost of each cell (excluding the final cell)
+		"""
+		policy = self.get_strategy_policy(strategy=strategy, best_dice=best_dice)
+		control_values = self.get_control_values(expected_costs=control_variate_costs)
+		variance_reduction = (antithetic, common_random_numbers, control_values)
+
+		shards = []
+		for cell in range(0, self.final_cell):
+			for start in range(0, number_of_simulations, shard_size):
+				shards.append((cell, min(shard_size, number_of_simulations - start)))
+
+		seed_sequences = np.random.SeedSequence(seed).spawn(len(shards))
+		arguments = [
+			(self, policy, cell, number_of_games, seed_sequence, model, variance_reduction)
+			for ((cell, number_of_games), seed_sequence) in zip(shards, seed_sequences)
+		]
+
+		if INSTRUMENTATION.enabled:
+			start = time.perf_counter()
+
+		if workers > 1:
+			# the workers never write to the sinks of the main process (only the timing of the whole run is emitted)
+			INSTRUMENTATION.flush()
+			with ProcessPoolExecutor(max_workers=workers, initializer=detach_worker) as executor:
+				shard_sums = list(executor.map(play_shard, *zip(*arguments)))
 		else:
-			print("unimplemented strategy...")
-			raise ValueError()
+			shard_sums = [play_shard(*shard_arguments) for shard_arguments in arguments]
+
+		if INSTRUMENTATION.enabled:
+			INSTRUMENTATION.emit("simulate_in_parallel", games=number_of_simulations * self.final_cell, shards=len(shards), workers=workers, duration=time.perf_counter() - start)
+
+		sums = np.zeros((4, self.final_cell))
+		for ((cell, _), cell_sums) in zip(shards, shard_sums):
+			sums[:, cell] += cell_sums
+
+		return self.estimate_costs(sums=sums, number_of_simulations=number_of_simulations, use_control_variate=control_values is not None)
+
+	def get_control_values(self, expected_costs: npt.NDArray | None) -> tuple[npt.NDArray, npt.NDArray] | None:
+		"""compute the tables used by the control variate: the values V of the MDP and Q(a, s) = c(a|s) + sum_s' P(s'|s,a) V(s').
+		the sum over the moves of a game of (cost + V(next cell) - Q(die, cell)) has a null expectation whatever the strategy,
+		and it is strongly correlated with the cost of the game.
+
+		Args:
+			expected_costs (npt.NDArray | None): the expected cost of each cell (excluding the final cell) given by the MDP
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray] | None: Q of shape (A, S) and V of shape (S,), or None if no expected costs are given
+		"""
+		if expected_costs is None:
+			return None
+
+		mdp = MarkovDecisionProcess(layout=self.layout, dice=self.dice, circle=self.circle)
+		mdp.compute_adjacent_matrices()
+
+		values = np.append(np.asarray(expected_costs, dtype=float), 0.0)
+		return mdp.compute_bellman_values(prev=values), values
+
+	def summarize_games(self, starting_cells: npt.NDArray, costs: npt.NDArray, controls: npt.NDArray) -> npt.NDArray:
+		"""compute the sums of Y, X, X * Y and X^2 for each starting cell (Y: cost of a game, X: its control)."""
+		return np.array([
+			np.bincount(starting_cells, weights=values, minlength=self.final_cell)[:self.final_cell]
+			for values in [costs, controls, controls * costs, controls ** 2]
+		])
+
+	def estimate_costs(self, sums: npt.NDArray, number_of_simulations: int, use_control_variate: bool = False) -> npt.NDArray:
+		"""estimate the cost of each cell from the sums of Y, X, X * Y and X^2 (see summarize_games).
+		with a control variate, the estimate is mean(Y) - beta * mean(X) with beta = cov(X, Y) / var(X).
+		"""
+		means = sums[0] / number_of_simulations
+		if not use_control_variate:
+			return means
+
+		control_means = sums[1] / number_of_simulations
+		covariances = sums[2] / number_of_simulations - means * control_means
+		variances = sums[3] / number_of_simulations - control_means ** 2
+
+		betas = np.divide(covariances, variances, out=np.zeros_like(covariances), where=variances > 0)
+		return means - betas * control_means
+
+	def simulate_until_confident(self, best_dice: npt.NDArray, strategy: StrategyType, half_width: float = 0.05, confidence: float = 0.95, batch_size: int = 1000, max_simulations: int = 1000000, rng: np.random.Generator | None = None, model: MarkovDecisionProcess | None = None) -> SimulationEstimate:
+		"""play batches of games from each cell until the confidence interval of its empirical cost is narrow enough.
+		the mean and the variance of each cell are updated after each batch (Welford / Chan et al. update),
+		and a cell stops as soon as its half-width reaches the target or its budget is spent.
+
+		Args:
+			best_dice (npt.NDArray): the optimal die for each cell (given by the MDP)
+			strategy (StrategyType): the strategy used to choose the die in each cell
+			half_width (float): target half-width of the confidence interval of each cell
+			confidence (float): confidence level of the interval
+			batch_size (int): number of games played from each unfinished cell at each round
+			max_simulations (int): maximum number of games played from each cell
+			rng (np.random.Generator | None): the random generator (a fresh one if not given)
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+
+		Returns:
+			SimulationEstimate: the mean, the standard error and the number of games of each cell
+		"""
+		if rng is None:
+			rng = np.random.default_rng()
+
+		policy = self.get_strategy_policy(strategy=strategy, best_dice=best_dice)
+		z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+		games = np.zeros(self.final_cell, dtype=int)
+		means = np.zeros(self.final_cell)
+		squared_deviations = np.zeros(self.final_cell)
+		is_active = np.ones(self.final_cell, dtype=bool)
+
+		while np.any(is_active):
+			active_cells = np.flatnonzero(is_active)
+			batch_games = np.minimum(batch_size, max_simulations - games[active_cells])
+			starting_cells = np.repeat(active_cells, batch_games)
+
+			costs, _ = self.play_games_costs(starting_cells=starting_cells, policy=policy, rng=rng, model=model)
+
+			# statistics of the batch
+			batch_means = np.bincount(starting_cells, weights=costs, minlength=self.final_cell)[active_cells] / batch_games
+			batch_squared_deviations = np.bincount(starting_cells, weights=(costs - np.repeat(batch_means, batch_games)) ** 2, minlength=self.final_cell)[active_cells]
+
+			# merge them with the statistics of the previous batches
+			total_games = games[active_cells] + batch_games
+			delta = batch_means - means[active_cells]
+			means[active_cells] += delta * batch_games / total_games
+			squared_deviations[active_cells] += batch_squared_deviations + delta ** 2 * games[active_cells] * batch_games / total_games
+			games[active_cells] = total_games
+
+			standard_errors = np.sqrt(squared_deviations[active_cells] / np.maximum(total_games - 1, 1) / total_games)
+			is_active[active_cells] = (z * standard_errors > half_width) & (total_games < max_simulations)
+
+		return SimulationEstimate(
+			mean=means,
+			standard_error=np.sqrt(squared_deviations / np.maximum(games - 1, 1) / games),
+			games=games
+		)
+
+	def play_games(self, starting_cells: npt.NDArray, policy: npt.NDArray, rng: np.random.Generator, model: MarkovDecisionProcess | None = None) -> npt.NDArray:
+		"""play a set of games until they all reach the final cell.
+
+		Args:
+			starting_cells (npt.NDArray): the starting cell of each game
+			policy (npt.NDArray): the probability to throw each die in each cell, shape (S, A)
+			rng (np.random.Generator): the random generator
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+
+		Returns:
+			npt.NDArray: the total cost of the games for each starting cell
+		"""
+		starting_cells = np.asarray(starting_cells, dtype=int)
+		costs, _ = self.play_games_costs(starting_cells=starting_cells, policy=policy, rng=rng, model=model)
+		return np.bincount(starting_cells, weights=costs, minlength=self.final_cell)[:self.final_cell]
+
+	def play_games_costs(self, starting_cells: npt.NDArray, policy: npt.NDArray, rng: np.random.Generator, model: MarkovDecisionProcess | None = None, antithetic: bool = False, common_random_numbers: bool = False, control_values: tuple[npt.NDArray, npt.NDArray] | None = None) -> tuple[npt.NDArray, npt.NDArray]:
+		"""play a set of games until they all reach the final cell.
+
+		Args:
+			starting_cells (npt.NDArray): the starting cell of each game
+			policy (npt.NDArray): the probability to throw each die in each cell, shape (S, A)
+			rng (np.random.Generator): the random generator
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+			antithetic (bool): the games 2k and 2k + 1 use antithetic draws (u and 1 - u)
+			common_random_numbers (bool): the draws of the n-th game at the t-th step do not depend on the other games
+				(see hash_uniforms), so that the same games are played with the same draws whatever the strategy
+			control_values (tuple[npt.NDArray, npt.NDArray] | None): Q and V used to compute the control of each game (see get_control_values)
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray]: the cost and the control (zero if no control values are given) of each game
+		"""
+		step_games = self.get_step_function(model=model)
+
+		# thresholds of the die choice, one column per cell: 
+		# the die is the number of thresholds below the uniform draw (the last cumulative probability is always 1)
+		die_thresholds = np.cumsum(policy, axis=-1)[:, :-1].T.copy()
+
+		number_of_games = len(starting_cells)
+		# each game has its own draw index (the pairs of antithetic games share theirs)
+		is_shared = antithetic or common_random_numbers
+		number_of_draws = number_of_games
+
+		final_costs = np.zeros(number_of_games)
+		final_controls = np.zeros(number_of_games)
+
+		# only unfinished games are kept in these arrays
+		games = np.arange(number_of_games)
+		cells = np.asarray(starting_cells, dtype=int).copy()
+		costs = np.zeros(len(cells))
+		controls = np.zeros(len(cells))
+		draws = np.arange(number_of_games)
+
+		# counters of the instrumentation (dice rolls, traps triggered by type, jail turns and steps per game)
+		counters = self.start_counters(starting_cells=starting_cells) if INSTRUMENTATION.enabled else None
+		step = 0
+
+		if common_random_numbers:
+			# the key of the counter-based stream: every strategy played with the same seed gets the same key
+			stream_key = rng.integers(0, np.iinfo(np.uint64).max, dtype=np.uint64, endpoint=True)
+
+		while len(cells) > 0:
+			# all the random draws of the step at once:
+			# choice of the die, face of the die, choice of the lane, trap triggering and gamble destination
+			if common_random_numbers:
+				uniforms = self.hash_uniforms(key=stream_key, step=step, draws=draws, antithetic=antithetic)
+			elif is_shared:
+				uniforms = self.draw_uniforms(draws=draws, number_of_draws=number_of_draws, rng=rng, antithetic=antithetic)
+			else:
+				uniforms = rng.random((5, len(cells)))
+
+			# get the die according to the strategy
+			dice = np.count_nonzero(uniforms[0] >= die_thresholds[:, cells], axis=0)
+
+			next_cells, step_costs = step_games(
+				cells=cells, 
+				dice=dice, 
+				uniforms=uniforms,
+				counters=counters
+			)
+			costs += step_costs
+			step += 1
+
+			if counters is not None:
+				counters["dice_rolls"] += np.bincount(dice, minlength=len(self.dice))
+				counters["jail_turns"] += int(np.count_nonzero(step_costs > 1))
+
+			if control_values is not None:
+				Q, V = control_values
+				controls += step_costs + V[next_cells] - Q[dice, cells]
+
+			cells = next_cells
+			is_finished = (cells >= self.final_cell)
+			if np.any(is_finished):
+				final_costs[games[is_finished]] = costs[is_finished]
+				final_controls[games[is_finished]] = controls[is_finished]
+
+				if counters is not None:
+					counters["steps"][games[is_finished]] = step
+
+				running = np.flatnonzero(~is_finished)
+				games, cells, costs, controls, draws = [
+					values[running] for values in [games, cells, costs, controls, draws]
+				]
 
-	def get_destination_cell(self, initial_cell: int, amount: int) -> int:
+				# the draws of the finished games are not needed anymore (the counter-based draws only depend on the draw index)
+				if is_shared and not common_random_numbers and len(draws) > 0:
+					draws, number_of_draws = self.compact_draws(draws=draws, antithetic=antithetic)
+
+		if counters is not None:
+			self.emit_counters(counters=counters)
+		return final_costs, final_controls
+
+	def get_step_function(self, model: MarkovDecisionProcess | None = None):
+		"""compile the rules of the game (or the tables of a model) and give the function that makes one move in each game.
+
+		Args:
+			model (MarkovDecisionProcess | None): sample the moves from the compiled tables of this MDP if given
+
+		Returns:
+			Callable: step_games, step_games_from_model or step_games_from_sparse_model
+		"""
+		if model is None:
+			self.compile_rules()
+			return self.step_games
+		elif model.is_sparse:
+			self.compile_sparse_model(model=model)
+			return self.step_games_from_sparse_model
+		else:
+			self.compile_model(model=model)
+			return self.step_games_from_model
+
+	def start_counters(self, starting_cells: npt.NDArray) -> dict:
+		"""create the counters of a set of games (only used when the instrumentation is enabled)."""
+		return {
+			"start": time.perf_counter(),
+			"starting_cells": np.asarray(starting_cells, dtype=int),
+			"dice_rolls": np.zeros(len(self.dice), dtype=int),
+			"traps_triggered": np.zeros(len(TrapType), dtype=int),
+			"jail_turns": 0,
+			"steps": np.zeros(len(starting_cells), dtype=int)
+		}
+
+	def emit_counters(self, counters: dict) -> None:
+		"""send the counters of a set of games to the instrumentation."""
+		starting_cells = counters["starting_cells"]
+		games_by_cell = np.bincount(starting_cells, minlength=self.final_cell)[:self.final_cell]
+		steps_by_cell = np.bincount(starting_cells, weights=counters["steps"], minlength=self.final_cell)[:self.final_cell]
+
+		INSTRUMENTATION.emit(
+			"simulate_games",
+			games=len(starting_cells),
+			duration=time.perf_counter() - counters["start"],
+			dice_rolls={die.type: int(count) for (die, count) in zip(self.dice, counters["dice_rolls"])},
+			traps_triggered={trap.name: int(counters["traps_triggered"][trap.value]) for trap in TrapType if trap != TrapType.NONE},
+			jail_turns=counters["jail_turns"],
+			steps_per_game=float(np.mean(counters["steps"])) if len(starting_cells) > 0 else 0.0,
+			steps_per_game_by_cell={
+				int(cell): float(steps_by_cell[cell] / games_by_cell[cell]) 
+				for cell in np.flatnonzero(games_by_cell)
+			}
+		)
+
+	def draw_uniforms(self, draws: npt.NDArray, number_of_draws: int, rng: np.random.Generator, antithetic: bool = False) -> npt.NDArray:
+		"""draw the uniform random numbers of a step (choice of the die, face of the die, choice of the lane, 
+		trap triggering and gamble destination) for games that share some of their draws.
+
+		Args:
+			draws (npt.NDArray): the draw index of each unfinished game, the games with the same index share their draws
+			number_of_draws (int): the number of draw indices
+			rng (np.random.Generator): the random generator
+			antithetic (bool): the draw indices 2k and 2k + 1 use antithetic draws (u and 1 - u)
+
+		Returns:
+			npt.NDArray: uniform random numbers in [0, 1) of shape (5, number of games)
+		"""
+		if antithetic:
+			uniforms = np.take(rng.random((5, (number_of_draws + 1) // 2)), draws // 2, axis=1)
+			is_odd = (draws % 2 == 1)
+			# largest float below 1 so that the antithetic draws stay in [0, 1)
+			uniforms[:, is_odd] = np.nextafter(1.0, 0.0) - uniforms[:, is_odd]
+			return uniforms
+
+		return np.take(rng.random((5, number_of_draws)), draws, axis=1)
+
+	def hash_uniforms(self, key: np.uint64, step: int, draws: npt.NDArray, antithetic: bool = False) -> npt.NDArray:
+		"""draw the uniform random numbers of a step from a counter-based stream: the numbers of a game only depend on
+		the key of the stream, the step and the draw index of the game (SplitMix64 of their position in the stream),
+		so only the unfinished games draw their numbers and a game gets the same numbers whatever the other games.
+
+		Args:
+			key (np.uint64): the key of the stream
+			step (int): the step of the games
+			draws (npt.NDArray): the draw index of each unfinished game (less than 2^32), the games with the same index share their draws
+			antithetic (bool): the draw indices 2k and 2k + 1 use antithetic draws (u and 1 - u)
+
+		Returns:
+			npt.NDArray: uniform random numbers in [0, 1) of shape (5, number of games)
+		"""
+		number_of_uniforms = 5
+		keys = (draws // 2 if antithetic else draws).astype(np.uint64)
+
+		# position in the stream: the numbers of a step, then the draw index
+		positions = (np.uint64(step * number_of_uniforms) + np.arange(number_of_uniforms, dtype=np.uint64))[:, None]
+		z = key + ((positions << np.uint64(32)) | keys) * np.uint64(0x9E3779B97F4A7C15)
+		z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+		z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+		z = z ^ (z >> np.uint64(31))
+		# the 53 highest bits give a float in [0, 1)
+		uniforms = (z >> np.uint64(11)).astype(float) * 2.0 ** -53
+
+		if antithetic:
+			is_odd = (draws % 2 == 1)
+			uniforms[:, is_odd] = np.nextafter(1.0, 0.0) - uniforms[:, is_odd]
+		return uniforms
+
+	def compact_draws(self, draws: npt.NDArray, antithetic: bool = False) -> tuple[npt.NDArray, int]:
+		"""renumber the draw indices of the unfinished games from 0 (keeping the pairs of antithetic draws)
+		so that each step only draws the numbers of the unfinished games.
+
+		Returns:
+			tuple[npt.NDArray, int]: the new draw index of each game and the number of draw indices
+		"""
+		keys = draws // 2 if antithetic else draws
+		is_used = np.zeros(int(np.max(keys)) + 1, dtype=bool)
+		is_used[keys] = True
+		positions = np.cumsum(is_used) - 1
+		number_of_keys = int(positions[-1]) + 1
+
+		if antithetic:
+			return 2 * positions[keys] + draws % 2, 2 * number_of_keys
+		return positions[keys], number_of_keys
+
+	def step_games(self, cells: npt.NDArray, dice: npt.NDArray, uniforms: npt.NDArray, counters: dict | None = None) -> tuple[npt.NDArray, npt.NDArray]:
+		"""make one move in each game (vectorized version of the rules of the game).
+
+		Args:
+			cells (npt.NDArray): the current cell of each game
+			dice (npt.NDArray): the die thrown in each game
+			uniforms (npt.NDArray): uniform random numbers in [0, 1) of shape (5, number of games)
+			counters (dict | None): the counters of the instrumentation, the triggered traps are counted if given
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray]: the next cell and the cost of the move of each game
+		"""
+		# launch the die
+		if self.face_cumulative_distributions is None:
+			faces = (uniforms[1] * self.number_of_faces[dice]).astype(int)
+		else:
+			# weighted faces: the cumulative distributions of the dice are flattened and shifted by the index of the die
+			faces = np.searchsorted(self.face_cumulative_distributions, dice + uniforms[1], side="right") - dice * self.faces.shape[1]
+			faces = np.minimum(faces, self.number_of_faces[dice] - 1)
+		moves = self.faces[dice, faces]
+
+		# make the move (go to the fast lane with probability 1/2 on the switching cell)
+		go_fast_lane = (uniforms[2] < 0.5).astype(int)
+		destination_cells = self.destination_cells[cells, moves, go_fast_lane]
+
+		# check if we trigger a trap
+		trap_types = self.trap_types[destination_cells]
+		is_triggered = uniforms[3] < self.trap_triggering_matrix[dice, trap_types]
+
+		next_cells = destination_cells.copy()
+		# teleport back to 1st square (restart)
+		next_cells[is_triggered & (trap_types == TrapType.RESTART.value)] = STARTING_CELL
+		# teleport 3 steps backward (penalty)
+		is_penalty = is_triggered & (trap_types == TrapType.PENALTY.value)
+		next_cells[is_penalty] = self.penalty_cells[destination_cells[is_penalty]]
+		# randomly teleport anywhere on the board (gamble)
+		is_gamble = is_triggered & (trap_types == TrapType.GAMBLE.value)
+		next_cells[is_gamble] = (uniforms[4][is_gamble] * self.layout_size).astype(int)
+
+		# cost for each move is 1 plus an extra cost of 1 if we are in jail
+		costs = 1.0 + (is_triggered & (trap_types == TrapType.PRISON.value))
+
+		if counters is not None:
+			counters["traps_triggered"] += np.bincount(trap_types[is_triggered], minlength=len(TrapType))
+
+		return next_cells, costs
+
+	def step_games_from_model(self, cells: npt.NDArray, dice: npt.NDArray, uniforms: npt.NDArray, counters: dict | None = None) -> tuple[npt.NDArray, npt.NDArray]:
+		"""make one move in each game by sampling the compiled transition tables of the MDP (see compile_model).
+
+		Args:
+			cells (npt.NDArray): the current cell of each game
+			dice (npt.NDArray): the die thrown in each game
+			uniforms (npt.NDArray): uniform random numbers in [0, 1) of shape (at least 2, number of games)
+			counters (dict | None): the counters of the instrumentation (the traps can not be told apart in the compiled tables)
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray]: the next cell and the cost of the move of each game
+		"""
+		# row (die, cell) of the table: its outcomes are stored in [row, row + 1) of the flattened cdf
+		rows = dice * self.layout_size + cells
+		number_of_outcomes = 2 * self.layout_size
+		outcomes = np.searchsorted(self.model_cumulative_distributions, rows + uniforms[1], side="right") - rows * number_of_outcomes
+		outcomes = np.clip(outcomes, 0, number_of_outcomes - 1)
+
+		# an outcome is a next cell and a cost of 1 (first half) or 2 (second half, extra turn in prison)
+		return outcomes % self.layout_size, 1.0 + outcomes // self.layout_size
+
+	def compile_model(self, model: MarkovDecisionProcess) -> None:
+		"""precompute the cumulative distribution of the outcomes of each (die, cell) from the tables of the MDP.
+		the cumulative distributions of all the rows are flattened and shifted by the index of their row 
+		so that each step only needs a single searchsorted.
+
+		Args:
+			model (MarkovDecisionProcess): a MDP whose adjacent matrices have been computed
+		"""
+		extra_turn_matrices = model.extra_turn_matrices
+		# outcomes: move to s' with a cost of 1, or with a cost of 2
+		outcomes = np.concatenate([np.maximum(model.transition_matrices - extra_turn_matrices, 0.0), extra_turn_matrices], axis=-1)
+		cumulative_distributions = np.cumsum(outcomes, axis=-1)
+		cumulative_distributions /= cumulative_distributions[..., -1:]
+
+		rows = np.arange(len(self.dice) * self.layout_size).reshape(len(self.dice), self.layout_size, 1)
+		self.model_cumulative_distributions = (cumulative_distributions + rows).ravel()
+
+	def step_games_from_sparse_model(self, cells: npt.NDArray, dice: npt.NDArray, uniforms: npt.NDArray, counters: dict | None = None) -> tuple[npt.NDArray, npt.NDArray]:
+		"""make one move in each game by sampling the CSR transition matrices of a sparse MDP (see compile_sparse_model).
+
+		Args:
+			cells (npt.NDArray): the current cell of each game
+			dice (npt.NDArray): the die thrown in each game
+			uniforms (npt.NDArray): uniform random numbers in [0, 1) of shape (5, number of games)
+			counters (dict | None): the counters of the instrumentation (the traps can not be told apart in the compiled tables)
+
+		Returns:
+			tuple[npt.NDArray, npt.NDArray]: the next cell and the cost of the move of each game
+		"""
+		# row (die, cell) of the table: its outcomes are the entries [indptr[row], indptr[row + 1]) of the flattened cdf
+		rows = dice * self.layout_size + cells
+		entries = np.searchsorted(self.model_cumulative_distributions, rows + uniforms[1], side="right")
+		entries = np.clip(entries, self.model_indptr[rows], self.model_indptr[rows + 1] - 1)
+		outcomes = self.model_outcomes[entries]
+
+		# an outcome is a next cell (first S outcomes) or a jump (next outcomes), with a cost of 1 or 2 (extra turn in prison)
+		number_of_outcomes = self.layout_size + self.number_of_jump_types
+		is_extra_turn = outcomes >= number_of_outcomes
+		outcomes = outcomes % number_of_outcomes
+
+		next_cells = outcomes.copy()
+		is_jump = outcomes >= self.layout_size
+		jump_types = outcomes[is_jump] - self.layout_size
+		jump_cells = np.searchsorted(self.model_jump_distributions, jump_types + uniforms[4][is_jump], side="right") - jump_types * self.layout_size
+		next_cells[is_jump] = np.clip(jump_cells, 0, self.layout_size - 1)
+
+		return next_cells, 1.0 + is_extra_turn
+
+	def compile_sparse_model(self, model: MarkovDecisionProcess) -> None:
+		"""precompute the cumulative distribution of the outcomes of each (die, cell) from the CSR matrices of a sparse MDP.
+		like compile_model, the cumulative distributions of all the rows are flattened and shifted by the index of their row,
+		but only the outcomes with a non zero probability are stored.
+
+		Args:
+			model (MarkovDecisionProcess): a sparse MDP whose adjacent matrices have been computed
+		"""
+		# scipy is only needed by the sparse models
+		import scipy.sparse as sparse
+
+		self.number_of_jump_types = len(model.jump_types)
+		jump_matrices = model.jump_matrices.reshape(-1, self.number_of_jump_types)
+		extra_turn_jump_matrices = model.extra_turn_jump_matrices.reshape(-1, self.number_of_jump_types)
+
+		# outcomes of each row (die, cell): move to s' or jump, with a cost of 1 (first half) or 2 (second half)
+		tables = sparse.hstack([
+			model.stacked_transition_matrices - model.stacked_extra_turn_matrices,
+			jump_matrices - extra_turn_jump_matrices,
+			model.stacked_extra_turn_matrices,
+			extra_turn_jump_matrices
+		], format="csr")
+		tables.eliminate_zeros()
+		tables.data = np.maximum(tables.data, 0.0)
+
+		# cumulative distribution of each row, normalized and shifted by its row index
+		rows = np.repeat(np.arange(tables.shape[0]), np.diff(tables.indptr))
+		cumulative_distributions = np.cumsum(tables.data)
+		row_offsets = np.concatenate([[0.0], cumulative_distributions])[tables.indptr]
+		cumulative_distributions = (cumulative_distributions - row_offsets[rows]) / (row_offsets[rows + 1] - row_offsets[rows])
+
+		self.model_cumulative_distributions = cumulative_distributions + rows
+		self.model_indptr = tables.indptr
+		self.model_outcomes = tables.indices
+
+		jump_distributions = np.cumsum(model.jump_distributions, axis=-1)
+		jump_distributions /= jump_distributions[:, -1:]
+		self.model_jump_distributions = (jump_distributions + np.arange(self.number_of_jump_types)[:, None]).ravel()
+
+	def compile_rules(self) -> None:
+		"""precompute the rules of the game as lookup tables so that the games can be played with numpy arrays."""
+		if hasattr(self, "destination_cells"):
+			return
+
+		self.trap_types = np.asarray(self.layout, dtype=int)
+
+		max_number_of_faces = max([len(die.moves) for die in self.dice])
+		max_move = max([max(die.moves) for die in self.dice])
+
+		# faces of each die (padded with 0, only the first number_of_faces[die] faces can be drawn)
+		self.number_of_faces = np.array([len(die.moves) for die in self.dice])
+		self.faces = np.zeros((len(self.dice), max_number_of_faces), dtype=int)
+		for (idx, die) in enumerate(self.dice):
+			self.faces[idx, :len(die.moves)] = die.moves
+
+		# weighted faces are drawn from their cumulative distributions (see step_games), the others uniformly
+		self.face_cumulative_distributions = None
+		if any(die.weights is not None for die in self.dice):
+			face_probabilities = np.zeros((len(self.dice), max_number_of_faces))
+			for (idx, die) in enumerate(self.dice):
+				face_probabilities[idx, :len(die.moves)] = die.face_probabilities
+			cumulative_distributions = np.cumsum(face_probabilities, axis=1)
+			cumulative_distributions /= cumulative_distributions[:, -1:]
+			self.face_cumulative_distributions = (cumulative_distributions + np.arange(len(self.dice))[:, None]).ravel()
+
+		# trap_triggering_matrix[die, trap type] (0 for no trap and for the security die)
+		self.trap_triggering_matrix = get_trap_triggering_matrix(dice=self.dice)
+
+		# destination_cells[cell, move, go_fast_lane]
+		self.destination_cells = np.zeros((self.layout_size, max_move + 1, 2), dtype=int)
+		for cell in range(0, self.layout_size):
+			for move in range(0, max_move + 1):
+				for go_fast_lane in [False, True]:
+					self.destination_cells[cell, move, int(go_fast_lane)] = self.get_destination_cell(initial_cell=cell, amount=move, go_fast_lane=go_fast_lane)
+
+		self.penalty_cells = np.array([self.teleport_3_step_backward(destination_cell=cell) for cell in range(0, self.layout_size)])
+
+	def get_destination_cell(self, initial_cell: int, amount: int, go_fast_lane: bool | None = None) -> int:
 		"""compute the next cell the agent will move to. 
 
 		Args:
 			initial_cell (int): correspond to the array index(which is "cell number - 1") of the agent position and therefore a number in [0..14].
-			amount (int): amount by which the agent will move, that is, a number in [0...3] depending on the dice type (security, normal or risky).
+			amount (int): amount by which the agent will move, that is, a face of the die thrown.
+			go_fast_lane (bool | None): the lane taken from the switching cell (drawn randomly if not given).
 
 		Returns:
 			int: the next cell the agent will move to.
@@ -111,26 +782,25 @@ class Simulation(BoardGame):
 
 		# we arrived on switching cell, possibility to switch to a slow lane or a fast lane
 		if initial_cell == 2:
-			go_fast_lane = np.random.choice([True, False])
+			if go_fast_lane is None:
+				go_fast_lane = np.random.choice([True, False])
 			if (go_fast_lane):
-				return FAST_LANE_FIRST_CELL + (amount - 1)
+				return self.move_toward_final_cell(destination_cell=FAST_LANE_FIRST_CELL + (amount - 1))
 			else:
-				return SLOW_LANE_FIRST_CELL + (amount - 1)
+				return self.move_toward_final_cell(destination_cell=self.manage_slow_lane_special_cases(initial_cell=initial_cell, amount=amount))
 		
-		elif initial_cell in [7, 8, 9]:
+		# a large move goes past the slow lane whatever the cell it starts from (passing by the switching cell leads to the slow lane)
+		elif initial_cell <= SLOW_LANE_LAST_CELL:
 			destination_cell = self.manage_slow_lane_special_cases(initial_cell=initial_cell, amount=amount)
 			return self.move_toward_final_cell(destination_cell=destination_cell)
 		
-		elif initial_cell in [11, 12, 13]:
+		elif initial_cell < self.final_cell:
 			destination_cell = initial_cell + amount
 			return self.move_toward_final_cell(destination_cell=destination_cell)
 
 		# already on final cell, do not move agent
-		elif initial_cell == self.final_cell:
-			return initial_cell
-		
 		else:
-			return initial_cell + amount
+			return initial_cell
 
 	def manage_slow_lane_special_cases(self, initial_cell: int, amount: int) -> int:
 		if initial_cell + amount > SLOW_LANE_LAST_CELL:
@@ -176,7 +846,7 @@ class Simulation(BoardGame):
 			return (destination_cell, False)
 		else:
 			# fall onto a trap
-			if die.is_triggering_trap():
+			if die.is_triggering_trap(trap_type=destination_trap_type):
 				return self.trigger_trap(destination_cell=destination_cell, trap_type=destination_trap_type)
 			else:
 				return (destination_cell, False)
@@ -207,4 +877,31 @@ class Simulation(BoardGame):
 		if destination_cell >= 10 and destination_cell <= 12:
 			return destination_cell - 7 - 3
 		else:
-			return max(0, destination_cell - 3)
\ No newline at end of file
+			return max(0, destination_cell - 3)
+
+def play_shard(simulation: Simulation, policy: npt.NDArray, starting_cell: int, number_of_games: int, seed_sequence: np.random.SeedSequence, model: MarkovDecisionProcess | None = None, variance_reduction: tuple = (False, False, None)) -> npt.NDArray:
+	"""play a shard of games starting from the same cell with its own random generator (run by the workers of the process pool).
+
+	Returns:
+		npt.NDArray: the sums of Y, X, X * Y and X^2 over the games of the shard (Y: cost of a game, X: its control)
+	"""
+	antithetic, common_random_numbers, control_values = variance_reduction
+
+	if INSTRUMENTATION.enabled:
+		shard_start = time.perf_counter()
+
+	rng = np.random.default_rng(seed_sequence)
+	starting_cells = np.full(number_of_games, starting_cell)
+	costs, controls = simulation.play_games_costs(
+		starting_cells=starting_cells,
+		policy=policy,
+		rng=rng,
+		model=model,
+		antithetic=antithetic,
+		common_random_numbers=common_random_numbers,
+		control_values=control_values
+	)
+
+	if INSTRUMENTATION.enabled:
+		INSTRUMENTATION.emit("simulate_shard", cell=starting_cell, games=number_of_games, duration=time.perf_counter() - shard_start)
+	return simulation.summarize_games(starting_cells=starting_cells, costs=costs, controls=controls)[:, starting_cell]
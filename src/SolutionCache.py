@@ -0,0 +1,140 @@
+import os
+import hashlib
+import numpy as np
+import numpy.typing as npt
+
+from collections import OrderedDict
+
+from .Die import Die
+
+class SolutionCache:
+	def __init__(self, maxsize: int = 1024, directory: str | None = None, max_disk_entries: int = 100000) -> None:
+		"""memoize the solutions (Expec and Dice) of the MDP.
+
+		Args:
+			maxsize (int): maximum number of solutions kept in memory (least recently used ones are evicted first)
+			directory (str | None): directory where the solutions are also stored as .npz files (no disk store if not given)
+			max_disk_entries (int): maximum number of files in the directory (least recently used ones are deleted first)
+		"""
+		if max_disk_entries < 1:
+			print(f"the disk store must keep at least one solution, got max_disk_entries={max_disk_entries}")
+			raise ValueError()
+
+		self.maxsize = maxsize
+		self.directory = directory
+		self.max_disk_entries = max_disk_entries
+		self.entries = OrderedDict()
+		# number of files in the directory (counted by the first write), the directory is only scanned again when it is full
+		self.disk_entries = None
+
+		if self.directory is not None:
+			os.makedirs(self.directory, exist_ok=True)
+
+	def get_key(self, layout: npt.NDArray, circle: bool, dice: list[Die], method: str) -> str:
+		"""compute the key of a solution: a hash of the layout, the circle flag, the dice and the solver.
+
+		Returns:
+			str: the key of the solution
+		"""
+		digest = hashlib.sha256()
+		digest.update(np.ascontiguousarray(layout, dtype=np.int64).tobytes())
+		digest.update(b"circle" if circle else b"no-circle")
+		digest.update(get_dice_fingerprint(dice=dice).encode())
+		digest.update(method.encode())
+		return digest.hexdigest()
+
+	def get(self, key: str) -> list[npt.NDArray] | None:
+		"""look for a solution in memory, then on disk.
+
+		Args:
+			key (str): the key of the solution
+
+		Returns:
+			list[npt.NDArray] | None: Expec and Dice, or None if the solution is not cached
+		"""
+		if key in self.entries:
+			self.entries.move_to_end(key)
+			return [array.copy() for array in self.entries[key]]
+
+		if self.directory is None:
+			return None
+
+		path = self.get_path(key=key)
+		try:
+			with np.load(path) as data:
+				result = [data["Expec"], data["Dice"]]
+		except (OSError, KeyError, ValueError):
+			return None
+
+		# mark the file as recently used
+		os.utime(path)
+		self.store_in_memory(key=key, result=result)
+		return [array.copy() for array in result]
+
+	def put(self, key: str, result: list[npt.NDArray]) -> None:
+		"""store a solution in memory (and on disk).
+
+		Args:
+			key (str): the key of the solution
+			result (list[npt.NDArray]): Expec and Dice
+		"""
+		result = [np.array(array) for array in result]
+		self.store_in_memory(key=key, result=result)
+
+		if self.directory is not None:
+			path = self.get_path(key=key)
+			# write to a temporary file first so that a concurrent reader never sees a partial file
+			temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+			is_new = not os.path.exists(path)
+			np.savez(temporary_path, Expec=result[0], Dice=result[1])
+			os.replace(temporary_path, path)
+
+			if self.disk_entries is None:
+				self.evict_from_disk(kept_key=key)
+			elif is_new:
+				self.disk_entries += 1
+				if self.disk_entries > self.max_disk_entries:
+					self.evict_from_disk(kept_key=key)
+
+	def store_in_memory(self, key: str, result: list[npt.NDArray]) -> None:
+		self.entries[key] = result
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.maxsize:
+			self.entries.popitem(last=False)
+
+	def evict_from_disk(self, kept_key: str | None = None) -> None:
+		"""count the files of the directory and delete the least recently used ones once it holds too many solutions
+		(down to 90% of the limit, so that the directory is not scanned again by the next writes).
+
+		Args:
+			kept_key (str | None): the key of a solution that is never deleted (the one that was just written)
+		"""
+		files = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".npz") and ".tmp" not in entry.name]
+		self.disk_entries = len(files)
+		if len(files) <= self.max_disk_entries:
+			return
+
+		target_entries = max(1, self.max_disk_entries * 9 // 10)
+		kept_name = None if kept_key is None else os.path.basename(self.get_path(key=kept_key))
+		files = [entry for entry in files if entry.name != kept_name]
+
+		files.sort(key=lambda entry: entry.stat().st_mtime)
+		for entry in files[:self.disk_entries - target_entries]:
+			try:
+				os.remove(entry.path)
+			except FileNotFoundError:
+				pass
+		self.disk_entries = target_entries
+
+	def get_path(self, key: str) -> str:
+		return os.path.join(self.directory, f"{key}.npz")
+
+	def clear(self) -> None:
+		self.entries.clear()
+
+def get_dice_fingerprint(dice: list[Die]) -> str:
+	"""describe the dice (type, moves, probability of each face and of triggering each type of trap) as a string."""
+	return ";".join([
+		f"{die.type}:{','.join(map(str, die.moves))}:{','.join(map(repr, die.face_probabilities.tolist()))}:{','.join(map(repr, die.get_trap_triggering_probabilities().tolist()))}"
+		for die in dice
+	])
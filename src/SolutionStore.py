@@ -0,0 +1,223 @@
+import os
+import hashlib
+import numpy as np
+import numpy.typing as npt
+
+from typing import Iterator
+
+from .Die import Die
+from .SolutionCache import get_dice_fingerprint
+
+from utils.common import TrapType
+
+LAYOUT_SIZE = 15
+# the first and the final cells never have a trap: only the 13 other cells are encoded, 3 bits each
+TRAP_BITS = 3
+CIRCLE_BIT = TRAP_BITS * (LAYOUT_SIZE - 2)
+
+MAGIC = b"SNLSTORE"
+VERSION = 1
+HEADER_DTYPE = np.dtype([
+	("magic", "S8"),
+	("version", "<u4"),
+	("layout_size", "<u4"),
+	("count", "<u8"),
+	("dice", "u1", (16,)),
+	("padding", "V24")
+])
+# rows copied at once when the records are sorted
+COPY_CHUNK_SIZE = 1 << 16
+
+class SolutionStore:
+	def __init__(self, path: str) -> None:
+		"""read a store of solutions written by write_solution_store without loading it:
+		the sorted keys, the costs and the dice are memory mapped and a lookup is a binary search on the keys.
+
+		the file is a header followed by 3 fixed-width sections of N rows:
+		the keys (uint64, sorted), the costs (float32, 14 per layout) and the dice (int8, 14 per layout).
+
+		Args:
+			path (str): the path of the store
+		"""
+		self.path = path
+		header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+		if len(header) == 0 or header["magic"][0] != MAGIC or header["version"][0] != VERSION or header["layout_size"][0] != LAYOUT_SIZE:
+			print(f"{path} is not a store of solutions (version {VERSION})")
+			raise ValueError()
+
+		self.count = int(header["count"][0])
+		self.dice_digest = header["dice"][0].tobytes()
+		number_of_cells = LAYOUT_SIZE - 1
+
+		offsets = HEADER_DTYPE.itemsize + np.cumsum([0, 8 * self.count, 4 * number_of_cells * self.count])
+		if os.path.getsize(path) < offsets[-1] + number_of_cells * self.count:
+			print(f"{path} is truncated")
+			raise ValueError()
+
+		if self.count == 0:
+			# an empty section can not be memory mapped
+			self.keys = np.zeros(0, dtype="<u8")
+			self.costs = np.zeros((0, number_of_cells), dtype="<f4")
+			self.dice = np.zeros((0, number_of_cells), dtype=np.int8)
+		else:
+			self.keys = np.memmap(path, dtype="<u8", mode="r", offset=offsets[0], shape=(self.count,))
+			self.costs = np.memmap(path, dtype="<f4", mode="r", offset=offsets[1], shape=(self.count, number_of_cells))
+			self.dice = np.memmap(path, dtype=np.int8, mode="r", offset=offsets[2], shape=(self.count, number_of_cells))
+
+	def __len__(self) -> int:
+		return self.count
+
+	def is_compatible(self, dice: list[Die]) -> bool:
+		"""check that the solutions were computed with these dice."""
+		return self.dice_digest == get_dice_digest(dice=dice)
+
+	def find(self, layouts: npt.NDArray, circles: npt.NDArray | bool = False) -> npt.NDArray:
+		"""find the row of each layout in the store.
+
+		Args:
+			layouts (npt.NDArray): the layouts, shape (B, 15)
+			circles (npt.NDArray | bool): circle flag of each layout (or a single flag for every layout)
+
+		Returns:
+			npt.NDArray: the row of each layout, -1 if the layout is not in the store
+		"""
+		keys = encode_layouts(layouts=layouts, circles=circles)
+		# the keys have the type of the mapped array, so searchsorted does not copy it and only reads log2(N) pages
+		rows = np.searchsorted(self.keys, keys)
+		rows = np.minimum(rows, max(self.count - 1, 0))
+		is_found = (self.keys[rows] == keys) if self.count > 0 else np.zeros(len(keys), dtype=bool)
+		return np.where(is_found, rows, -1)
+
+	def get(self, layout: npt.NDArray, circle: bool = False) -> list[npt.NDArray] | None:
+		"""look for the solution of a layout.
+
+		Args:
+			layout (npt.NDArray): the layout of the game
+			circle (bool): the circle flag of the layout
+
+		Returns:
+			list[npt.NDArray] | None: Expec (float32) and Dice, or None if the layout is not in the store
+		"""
+		row = self.find(layouts=np.asarray(layout)[None, :], circles=circle)[0]
+		if row < 0:
+			return None
+		return [np.array(self.costs[row]), np.array(self.dice[row], dtype=int)]
+
+	def get_best_dice(self, layouts: npt.NDArray, cells: npt.NDArray, circles: npt.NDArray | bool = False) -> npt.NDArray:
+		"""answer "best die for cell s on layout L" for a batch of queries.
+
+		Args:
+			layouts (npt.NDArray): the layouts, shape (B, 15)
+			cells (npt.NDArray): the cell of each query (excluding the final cell)
+			circles (npt.NDArray | bool): circle flag of each layout (or a single flag for every layout)
+
+		Returns:
+			npt.NDArray: the best die of each query, -1 if the layout is not in the store
+		"""
+		rows = self.find(layouts=layouts, circles=circles)
+		cells = np.broadcast_to(np.asarray(cells, dtype=int), rows.shape)
+		best_dice = np.full(len(rows), -1, dtype=int)
+		is_found = rows >= 0
+		best_dice[is_found] = self.dice[rows[is_found], cells[is_found]]
+		return best_dice
+
+def encode_layouts(layouts: npt.NDArray, circles: npt.NDArray | bool = False) -> npt.NDArray:
+	"""encode each layout as a 64 bits key: 3 bits for each of the 13 cells between the first and the final cells, then the circle flag.
+
+	Args:
+		layouts (npt.NDArray): the layouts, shape (B, 15)
+		circles (npt.NDArray | bool): circle flag of each layout (or a single flag for every layout)
+
+	Returns:
+		npt.NDArray: the keys (uint64), shape (B,)
+	"""
+	layouts = np.asarray(layouts, dtype=np.int64)
+	if layouts.ndim != 2 or layouts.shape[1] != LAYOUT_SIZE:
+		print(f"each layout must have {LAYOUT_SIZE} cells")
+		raise ValueError()
+	if np.any(layouts[:, [0, -1]] != TrapType.NONE.value) or np.any((layouts < 0) | (layouts >= len(TrapType))):
+		print("only the layouts without a trap on the first and the final cells can be encoded")
+		raise ValueError()
+
+	shifts = TRAP_BITS * np.arange(LAYOUT_SIZE - 2, dtype=np.uint64)
+	keys = np.bitwise_or.reduce(layouts[:, 1:-1].astype(np.uint64) << shifts, axis=1)
+	circles = np.broadcast_to(np.asarray(circles, dtype=np.uint64), keys.shape)
+	return keys | (circles << np.uint64(CIRCLE_BIT))
+
+def decode_keys(keys: npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+	"""the layouts (B, 15) and the circle flags of some keys (see encode_layouts)."""
+	keys = np.asarray(keys, dtype=np.uint64)
+	shifts = TRAP_BITS * np.arange(LAYOUT_SIZE - 2, dtype=np.uint64)
+	layouts = np.zeros((len(keys), LAYOUT_SIZE), dtype=int)
+	layouts[:, 1:-1] = (keys[:, None] >> shifts) & np.uint64((1 << TRAP_BITS) - 1)
+	circles = ((keys >> np.uint64(CIRCLE_BIT)) & np.uint64(1)).astype(bool)
+	return layouts, circles
+
+def get_dice_digest(dice: list[Die] | None) -> bytes:
+	return bytes(16) if dice is None else hashlib.sha256(get_dice_fingerprint(dice=dice).encode()).digest()[:16]
+
+def write_solution_store(path: str, results: Iterator[tuple[npt.NDArray, npt.NDArray, npt.NDArray, npt.NDArray]], dice: list[Die] | None = None) -> int:
+	"""write solved layouts into a store (see SolutionStore), chunk by chunk.
+	the records are appended to temporary files, then sorted by key once every chunk is written
+	(only the keys are loaded in memory), a layout solved twice is only stored once.
+
+	Args:
+		path (str): the path of the store
+		results (Iterator[tuple[npt.NDArray, npt.NDArray, npt.NDArray, npt.NDArray]]): the layouts, the circle flags, Expec and Dice of each chunk
+		dice (list[Die] | None): the dice of the solutions (checked by SolutionStore.is_compatible)
+
+	Returns:
+		int: the number of layouts in the store
+	"""
+	number_of_cells = LAYOUT_SIZE - 1
+	temporary_path = f"{path}.{os.getpid()}.tmp"
+	temporary_paths = [f"{temporary_path}.{section}" for section in ["keys", "costs", "dice"]]
+
+	try:
+		files = [open(section_path, "wb") for section_path in temporary_paths]
+		try:
+			for (layouts, circles, Expec, Dice) in results:
+				if np.any((np.asarray(Dice) < 0) | (np.asarray(Dice) > np.iinfo(np.int8).max)):
+					print("the dice of the store are int8")
+					raise ValueError()
+				encode_layouts(layouts=layouts, circles=circles).astype("<u8").tofile(files[0])
+				np.asarray(Expec, dtype="<f4").reshape(-1, number_of_cells).tofile(files[1])
+				np.asarray(Dice, dtype=np.int8).reshape(-1, number_of_cells).tofile(files[2])
+		finally:
+			for file in files:
+				file.close()
+
+		keys = np.fromfile(temporary_paths[0], dtype="<u8")
+		# a stable sort keeps the first solution of a layout solved twice
+		order = np.argsort(keys, kind="stable")
+		sorted_keys = keys[order]
+		is_first = np.ones(len(keys), dtype=bool)
+		is_first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+		(order, sorted_keys) = (order[is_first], sorted_keys[is_first])
+
+		header = np.zeros(1, dtype=HEADER_DTYPE)
+		header["magic"] = MAGIC
+		header["version"] = VERSION
+		header["layout_size"] = LAYOUT_SIZE
+		header["count"] = len(sorted_keys)
+		header["dice"] = np.frombuffer(get_dice_digest(dice=dice), dtype=np.uint8)
+
+		with open(temporary_path, "wb") as file:
+			header.tofile(file)
+			sorted_keys.tofile(file)
+			for (section_path, dtype) in [(temporary_paths[1], "<f4"), (temporary_paths[2], np.int8)]:
+				if len(keys) == 0:
+					continue
+				section = np.memmap(section_path, dtype=dtype, mode="r", shape=(len(keys), number_of_cells))
+				for start in range(0, len(order), COPY_CHUNK_SIZE):
+					section[order[start:start + COPY_CHUNK_SIZE]].tofile(file)
+				del section
+
+		# a reader never sees a partial store
+		os.replace(temporary_path, path)
+	finally:
+		for section_path in temporary_paths + [temporary_path]:
+			if os.path.exists(section_path):
+				os.remove(section_path)
+
+	return len(sorted_keys)
@@ -0,0 +1,241 @@
+import numpy as np
+import numpy.typing as npt
+import scipy.sparse as sparse
+
+from scipy.sparse.csgraph import breadth_first_order
+from scipy.sparse.linalg import splu
+
+from .Die import Die, get_move_probabilities, get_trap_triggering_matrix
+from .BoardGraph import BoardGraph
+from .MarkovDecisionProcess import MarkovDecisionProcess
+
+from utils.common import TrapType
+from utils.instrumentation import INSTRUMENTATION
+
+class SparseMarkovDecisionProcess(MarkovDecisionProcess):
+	# the simulator samples the moves of a sparse model from its CSR matrices (see Simulation.compile_sparse_model)
+	is_sparse = True
+
+	def __init__(self, board: BoardGraph, dice: list[Die]) -> None:
+		"""solve a board given as a graph (see BoardGraph) with the scipy.sparse CSR transition matrices of the dice,
+		so that the memory and the cost of a sweep grow with the number of moves instead of S^2.
+		scipy is only needed by this solver.
+
+		Args:
+			board (BoardGraph): the board
+			dice (list[Die]): the dice (i.e. the actions)
+		"""
+		super().__init__(board.traps, dice, board.circle)
+		self.board = board
+
+	def compute_adjacent_matrices(self):
+		"""compile the board into a CSR transition matrix L of shape (A * S, S) (row a * S + s: probability to go 
+		from s to s' with die a), an expected immediate cost matrix C[a, s] and the part X of L that costs an extra turn (prison).
+
+		As in MarkovDecisionProcess, the gamble is not fanned out to every cell: it is a jump of mass J[a, s, j]
+		to the distribution D[j, s'], so that P = L + J @ D. Every die is compiled at once: the moves M of all the dice 
+		are combined from the moves of each amount of cells, then the traps of the destinations are applied to each entry.
+		"""
+		number_of_dice = len(self.dice)
+
+		self.jump_types = [TrapType.GAMBLE.value]
+		self.jump_distributions = np.full((len(self.jump_types), self.layout_size), 1 / self.layout_size)
+		self.jump_matrices = np.zeros((number_of_dice, self.layout_size, len(self.jump_types)))
+		self.extra_turn_jump_matrices = np.zeros((number_of_dice, self.layout_size, len(self.jump_types)))
+
+		with INSTRUMENTATION.timer("compute_adjacent_matrices", circle=bool(self.circle), cells=self.layout_size):
+			move_probabilities = get_move_probabilities(dice=self.dice)
+			# probability to trigger the trap of each cell with each die (the security die never triggers them)
+			triggered = get_trap_triggering_matrix(dice=self.dice)[:, self.layout]
+			trap_destinations = self.board.get_trap_destinations()
+			is_gamble = (self.layout == TrapType.GAMBLE.value)
+			is_prison = (self.layout == TrapType.PRISON.value)
+
+			# M[a * S + s, d] = \sum_m F[a, m] Move[m][s, d]: the moves of each amount of cells do not depend on the dice
+			move_matrix = sparse.csr_matrix((number_of_dice * self.layout_size, self.layout_size))
+			for amount in np.flatnonzero(np.any(move_probabilities > 0, axis=0)):
+				(initial_cells, destination_cells, probabilities) = self.board.get_moves(amount=int(amount))
+				moves = sparse.csr_matrix((probabilities, (initial_cells, destination_cells)), shape=(self.layout_size, self.layout_size))
+				move_matrix = move_matrix + sparse.kron(move_probabilities[:, [amount]], moves, format="csr")
+
+			# apply the trap of the destination of each move: stay on it, or go to its destination when it is triggered
+			moves = move_matrix.tocoo()
+			(rows, destination_cells, probabilities) = (moves.row, moves.col, moves.data)
+			triggered_probabilities = probabilities * triggered[rows // self.layout_size, destination_cells]
+
+			self.stacked_transition_matrices = sparse.csr_matrix(
+				(
+					np.concatenate([probabilities - triggered_probabilities, triggered_probabilities * ~is_gamble[destination_cells]]),
+					(np.concatenate([rows, rows]), np.concatenate([destination_cells, trap_destinations[destination_cells]]))
+				),
+				shape=move_matrix.shape
+			)
+			self.stacked_extra_turn_matrices = sparse.csr_matrix(
+				(triggered_probabilities * is_prison[destination_cells], (rows, destination_cells)),
+				shape=move_matrix.shape
+			)
+
+			jumps = np.bincount(rows, weights=triggered_probabilities * is_gamble[destination_cells], minlength=move_matrix.shape[0])
+			self.jump_matrices[:, :, self.jump_types.index(TrapType.GAMBLE.value)] = jumps.reshape(number_of_dice, self.layout_size)
+			# each move costs 1, plus an extra turn when triggering the prison
+			extra_turns = np.bincount(rows, weights=triggered_probabilities * is_prison[destination_cells], minlength=move_matrix.shape[0])
+			self.cost_matrix = 1 + extra_turns.reshape(number_of_dice, self.layout_size)
+
+	def update_layout(self, changes: dict[int, int]) -> npt.NDArray:
+		"""change the trap of a few cells and compile the board again (every cell is recomputed).
+
+		Args:
+			changes (dict[int, int]): the new trap type of each changed cell
+
+		Returns:
+			npt.NDArray: the cells whose transitions have been recomputed
+		"""
+		self.layout = np.array(self.layout, copy=True)
+		for (cell, trap_type) in changes.items():
+			self.layout[cell] = trap_type
+		self.board.traps = self.layout
+
+		self.compute_adjacent_matrices()
+		return np.arange(self.layout_size)
+
+	def compute_bellman_values(self, prev: npt.NDArray) -> npt.NDArray:
+		"""compute the expected cost of every action in every state given the values of the previous sweep
+		(the cost of a sweep is proportional to the number of moves of the board).
+
+		Args:
+			prev (npt.NDArray): the values V(s') of the previous sweep.
+
+		Returns:
+			npt.NDArray: a matrix Q of shape (number of dice, number of states).
+		"""
+		local_values = (self.stacked_transition_matrices @ prev).reshape(len(self.dice), self.layout_size)
+		return self.cost_matrix + local_values + self.jump_matrices @ (self.jump_distributions @ prev)
+
+	def evaluate_deterministic_policy(self, policy: npt.NDArray) -> npt.NDArray:
+		"""compute the exact expected cost to reach the final cell from each cell when following a given policy.
+
+		Args:
+			policy (npt.NDArray): the index of the die thrown in each cell.
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (V(d) = 0 for the final cell).
+		"""
+		states = np.arange(self.layout_size)
+		return self.solve_sparse_markov_chain(
+			L_pi=self.stacked_transition_matrices[policy * self.layout_size + states],
+			J_pi=self.jump_matrices[policy, states],
+			C_pi=self.cost_matrix[policy, states]
+		)
+
+	def evaluate_policy(self, policy_matrix: npt.NDArray) -> npt.NDArray:
+		"""compute the exact expected cost of a stationary (possibly stochastic) policy
+		by solving the Markov chain it induces, without any simulation.
+
+		Args:
+			policy_matrix (npt.NDArray): the probability to throw each die in each cell, shape (S, A) or (S - 1, A)
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (excluding the final cell)
+		"""
+		policy_matrix = np.asarray(policy_matrix, dtype=float)
+		if len(policy_matrix) == self.layout_size - 1:
+			policy_matrix = np.vstack([policy_matrix, np.eye(len(self.dice))[0]])
+
+		# L_pi = H @ L where H[s, a * S + s] = pi(a|s)
+		(cells, dice) = np.nonzero(policy_matrix)
+		H = sparse.csr_matrix((policy_matrix[cells, dice], (cells, dice * self.layout_size + cells)), shape=(self.layout_size, self.stacked_transition_matrices.shape[0]))
+		L_pi = (H @ self.stacked_transition_matrices).tocsr()
+		J_pi = np.einsum("sa,asj->sj", policy_matrix, self.jump_matrices)
+		C_pi = np.sum(policy_matrix * self.cost_matrix.T, axis=1)
+
+		Expec = self.solve_sparse_markov_chain(L_pi=L_pi, J_pi=J_pi, C_pi=C_pi)
+		return Expec[:-1]
+
+	def solve_sparse_markov_chain(self, L_pi: sparse.csr_matrix, J_pi: npt.NDArray, C_pi: npt.NDArray) -> npt.NDArray:
+		"""solve (I - L_pi - J_pi @ D) V = C_pi on the transient states (every proper cell but the final one).
+		I - L_pi is factorized once (sparse LU) and the jumps are a low rank update (Woodbury identity),
+		so that the dense matrix of the jumps is never built.
+
+		Args:
+			L_pi (sparse.csr_matrix): the transitions of the chain to a single cell, shape (S, S)
+			J_pi (npt.NDArray): the probability of each jump from each cell, shape (S, number of jump types)
+			C_pi (npt.NDArray): the expected immediate cost of each state, shape (S,)
+
+		Returns:
+			npt.NDArray: the expected cost of each cell (V(d) = 0 for the final cell).
+		"""
+		is_proper = self.get_sparse_proper_states(L_pi=L_pi, J_pi=J_pi)
+		transient = np.flatnonzero(is_proper[:-1])
+
+		Expec = np.full(self.layout_size, np.inf)
+		Expec[self.layout_size - 1] = 0.0
+
+		A = (sparse.identity(len(transient), format="csc") - L_pi[transient][:, transient]).tocsc()
+		U = J_pi[transient]
+		W = self.jump_distributions[:, transient]
+
+		# (A - U W)^-1 C = A^-1 C + A^-1 U (I - W A^-1 U)^-1 W A^-1 C
+		solutions = splu(A).solve(np.column_stack([C_pi[transient], U]))
+		(A_inv_C, A_inv_U) = (solutions[:, 0], solutions[:, 1:])
+		correction = np.linalg.solve(np.eye(U.shape[1]) - W @ A_inv_U, W @ A_inv_C)
+		Expec[transient] = A_inv_C + A_inv_U @ correction
+		return Expec
+
+	def get_sparse_proper_states(self, L_pi: sparse.csr_matrix, J_pi: npt.NDArray) -> npt.NDArray:
+		"""find the cells from which the final cell is reached with probability 1 in a Markov chain.
+		the graph of the chain has one extra node per jump type (so that a jump is not fanned out to every cell)
+		and the searches are breadth first searches from an extra source node.
+
+		Args:
+			L_pi (sparse.csr_matrix): the transitions of the chain to a single cell, shape (S, S)
+			J_pi (npt.NDArray): the probability of each jump from each cell, shape (S, number of jump types)
+
+		Returns:
+			npt.NDArray: a boolean mask of the proper cells
+		"""
+		number_of_jumps = J_pi.shape[1]
+		number_of_nodes = self.layout_size + number_of_jumps
+
+		# edges s -> s', s -> jump j and jump j -> s'
+		L_edges = sparse.coo_matrix(L_pi)
+		(jump_sources, jump_types) = np.nonzero(J_pi > 0)
+		(distribution_types, distribution_cells) = np.nonzero(self.jump_distributions > 0)
+		sources = np.concatenate([L_edges.row[L_edges.data > 0], jump_sources, self.layout_size + distribution_types])
+		destinations = np.concatenate([L_edges.col[L_edges.data > 0], self.layout_size + jump_types, distribution_cells])
+
+		def can_reach(is_target: npt.NDArray) -> npt.NDArray:
+			# search the reversed graph from an extra node linked to every target
+			reversed_edges = sparse.csr_matrix(
+				(
+					np.ones(len(sources) + np.count_nonzero(is_target), dtype=bool),
+					(
+						np.concatenate([destinations, np.full(np.count_nonzero(is_target), number_of_nodes)]),
+						np.concatenate([sources, np.flatnonzero(is_target)])
+					)
+				),
+				shape=(number_of_nodes + 1, number_of_nodes + 1)
+			)
+			is_reached = np.zeros(number_of_nodes + 1, dtype=bool)
+			is_reached[breadth_first_order(reversed_edges, number_of_nodes, directed=True, return_predecessors=False)] = True
+			return is_reached[:number_of_nodes]
+
+		# cells from which the final cell can be reached
+		is_final = np.zeros(number_of_nodes, dtype=bool)
+		is_final[self.layout_size - 1] = True
+		reaches_goal = can_reach(is_target=is_final)
+
+		# cells that can reach a cell from which the final cell can not be reached
+		is_trapped = can_reach(is_target=~reaches_goal) if not np.all(reaches_goal) else np.zeros(number_of_nodes, dtype=bool)
+		return ~is_trapped[:self.layout_size]
+
+	@property
+	def transition_matrices(self) -> npt.NDArray:
+		"""the dense transition tensor P[a, s, s'] (only meant for small boards)."""
+		local_transition_matrices = self.stacked_transition_matrices.toarray().reshape(len(self.dice), self.layout_size, self.layout_size)
+		return local_transition_matrices + self.jump_matrices @ self.jump_distributions
+
+	@property
+	def extra_turn_matrices(self) -> npt.NDArray:
+		"""the dense part X[a, s, s'] of the transition tensor that costs an extra turn (only meant for small boards)."""
+		local_extra_turn_matrices = self.stacked_extra_turn_matrices.toarray().reshape(len(self.dice), self.layout_size, self.layout_size)
+		return local_extra_turn_matrices + self.extra_turn_jump_matrices @ self.jump_distributions
@@ -0,0 +1,184 @@
+import sys
+import json
+import numpy as np
+import numpy.typing as npt
+
+from typing import Iterator, TextIO
+
+from .common import TrapType
+
+LAYOUT_SIZE = 15
+INPUT_FORMATS = ["npy", "csv", "jsonl"]
+OUTPUT_FORMATS = ["jsonl", "csv", "store"]
+
+def get_format(path: str, input_format: str | None, formats: list[str], default: str) -> str:
+	"""guess the format of a file from its extension (stdin and stdout use the default format)."""
+	if input_format is not None:
+		return input_format
+	extension = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+	return extension if extension in formats else default
+
+def read_layouts(path: str, input_format: str, chunk_size: int, circle: bool = False) -> Iterator[tuple[npt.NDArray, npt.NDArray, list]]:
+	"""read layouts by chunks, without loading the whole file.
+
+	- npy: an array of shape (N, 15)
+	- csv: one layout per line (15 trap types separated by commas), a first line that is not numeric is a header
+	- jsonl: one layout per line, either a list of 15 trap types
+	  or an object {"layout": [...], "circle": bool, "id": ...} (circle and id are optional)
+
+	Args:
+		path (str): the path of the file, "-" for stdin
+		input_format (str): "npy", "csv" or "jsonl"
+		chunk_size (int): number of layouts of each chunk
+		circle (bool): circle flag of the layouts that do not have their own
+
+	Returns:
+		Iterator[tuple[npt.NDArray, npt.NDArray, list]]: the layouts (chunk_size, 15), their circle flags and their ids (None if not given)
+	"""
+	if input_format == "npy":
+		file = sys.stdin.buffer if path == "-" else open(path, "rb")
+		try:
+			yield from read_npy_layouts(file=file, chunk_size=chunk_size, circle=circle)
+		finally:
+			if file is not sys.stdin.buffer:
+				file.close()
+		return
+
+	file = sys.stdin if path == "-" else open(path, "r")
+	try:
+		layouts, circles, ids = [], [], []
+		for (line_number, line) in enumerate(file):
+			line = line.strip()
+			if line == "":
+				continue
+
+			if input_format == "csv":
+				values = line.split(",")
+				if line_number == 0 and not is_number(values[0]):
+					# header
+					continue
+				layouts.append(values)
+				circles.append(circle)
+				ids.append(None)
+			else:
+				record = json.loads(line)
+				if isinstance(record, dict):
+					if not isinstance(record.get("circle", circle), bool):
+						print(f"the circle flag of the line {line_number + 1} must be true or false, got {record['circle']!r}")
+						raise ValueError()
+					layouts.append(record["layout"])
+					circles.append(record.get("circle", circle))
+					ids.append(record.get("id"))
+				else:
+					layouts.append(record)
+					circles.append(circle)
+					ids.append(None)
+
+			if len(layouts) == chunk_size:
+				yield check_layouts(layouts=layouts), np.array(circles, dtype=bool), ids
+				layouts, circles, ids = [], [], []
+
+		if len(layouts) > 0:
+			yield check_layouts(layouts=layouts), np.array(circles, dtype=bool), ids
+	finally:
+		if file is not sys.stdin:
+			file.close()
+
+def read_npy_layouts(file, chunk_size: int, circle: bool = False) -> Iterator[tuple[npt.NDArray, npt.NDArray, list]]:
+	"""read a .npy array of layouts by chunks from a binary stream (the header gives the shape and the type)."""
+	version = np.lib.format.read_magic(file)
+	read_array_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+	shape, fortran_order, dtype = read_array_header(file)
+
+	if len(shape) != 2 or shape[1] != LAYOUT_SIZE or fortran_order:
+		print(f"the array must be a C-ordered array of shape (N, {LAYOUT_SIZE}), got {shape}")
+		raise ValueError()
+
+	row_size = LAYOUT_SIZE * dtype.itemsize
+	for start in range(0, shape[0], chunk_size):
+		number_of_layouts = min(chunk_size, shape[0] - start)
+		buffer = file.read(number_of_layouts * row_size)
+		if len(buffer) < number_of_layouts * row_size:
+			print("the array is truncated")
+			raise ValueError()
+		layouts = np.frombuffer(buffer, dtype=dtype).reshape(number_of_layouts, LAYOUT_SIZE)
+		yield check_layouts(layouts=layouts), np.full(number_of_layouts, circle), [None] * number_of_layouts
+
+def is_number(value: str) -> bool:
+	try:
+		float(value)
+	except ValueError:
+		return False
+	return True
+
+def check_layouts(layouts) -> npt.NDArray:
+	"""convert the layouts to an integer array and check their shape and their trap types
+	(the first and the final cells can not have a trap)."""
+	try:
+		layouts = np.asarray(layouts, dtype=float)
+	except (ValueError, TypeError):
+		print("the layouts must only contain trap types")
+		raise ValueError()
+
+	if layouts.ndim != 2 or layouts.shape[1] != LAYOUT_SIZE:
+		print(f"each layout must have {LAYOUT_SIZE} cells")
+		raise ValueError()
+
+	if np.any(layouts != np.round(layouts)) or np.any((layouts < 0) | (layouts >= len(TrapType))):
+		print(f"the trap types must be integers between 0 and {len(TrapType) - 1}")
+		raise ValueError()
+
+	if np.any(layouts[:, [0, -1]] != TrapType.NONE.value):
+		print("the first and the final cells can not have a trap")
+		raise ValueError()
+
+	return layouts.astype(int)
+
+def write_results(file: TextIO, output_format: str, start: int, layouts: npt.NDArray, circles: npt.NDArray, ids: list, Expec: npt.NDArray, Dice: npt.NDArray, iterations: npt.NDArray) -> None:
+	"""write the solutions of a chunk of layouts (one line per layout).
+
+	Args:
+		file (TextIO): the output stream
+		output_format (str): "jsonl" or "csv"
+		start (int): the index of the first layout of the chunk in the input
+		layouts (npt.NDArray): the layouts of the chunk
+		circles (npt.NDArray): their circle flags
+		ids (list): their ids (None if not given)
+		Expec (npt.NDArray): the expected costs, shape (len(layouts), 14)
+		Dice (npt.NDArray): the optimal dice, shape (len(layouts), 14)
+		iterations (npt.NDArray): the number of iterations of the solver for each layout
+	"""
+	lines = []
+	for idx in range(0, len(layouts)):
+		if output_format == "csv":
+			lines.append(",".join(
+				[str(start + idx), str(int(circles[idx]))]
+				+ [str(trap) for trap in layouts[idx]]
+				+ [repr(float(cost)) for cost in Expec[idx]]
+				+ [str(die) for die in Dice[idx]]
+				+ [str(iterations[idx])]
+			))
+		else:
+			record = {
+				"index": start + idx,
+				"layout": layouts[idx].tolist(),
+				"circle": bool(circles[idx]),
+				"Expec": Expec[idx].tolist(),
+				"Dice": Dice[idx].tolist(),
+				"iterations": int(iterations[idx])
+			}
+			if ids[idx] is not None:
+				record["id"] = ids[idx]
+			lines.append(json.dumps(record))
+
+	file.write("\n".join(lines) + "\n")
+	file.flush()
+
+def get_csv_header() -> str:
+	return ",".join(
+		["index", "circle"]
+		+ [f"layout_{cell}" for cell in range(0, LAYOUT_SIZE)]
+		+ [f"expec_{cell}" for cell in range(0, LAYOUT_SIZE - 1)]
+		+ [f"dice_{cell}" for cell in range(0, LAYOUT_SIZE - 1)]
+		+ ["iterations"]
+	)
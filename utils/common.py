@@ -32,4 +32,8 @@ class StrategyType(Enum):
 	NORMAL_RISKY = "normal_and_risky"
 	SECURITY_OPTIMAL = "security_and_optimal"
 	NORMAL_OPTIMAL = "normal_and_optimal"
-	RISKY_OPTIMAL = "risky_and_optimal"
\ No newline at end of file
+	RISKY_OPTIMAL = "risky_and_optimal"
+
+class SolverType(Enum):
+	VALUE_ITERATION = "value_iteration"
+	POLICY_ITERATION = "policy_iteration"
@@ -6,8 +6,21 @@ SLOW_LANE_LAST_CELL = 9
 FAST_LANE_FIRST_CELL = 10
 FAST_LANE_LAST_CELL = 13
 
+# number of cells the penalty trap sends the player back
+PENALTY_STEPS = 3
+
 INITIAL_DELTA = 1.0
 EPSILON = 10e-6
 
 MAX_ITER = 10000
-NUMBER_OF_SIMULATIONS = 10000
\ No newline at end of file
+NUMBER_OF_SIMULATIONS = 10000
+# the games of each cell are split into shards of this size, so that a pool of processes has many shards to balance
+# (the shards do not depend on the number of workers, and neither do the results)
+SIMULATION_SHARD_SIZE = 2048
+BATCH_CHUNK_SIZE = 1024
+
+# the service waits for other layouts to solve them together (in seconds), up to a number of layouts
+SERVICE_BATCH_DELAY = 0.002
+SERVICE_BATCH_SIZE = 256
+# the processes solving the batches of the service have a lower priority than the event loop
+WORKER_NICENESS = 10
@@ -0,0 +1,75 @@
+import json
+
+from src.Die import Die, DieType
+
+from .common import TrapType
+
+def get_die(config: dict) -> Die:
+	"""build a die from its configuration (see load_dice).
+
+	Args:
+		config (dict): the configuration of the die
+
+	Returns:
+		Die: the die
+	"""
+	name = config.get("type", config.get("name"))
+	if name is None or "moves" not in config:
+		print(f"a die needs a type (or a name) and its moves: {config}")
+		raise ValueError()
+
+	moves = [int(move) for move in config["moves"]]
+	if len(moves) == 0 or min(moves) < 0:
+		print(f"the die {name} must have at least one face and non negative moves")
+		raise ValueError()
+
+	trap_triggering_probability = float(config.get("trap_triggering_probability", 0.0))
+	trap_triggering_probabilities = config.get("trap_triggering_probabilities")
+	if trap_triggering_probabilities is not None:
+		if any(trap_type not in TrapType.__members__ for trap_type in trap_triggering_probabilities):
+			print(f"unknown trap type for the die {name}, expected one of {list(TrapType.__members__)}")
+			raise ValueError()
+		trap_triggering_probabilities = {trap_type: float(probability) for (trap_type, probability) in trap_triggering_probabilities.items()}
+
+	for probability in [trap_triggering_probability, *(trap_triggering_probabilities or {}).values()]:
+		if probability < 0 or probability > 1:
+			print(f"the trap triggering probabilities of the die {name} must be between 0 and 1")
+			raise ValueError()
+
+	return Die(
+		type=DieType[name] if name in DieType.__members__ else name,
+		moves=moves,
+		trap_triggering_probability=trap_triggering_probability,
+		weights=config.get("weights"),
+		trap_triggering_probabilities=trap_triggering_probabilities
+	)
+
+def load_dice(path: str) -> list[Die]:
+	"""load the dice of the game from a JSON file, the index of a die in the file is its action:
+
+	{"dice": [
+		{"type": "SECURITY", "moves": [0, 1]},
+		{"name": "loaded", "moves": [0, 1, 2, 3], "weights": [1, 1, 1, 3],
+		 "trap_triggering_probability": 0.5, "trap_triggering_probabilities": {"PRISON": 0.1}}
+	]}
+
+	- type (or name): SECURITY, NORMAL or RISKY (used by the strategies) or any other name, a SECURITY die never triggers the traps
+	- moves: the number of cells of each face
+	- weights: the weight of each face (optional, uniform by default)
+	- trap_triggering_probability: the probability to trigger a trap (optional, 0 by default)
+	- trap_triggering_probabilities: the probability to trigger each type of trap (optional)
+
+	Args:
+		path (str): the path of the JSON file (a list of dice is also accepted)
+
+	Returns:
+		list[Die]: the dice
+	"""
+	with open(path, "r") as file:
+		config = json.load(file)
+
+	dice = config["dice"] if isinstance(config, dict) else config
+	if len(dice) == 0:
+		print(f"there is no die in {path}")
+		raise ValueError()
+	return [get_die(config=die) for die in dice]
@@ -0,0 +1,118 @@
+import json
+import time
+import logging
+
+from contextlib import contextmanager, nullcontext
+
+class Instrumentation:
+	def __init__(self) -> None:
+		"""opt-in instrumentation of the solvers and the simulator: the timings of each phase and some counters
+		are sent as events (dicts) to the sinks. it is disabled as long as there is no sink, and the hot paths
+		only check the enabled flag before computing anything.
+		"""
+		self.sinks = []
+		self.enabled = False
+		# the sinks inherited by a worker process, kept alive so that their buffers are never written by the worker
+		self.detached_sinks = []
+
+	def enable(self, *sinks) -> None:
+		"""add sinks (any callable that takes an event, e.g. LoggerSink, JsonLinesSink or a function)."""
+		self.sinks.extend(sinks)
+		self.enabled = len(self.sinks) > 0
+
+	def disable(self) -> None:
+		"""remove every sink (the JSON lines files are closed)."""
+		for sink in self.sinks:
+			if hasattr(sink, "close"):
+				sink.close()
+		self.sinks = []
+		self.enabled = False
+
+	def detach(self) -> None:
+		"""remove every sink without closing it (e.g. in a worker process that inherited the sinks of the main process).
+		the sinks stay referenced: a file garbage collected in a worker would write the buffer it copied from the main process again.
+		"""
+		self.detached_sinks.extend(self.sinks)
+		self.sinks = []
+		self.enabled = False
+
+	def flush(self) -> None:
+		"""write the buffered events of the sinks (before starting processes that inherit them)."""
+		for sink in self.sinks:
+			if hasattr(sink, "flush"):
+				sink.flush()
+
+	def emit(self, event: str, **fields) -> None:
+		"""send an event to every sink.
+
+		Args:
+			event (str): the name of the event (e.g. "sweep")
+			fields: the content of the event (durations in seconds, counters...)
+		"""
+		record = {"event": event, "time": time.time(), **fields}
+		for sink in self.sinks:
+			sink(record)
+
+	def timer(self, event: str, **fields):
+		"""measure the duration of a block and emit it as an event (does nothing when disabled).
+
+		Example:
+			with INSTRUMENTATION.timer("compute_adjacent_matrices"):
+				...
+		"""
+		if not self.enabled:
+			return nullcontext()
+		return self.measure(event, **fields)
+
+	@contextmanager
+	def measure(self, event: str, **fields):
+		start = time.perf_counter()
+		yield
+		self.emit(event, duration=time.perf_counter() - start, **fields)
+
+class LoggerSink:
+	def __init__(self, logger: logging.Logger | None = None, level: int = logging.INFO) -> None:
+		"""write the events with a logger."""
+		self.logger = logger if logger is not None else logging.getLogger("snake_ladder")
+		self.level = level
+
+	def __call__(self, record: dict) -> None:
+		self.logger.log(self.level, "%s %s", record["event"], json.dumps({key: value for (key, value) in record.items() if key != "event"}))
+
+class JsonLinesSink:
+	def __init__(self, path: str) -> None:
+		"""append the events to a file, one JSON object per line."""
+		self.file = open(path, "a")
+
+	def __call__(self, record: dict) -> None:
+		self.file.write(json.dumps(record) + "\n")
+
+	def flush(self) -> None:
+		self.file.flush()
+
+	def close(self) -> None:
+		self.file.close()
+
+class CallbackSink:
+	def __init__(self, callback, events: list[str] | None = None) -> None:
+		"""call a function with each event (or only with some events).
+
+		Args:
+			callback (Callable): the function, called with the event as a dict
+			events (list[str] | None): the names of the events forwarded to the callback (all of them if not given)
+		"""
+		self.callback = callback
+		self.events = events
+
+	def __call__(self, record: dict) -> None:
+		if self.events is None or record["event"] in self.events:
+			self.callback(record)
+
+# instrumentation shared by the solvers and the simulator (disabled by default)
+INSTRUMENTATION = Instrumentation()
+
+def detach_worker() -> None:
+	"""initializer of the worker processes: the sinks of the main process are never written by a worker.
+	a module function is pickled by reference (the bound method INSTRUMENTATION.detach would pickle the sinks and their files).
+	"""
+	INSTRUMENTATION.detach()
@@ -1,29 +1,72 @@
-import numpy as np 
+import numpy as np
 
 from .common import TrapType
 
-def generate_layout():
+# name of each layout -> function building it (the layouts are only built when they are used)
+LAYOUTS = {}
+
+def register_layout(name: str):
+	"""register a function building a layout under a name (see get_layout).
+
+	Example:
+		@register_layout("NO_TRAPS")
+		def layout_no_traps(rng=None):
+			...
+	"""
+	def decorator(function):
+		LAYOUTS[name] = function
+		return function
+	return decorator
+
+def get_layout_names() -> list[str]:
+	return list(LAYOUTS.keys())
+
+def get_layout(name: str, rng: np.random.Generator | None = None) -> np.ndarray:
+	"""build a registered layout.
+
+	Args:
+		name (str): the name of the layout (e.g. "NO_TRAPS")
+		rng (np.random.Generator | None): random generator of the random layouts (the global numpy state if not given)
+
+	Returns:
+		np.ndarray: the layout, of shape (15,)
+	"""
+	if name not in LAYOUTS:
+		print(f"unknown layout {name}, the layouts are: {get_layout_names()}")
+		raise ValueError()
+	return LAYOUTS[name](rng=rng)
+
+@register_layout("RANDOM")
+def generate_layout(rng: np.random.Generator | None = None):
 	layout = np.zeros((15), dtype=int)
-	for i in range(1, 14):
-		# generate a cell of type between 0 and 4
-		# first and last cell are excluded
-		layout[i] = np.random.randint(0, 5)
+	# generate a cell of type between 0 and 4
+	# first and last cell are excluded
+	if rng is None:
+		layout[1:14] = np.random.randint(0, 5, 13)
+	else:
+		layout[1:14] = rng.integers(0, 5, 13)
 	#layout = np.array([0, 1, 1, 4, 2, 1, 0, 1, 0, 1, 0, 1, 0, 4, 0])
 	return layout
 
-def layout_jails_on_fast_lane():
-	layout = generate_layout()
+@register_layout("NO_TRAPS")
+def layout_no_traps(rng: np.random.Generator | None = None):
+	return np.zeros((15), dtype=int)
+
+@register_layout("JAILS_ON_FAST_LANE")
+def layout_jails_on_fast_lane(rng: np.random.Generator | None = None):
+	layout = generate_layout(rng=rng)
 	layout[10:14] = TrapType.PRISON.value
 	#return np.array([0, 1, 4, 0, 3, 0, 2, 0, 0, 0, 3, 3, 3, 3, 0])
 	return layout
 
-
-def layout_gamble_everywhere():
+@register_layout("GAMBLE_EVERYWHERE")
+def layout_gamble_everywhere(rng: np.random.Generator | None = None):
 	layout = np.zeros((15), dtype=int)
 	layout[1:14] = TrapType.GAMBLE.value
 	return layout
 
-def layout_traps_everywhere_except_slow_lane():
+@register_layout("NO_TRAPS_SLOW_LANE")
+def layout_traps_everywhere_except_slow_lane(rng: np.random.Generator | None = None):
 	layout = np.zeros((15), dtype=int)
 	layout[1] = TrapType.PRISON.value
 	layout[2] = TrapType.RESTART.value
@@ -33,10 +76,3 @@ def layout_traps_everywhere_except_slow_lane():
 	layout[12] = TrapType.RESTART.value
 	layout[12] = TrapType.PRISON.value
 	return layout
-
-CUSTOM_LAYOUTS = {
-	"NO_TRAPS": np.zeros((15)),
-	"JAILS_ON_FAST_LANE": layout_jails_on_fast_lane(),
-	"GAMBLE_EVERYWHERE": layout_gamble_everywhere(),
-	"NO_TRAPS_SLOW_LANE": layout_traps_everywhere_except_slow_lane()
-}
\ No newline at end of file